@@ -0,0 +1,4 @@
+"""Benchmark suite of the fico pipeline on synthetic B3-shaped data.
+
+Run with ``python -m benchmarks.run --help``.
+"""
@@ -0,0 +1,356 @@
+"""Time the fico pipeline on synthetic data at several scales.
+
+Every case is run for each (tickers, years) scale: the best wall time of
+``--repeat`` runs is recorded, then one more run under tracemalloc records the
+peak of the memory allocated by Python and NumPy (worker processes of
+load_stock_panel are not traced).
+
+Quick run, printing the scaling curves::
+
+    python -m benchmarks.run
+
+Full grid, storing a baseline and checking a later run against it::
+
+    python -m benchmarks.run --tickers 1 10 100 1000 --years 1 10 30 \
+        --save-baseline benchmarks/baseline.json
+    python -m benchmarks.run --baseline benchmarks/baseline.json --tolerance 0.25
+
+A case regresses when its time exceeds the baseline by more than
+``--tolerance``, or its memory peak by more than ``--memory-tolerance`` (and
+by more than MEMORY_SLACK_MIB, so that tiny peaks do not fail on noise).
+
+"""
+import argparse
+import json
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from benchmarks import synthetic
+from fico.evaluation import batch_signals, generate_signals, trade_evaluation
+from fico.portfolio import (
+    Portifolio,
+    build_factors_frame,
+    choose_stock,
+    load_stock_panel,
+    merge_portifolio,
+    pre_processing,
+    process_stock,
+)
+
+# Share of the dates with a Buy Signal in the synthetic signals:
+BUY_RATE = 0.5
+
+# Memory increases below this are never regressions:
+MEMORY_SLACK_MIB = 1.0
+
+
+class Scale:
+    """Synthetic data set of one (tickers, years) scale, written on first use."""
+
+    def __init__(self, root, n_tickers, years):
+        """Set the directory and the size of the data set."""
+        self.root = Path(root) / f"{n_tickers}x{years}"
+        self.n_tickers = n_tickers
+        self.years = years
+        self.stocks_dir = self.root / "stocks"
+        self.factors_dir = self.root / "risk_factors"
+        self._tickers = None
+        self._factor_files = None
+        self._signals = None
+
+    @property
+    def tickers(self):
+        """Tickers of the stock csv files."""
+        if self._tickers is None:
+            self._tickers = synthetic.write_stock_files(
+                self.stocks_dir,
+                self.n_tickers,
+                self.years,
+            )
+        return self._tickers
+
+    def factor_files(self):
+        """Whether the factor .xls files could be written."""
+        if self._factor_files is None:
+            self._factor_files = synthetic.write_factor_files(
+                self.factors_dir,
+                self.years,
+            )
+        return self._factor_files
+
+    def factors(self):
+        """Factors frame as returned by build_factors_frame."""
+        return pre_processing(synthetic.factors_frame(self.years))
+
+    def merged(self):
+        """Merged frame of every ticker, with a random Buy Signal."""
+        factors = self.factors()
+        rng = np.random.default_rng(0)
+        frames = []
+        for ticker in self.tickers:
+            stock = process_stock(choose_stock(ticker, stocks_dir=self.stocks_dir))
+            frame = merge_portifolio(stock, factors)
+            frame["Buy Signal"] = (rng.random(len(frame)) < BUY_RATE).astype(float)
+            frames.append(frame)
+        return frames
+
+    def signals(self):
+        """generate_signals output of every ticker."""
+        if self._signals is None:
+            self._signals = [generate_signals(frame) for frame in self.merged()]
+        return self._signals
+
+
+def case_choose_stock(scale):
+    """Parse every ticker csv file one by one."""
+    tickers = scale.tickers
+    return lambda: [choose_stock(t, stocks_dir=scale.stocks_dir) for t in tickers]
+
+
+def case_load_stock_panel(scale):
+    """Parse every ticker csv file into a panel on a process pool."""
+    tickers = scale.tickers
+    return lambda: load_stock_panel(tickers, stocks_dir=scale.stocks_dir)
+
+
+def case_build_factors_frame(scale):
+    """Parse the six factor files (cache disabled)."""
+    if not scale.factor_files():
+        return None
+    return lambda: build_factors_frame(scale.factors_dir, use_cache=False)
+
+
+def case_merge_portifolio(scale):
+    """Merge every processed ticker with the factors."""
+    factors = scale.factors()
+    stocks = [
+        process_stock(choose_stock(t, stocks_dir=scale.stocks_dir))
+        for t in scale.tickers
+    ]
+    return lambda: [merge_portifolio(stock, factors) for stock in stocks]
+
+
+def case_generate_signals(scale):
+    """Run generate_signals on every ticker."""
+    frames = scale.merged()
+    return lambda: [generate_signals(frame) for frame in frames]
+
+
+def case_batch_signals(scale):
+    """Run batch_signals on the (date x ticker) panel of every ticker."""
+    frames = scale.merged()
+    close = pd.concat([frame["Close"] for frame in frames], axis=1)
+    buy_signal = pd.concat([frame["Buy Signal"] for frame in frames], axis=1)
+    return lambda: batch_signals(close.to_numpy(), buy_signal.to_numpy())
+
+
+def case_trade_evaluation(scale):
+    """Run trade_evaluation on every ticker."""
+    signals = scale.signals()
+    return lambda: [trade_evaluation(frame) for frame in signals]
+
+
+def case_portifolio_pre_processing(scale):
+    """Clean the monthly fundamentals frame."""
+    raw = synthetic.fundamentals_frame(scale.n_tickers, scale.years)
+    return lambda: Portifolio(raw.copy()).pre_processing()
+
+
+def case_portifolio_build(scale):
+    """Build the momentum, size and value portfolios."""
+    portfolio = Portifolio(synthetic.fundamentals_frame(scale.n_tickers, scale.years))
+    portfolio.pre_processing()
+
+    def run():
+        portfolio.build_momentum_portfolio()
+        portfolio.build_size_portfolio()
+        portfolio.build_value_portfolio()
+
+    return run
+
+
+CASES = {
+    "choose_stock": case_choose_stock,
+    "load_stock_panel": case_load_stock_panel,
+    "build_factors_frame": case_build_factors_frame,
+    "merge_portifolio": case_merge_portifolio,
+    "generate_signals": case_generate_signals,
+    "batch_signals": case_batch_signals,
+    "trade_evaluation": case_trade_evaluation,
+    "Portifolio.pre_processing": case_portifolio_pre_processing,
+    "Portifolio.build": case_portifolio_build,
+}
+
+
+def measure(function, repeat):
+    """Best wall time of ``repeat`` runs and peak traced memory of one run.
+
+    input: callable, int.
+    output: float (seconds), float (MiB).
+    """
+    best = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return best, peak / 2**20
+
+
+def run(cases, ticker_scales, year_scales, repeat, root):
+    """Run every case at every scale.
+
+    input: list of str, list of int, list of float, int, str or Path.
+    output: dataframe with one row per (case, tickers, years).
+    """
+    records = []
+    for n_tickers in ticker_scales:
+        for years in year_scales:
+            scale = Scale(root, n_tickers, years)
+            for name in cases:
+                function = CASES[name](scale)
+                if function is None:
+                    print(f"skipped {name}: openpyxl is not installed", file=sys.stderr)
+                    continue
+                seconds, peak = measure(function, repeat)
+                records.append(
+                    {
+                        "case": name,
+                        "tickers": n_tickers,
+                        "years": years,
+                        "seconds": seconds,
+                        "peak_mib": peak,
+                    },
+                )
+                print(
+                    f"{name:28s} {n_tickers:6d} tickers {years:4g} years "
+                    f"{seconds:10.4f} s {peak:10.1f} MiB",
+                    file=sys.stderr,
+                )
+    return pd.DataFrame(records)
+
+
+def scaling_curves(results, value="seconds"):
+    """Pivot the results into one curve per case and number of years.
+
+    input: dataframe, str(optional).
+    output: dataframe (tickers x (case, years)).
+    """
+    return results.pivot_table(index="tickers", columns=["case", "years"], values=value)
+
+
+def plot_curves(results, path):
+    """Save the time and memory scaling curves as an image (needs matplotlib).
+
+    input: dataframe, str or Path.
+    """
+    import matplotlib as mpl
+
+    mpl.use("Agg")
+    import matplotlib.pyplot as plt
+
+    figure, axes = plt.subplots(1, 2, figsize=(14, 6))
+    for axis, value in zip(axes, ["seconds", "peak_mib"], strict=True):
+        scaling_curves(results, value).plot(ax=axis, marker="o", logx=True, logy=True)
+        axis.set_ylabel(value)
+        axis.legend(fontsize="x-small")
+    figure.tight_layout()
+    figure.savefig(path)
+
+
+def regressions(results, baseline, tolerance, memory_tolerance=None):
+    """Rows slower, or with a higher memory peak, than the baseline.
+
+    Time regresses above ``tolerance`` (relative) and memory above
+    ``memory_tolerance`` (relative, ``tolerance`` by default) plus
+    MEMORY_SLACK_MIB.
+
+    input: dataframe, dataframe, float, float(optional).
+    output: dataframe, with a "regression" column (time, memory or both).
+    """
+    if memory_tolerance is None:
+        memory_tolerance = tolerance
+    keys = ["case", "tickers", "years"]
+    merged = results.merge(baseline, on=keys, suffixes=("", "_baseline"))
+    slower = merged["seconds"] > merged["seconds_baseline"] * (1 + tolerance)
+    heavier = merged["peak_mib"] > np.maximum(
+        merged["peak_mib_baseline"] * (1 + memory_tolerance),
+        merged["peak_mib_baseline"] + MEMORY_SLACK_MIB,
+    )
+    merged["regression"] = np.select(
+        [slower & heavier, slower, heavier],
+        ["both", "time", "memory"],
+        default="",
+    )
+    columns = [*keys, "seconds", "seconds_baseline", "peak_mib", "peak_mib_baseline"]
+    return merged.loc[slower | heavier, [*columns, "regression"]]
+
+
+def main(argv=None):
+    """Command line entry point, returns the exit status."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--cases", nargs="+", choices=list(CASES), default=list(CASES))
+    parser.add_argument("--tickers", nargs="+", type=int, default=[1, 10, 100])
+    parser.add_argument("--years", nargs="+", type=float, default=[1, 10])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--data-dir", help="where the synthetic data is written")
+    parser.add_argument("--output", help="json file for the results")
+    parser.add_argument("--curves", help="csv file for the scaling curves")
+    parser.add_argument("--plot", help="image file for the scaling curves")
+    parser.add_argument("--save-baseline", help="store the results as baseline")
+    parser.add_argument("--baseline", help="fail on regressions against it")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument(
+        "--memory-tolerance",
+        type=float,
+        help="relative memory tolerance (default: --tolerance)",
+    )
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        results = run(
+            args.cases,
+            args.tickers,
+            args.years,
+            args.repeat,
+            args.data_dir or tmp,
+        )
+
+    print(scaling_curves(results).to_string(float_format="{:.4f}".format))
+    if args.curves:
+        scaling_curves(results).to_csv(args.curves)
+    if args.plot:
+        plot_curves(results, args.plot)
+    for path in (args.output, args.save_baseline):
+        if path:
+            Path(path).write_text(
+                json.dumps(results.to_dict(orient="records"), indent=4),
+            )
+    if args.baseline:
+        baseline = pd.DataFrame(json.loads(Path(args.baseline).read_text()))
+        found = regressions(
+            results,
+            baseline,
+            args.tolerance,
+            args.memory_tolerance,
+        )
+        if not found.empty:
+            print("Regressions against the baseline:", file=sys.stderr)
+            print(found.to_string(index=False), file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,207 @@
+"""Generate synthetic inputs with the shapes and column names of the real data.
+
+Functions:
+---------
+
+factors_frame:
+    Daily factor returns with the columns of the factor .xls files.
+
+write_factor_files:
+    Writing the six factor files (and factors.csv) to a directory.
+
+stock_frame:
+    Daily prices of one ticker as written in ../data/stocks/{ticker}.csv.
+
+write_stock_files:
+    Writing one csv file per ticker to a directory.
+
+fundamentals_frame:
+    Monthly fundamentals with the columns of the api_comdinheiro frame.
+
+"""
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from fico.portfolio import FACTOR_FILES, STOCK_NUMERIC_COLUMNS
+
+# Value column of each factor file:
+FACTOR_COLUMNS = {
+    "mkt": "Rm_minus_Rf",
+    "hml": "HML",
+    "iml": "IML",
+    "smb": "SMB",
+    "wml": "WML",
+    "rf": "Risk_free",
+}
+
+# Labels dropped as outliers by Portifolio.pre_processing:
+OUTLIER_LABELS = [1151, 963, 964, 990, 579, 883, 868, 274]
+
+START = "2000-01-03"
+
+# Share of the fundamentals missing (NaN, or "[]" in text columns):
+MISSING_RATE = 0.02
+
+
+def trading_days(years, start=START):
+    """Business days covering the given number of years (252 per year)."""
+    return pd.bdate_range(start, periods=max(1, int(252 * years)))
+
+
+def factors_frame(years, seed=0):
+    """Daily factor returns with the columns of the factor .xls files.
+
+    input: float, int(optional).
+    output: dataframe with year, month, day and one column per factor.
+    """
+    rng = np.random.default_rng(seed)
+    dates = trading_days(years)
+    frame = pd.DataFrame(
+        {"year": dates.year, "month": dates.month, "day": dates.day},
+    )
+    for key, column in FACTOR_COLUMNS.items():
+        scale = 0.0001 if key == "rf" else 0.01
+        frame[column] = rng.normal(0, scale, len(dates))
+    return frame
+
+
+def write_factor_files(directory, years, seed=0):
+    """Write the six factor files (and factors.csv) to a directory.
+
+    The .xls files are written in the xlsx format (pandas detects it from the
+    content), which needs openpyxl; without it only factors.csv is written.
+
+    input: str or Path, float, int(optional).
+    output: bool, True when the factor files were written.
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    frame = factors_frame(years, seed=seed)
+    frame.to_csv(directory / "factors.csv", index=False)
+    try:
+        import openpyxl  # noqa: F401
+    except ImportError:
+        return False
+    for key, file_name in FACTOR_FILES.items():
+        columns = ["year", "month", "day", FACTOR_COLUMNS[key]]
+        frame[columns].to_excel(directory / file_name, index=False, engine="openpyxl")
+    return True
+
+
+def _format(values, rng, nd_rate):
+    """Format numbers with decimal comma and random "nd" markers."""
+    text = np.char.replace(np.char.mod("%.4f", values), ".", ",").astype(object)
+    text[(rng.random(len(values)) < nd_rate) | np.isnan(values)] = "nd"
+    return text
+
+
+def stock_frame(years, seed=0, nd_rate=0.01):
+    """Daily prices of one ticker as written in ../data/stocks/{ticker}.csv.
+
+    input: float, int(optional), float(optional).
+    output: dataframe.
+    """
+    rng = np.random.default_rng(seed)
+    dates = trading_days(years)
+    n_days = len(dates)
+    close = 20 * np.exp(np.cumsum(rng.normal(0, 0.02, n_days)))
+    returns = np.r_[np.nan, np.diff(close) / close[:-1] * 100]
+    values = {
+        "fech_ajustado": close,
+        "variacao(pct)": returns,
+        "fech_historico": close * 1.1,
+        "abertura_ajustado": close * (1 + rng.normal(0, 0.005, n_days)),
+        "min_ajustado": close * 0.99,
+        "medio_ajustado": close,
+        "max_ajustado": close * 1.01,
+        "vol_(mm_r$)": rng.gamma(2, 10, n_days),
+        "negocios": rng.integers(1, 50000, n_days).astype(float),
+        "fator": np.ones(n_days),
+        "quant_em_aluguel": rng.gamma(2, 1e5, n_days),
+        "vol_em_aluguel(mm_r$)": rng.gamma(2, 1, n_days),
+    }
+    frame = pd.DataFrame({"data": dates.strftime("%d/%m/%Y")})
+    for column in STOCK_NUMERIC_COLUMNS:
+        frame[column] = _format(values[column], rng, nd_rate)
+    frame.insert(11, "tipo", "PN")
+    return frame
+
+
+def tickers(n_tickers):
+    """B3-like ticker names."""
+    return [f"T{i:03d}{3 + i % 2}" for i in range(n_tickers)]
+
+
+def write_stock_files(directory, n_tickers, years, seed=0):
+    """Write one csv file per ticker to a directory.
+
+    input: str or Path, int, float, int(optional).
+    output: list of tickers.
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    names = tickers(n_tickers)
+    for i, ticker in enumerate(names):
+        stock_frame(years, seed=seed + i).to_csv(
+            directory / f"{ticker}.csv",
+            index=False,
+        )
+    return names
+
+
+def fundamentals_frame(n_tickers, years, seed=0):
+    """Monthly fundamentals with the columns of the api_comdinheiro frame.
+
+    Numbers in text columns use decimal comma and missing values are "[]".
+    The outlier labels removed by Portifolio.pre_processing are present.
+
+    input: int, float, int(optional).
+    output: dataframe.
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(START, periods=max(1, int(12 * years)), freq="ME")
+    n_rows = len(dates) * n_tickers
+    if n_rows < len(OUTLIER_LABELS):
+        raise ValueError("fundamentals_frame needs at least 8 rows")
+
+    def number(scale=1.0, text=False):
+        values = rng.normal(0, 1, n_rows) * scale
+        if not text:
+            values[rng.random(n_rows) < MISSING_RATE] = np.nan
+            return values
+        values = np.char.replace(np.char.mod("%.4f", values), ".", ",").astype(object)
+        values[rng.random(n_rows) < MISSING_RATE] = "[]"
+        return values
+
+    names = tickers(n_tickers)
+    frame = pd.DataFrame(
+        {
+            "ticker": np.tile(names, len(dates)),
+            "nome_da_empresa": np.tile([f"Empresa {t[:4]}" for t in names], len(dates)),
+            "data_da_analise": np.repeat(dates.strftime("%Y-%m-%d"), n_tickers),
+            "patrimonio_liquido": number(1e9, text=True),
+            "quant_on_pn": np.abs(number(1e8)),
+            "ebit12_meses": number(1e8, text=True),
+            "preco_de_fechamento": np.abs(number(20)),
+            "ativo_total": np.abs(number(1e10)),
+            "fator_cotacao": np.ones(n_rows),
+            "retorno12_meses": number(30, text=True),
+            "retorno6_meses": number(20),
+            "retorno3_meses": number(10),
+            "retorno1_mes": number(5),
+            "lc": np.abs(number()),
+            "volatilidade_anualizada12_meses": np.abs(number(30)),
+            "volatilidade_anualizada6_meses": np.abs(number(30)),
+            "volatilidade_anualizada3_meses": np.abs(number(30)),
+            "volatilidade_anualizada1_mes": np.abs(number(30)),
+            "ev": np.abs(number(1e10)),
+            "valor_de_mercado": np.abs(number(1e10)),
+        },
+    )
+    # Labels start after the outliers, then the first rows take the outlier labels:
+    labels = np.arange(n_rows) + max(OUTLIER_LABELS) + 1
+    labels[: len(OUTLIER_LABELS)] = OUTLIER_LABELS
+    frame.index = labels
+    return frame
@@ -1,4 +1,77 @@
 """Portfolio package.
 
 - Build, preprocess, and evaluate a financial portfolio
+
+Submodules and the main functions are imported lazily, on first access, so
+that ``import fico`` stays cheap for short-lived workers.
 """
+import importlib
+
+# Public name -> submodule defining it:
+_LAZY_ATTRIBUTES = {
+    "build_factors_frame": "portfolio",
+    "choose_stock": "portfolio",
+    "process_stock": "portfolio",
+    "load_stock_panel": "portfolio",
+    "build_stock_store": "portfolio",
+    "update_stock_store": "portfolio",
+    "merge_portifolio": "portfolio",
+    "split_data": "portfolio",
+    "walk_forward_split": "portfolio",
+    "Portifolio": "portfolio",
+    "generate_signals": "evaluation",
+    "batch_signals": "evaluation",
+    "evaluate_returns": "evaluation",
+    "algo_evaluation": "evaluation",
+    "algo_vs_underlying": "evaluation",
+    "trade_evaluation": "evaluation",
+    "backtest_weights": "backtest",
+    "backtest_shares": "backtest",
+    "factor_regression": "regression",
+    "rolling_factor_betas": "regression",
+    "FactorCovariance": "risk",
+    "factor_covariance": "risk",
+    "minimum_variance": "risk",
+    "risk_parity": "risk",
+    "OnlineEvaluator": "online",
+    "PanelStore": "store",
+    "run_sweep": "sweep",
+    "Pipeline": "pipeline",
+    "stock_pipeline": "pipeline",
+}
+
+_SUBMODULES = [
+    "backtest",
+    "bootstrap",
+    "cache",
+    "evaluation",
+    "fama_macbeth",
+    "instrument",
+    "online",
+    "pipeline",
+    "portfolio",
+    "regression",
+    "risk",
+    "store",
+    "sweep",
+]
+
+# Built from the lazy names, which static checkers cannot follow:
+__all__ = sorted([*_LAZY_ATTRIBUTES, *_SUBMODULES])  # noqa: PLE0605
+
+
+def __getattr__(name):
+    """Import the submodule defining ``name`` on first access."""
+    if name in _SUBMODULES:
+        return importlib.import_module(f"{__name__}.{name}")
+    if name in _LAZY_ATTRIBUTES:
+        module = importlib.import_module(f"{__name__}.{_LAZY_ATTRIBUTES[name]}")
+        value = getattr(module, name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    """List the lazily available names."""
+    return __all__
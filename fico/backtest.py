@@ -0,0 +1,360 @@
+"""Provide a multi-asset portfolio backtest over (date x ticker) matrices.
+
+generate_signals follows one ticker with a fixed share count; the functions
+below follow a whole portfolio, from target weights or share counts of every
+ticker, with matrix operations over all the dates and tickers at once.
+
+Functions:
+---------
+
+basket_weights:
+    Equal (or weighted) target weights of the stocks selected at each date,
+    e.g. the momentum basket of Portifolio.build_momentum_portfolio.
+
+backtest_weights:
+    Simulating a portfolio rebalanced to target weights, with costs.
+
+backtest_shares:
+    Simulating a portfolio holding given share counts, with costs.
+
+trade_records:
+    Listing the round trips of every ticker of a backtest.
+
+"""
+import numpy as np
+import pandas as pd
+
+from fico.evaluation import cumprod, pct_change
+from fico.instrument import instrument
+
+# Changes of weight smaller than this are not counted as trades:
+WEIGHT_TOLERANCE = 1e-9
+
+# Per-ticker fields of the backtests, as in batch_signals:
+ASSET_FIELDS = ["Position", "Entry/Exit Position", "Holdings", "Costs"]
+
+TRADE_COLUMNS = [
+    "Ticker",
+    "Entry Date",
+    "Exit Date",
+    "Shares",
+    "Entry Share Price",
+    "Exit Share Price",
+    "Costs",
+    "Profit/Loss",
+]
+
+
+@instrument
+def basket_weights(selection, ticker="ticker", by="date", weight=None):
+    """Target weights of the stocks selected at each date.
+
+    ``selection`` has one row per selected stock and date, like the
+    ``momentum`` frame left by build_momentum_portfolio. Each date is fully
+    invested: the weights are equal, or proportional to the ``weight``
+    column.
+
+    input: dataframe, str(optional), str(optional), str(optional).
+    output: dataframe (dates x tickers), 0 for the stocks not selected.
+    """
+    frame = pd.DataFrame(
+        {
+            by: selection[by].to_numpy(),
+            ticker: selection[ticker].to_numpy(),
+            "weight": (
+                selection[weight].to_numpy(dtype=float)
+                if weight is not None
+                else np.ones(len(selection))
+            ),
+        },
+    )
+    frame["weight"] /= frame.groupby(by)["weight"].transform("sum")
+    weights = frame.pivot_table(
+        index=by,
+        columns=ticker,
+        values="weight",
+        aggfunc="sum",
+        fill_value=0.0,
+    )
+    weights.columns.name = None
+    return weights
+
+
+def _prices(close):
+    """Prices carried forward over missing dates (NaN before the first one)."""
+    return close.ffill().to_numpy(dtype=float)
+
+
+def _rebalance_rows(close, targets):
+    """Rows of the close dates where the targets are set."""
+    rows = close.index.get_indexer(targets.index)
+    if (rows < 0).any():
+        missing = list(targets.index[rows < 0][:5])
+        raise KeyError(f"Rebalance dates not in the close index: {missing}")
+    if (np.diff(rows) <= 0).any():
+        raise ValueError("The rebalance dates must be sorted and unique")
+    return rows
+
+
+def _targets(close, targets):
+    """Targets on the close tickers, 0 for missing tickers or values."""
+    unknown = targets.columns.difference(close.columns)
+    if len(unknown):
+        raise KeyError(f"Tickers not in the close panel: {list(unknown[:5])}")
+    return targets.reindex(columns=close.columns).to_numpy(dtype=float)
+
+
+def _period_index(rows, n_dates):
+    """Index of the last rebalance at or before each date (-1 before the first)."""
+    period = np.full(n_dates, -1)
+    period[rows] = np.arange(len(rows))
+    return np.maximum.accumulate(period)
+
+
+def _results(close, shares, trades, prices, *, costs, cash, turnover):  # noqa: PLR0913
+    """Portfolio and per-ticker frames of a backtest."""
+    holdings = np.where(shares != 0, shares * np.nan_to_num(prices), 0.0)
+    total = cash + holdings.sum(axis=1)
+    daily_returns = pct_change(total[:, None])[:, 0]
+    cumulative_returns = cumprod(1 + daily_returns[:, None])[:, 0] - 1
+    portfolio = pd.DataFrame(
+        {
+            "Portfolio Holdings": holdings.sum(axis=1),
+            "Portfolio Cash": cash,
+            "Portfolio Total": total,
+            "Turnover": turnover,
+            "Transaction Costs": costs.sum(axis=1),
+            "Portfolio Daily Returns": daily_returns,
+            "Portfolio Cumulative Returns": cumulative_returns,
+        },
+        index=close.index,
+    )
+    assets = pd.concat(
+        {
+            name: pd.DataFrame(values, index=close.index, columns=close.columns)
+            for name, values in zip(
+                ASSET_FIELDS,
+                [shares, trades, holdings, costs],
+                strict=True,
+            )
+        },
+        axis="columns",
+        names=["field", close.columns.name],
+    )
+    return portfolio, assets
+
+
+@instrument
+def backtest_weights(
+    close,
+    weights,
+    start_capital=100000,
+    cost_rate=0.0,
+    fixed_cost=0.0,
+):
+    """Simulate a portfolio rebalanced to target weights.
+
+    ``weights`` holds the target weight of each ticker at the rebalance dates
+    (its index, a subset of the close dates); the rest of the value is kept
+    in cash. Between two rebalances the share counts do not change, so the
+    weights drift with the prices. At a rebalance the cost is ``cost_rate``
+    times the traded value (the change from the drifted to the target
+    weights, times the value before trading) plus ``fixed_cost`` per traded
+    ticker. Prices are carried forward over missing dates; a ticker without
+    any price yet cannot be bought and keeps a weight of 0.
+
+    The value only depends on the previous rebalance through one factor per
+    rebalance, so the whole simulation is a handful of matrix operations and
+    one cumulative product, whatever the number of dates and tickers.
+
+    input: dataframe (dates x tickers), dataframe (rebalance dates x tickers),
+        float(optional), float(optional), float(optional).
+    output: dataframe with the portfolio holdings, cash, total, turnover,
+        transaction costs, daily and cumulative returns of every date;
+        dataframe with (field, ticker) columns for the Position (shares),
+        Entry/Exit Position (shares traded), Holdings and Costs of every
+        ticker.
+    """
+    rows = _rebalance_rows(close, weights)
+    prices = _prices(close)
+    targets = _targets(close, weights)
+    at_rebalance = prices[rows]
+    # Nothing can be bought before the first price of a ticker:
+    targets = np.where(np.isnan(at_rebalance), 0.0, np.nan_to_num(targets))
+
+    # Growth of each weight between two rebalances, and the drifted weights:
+    previous = np.vstack([np.zeros(targets.shape[1]), targets[:-1]])
+    relative = np.ones_like(targets)
+    np.divide(
+        at_rebalance[1:],
+        at_rebalance[:-1],
+        out=relative[1:],
+        where=previous[1:] != 0,
+    )
+    grown = previous * relative
+    growth = 1 - previous.sum(axis=1) + grown.sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        drifted = np.where(grown != 0, grown / growth[:, None], 0.0)
+    traded = np.abs(targets - drifted)
+    traded[traded < WEIGHT_TOLERANCE] = 0.0
+    turnover = traded.sum(axis=1)
+    fixed = fixed_cost * (traded > 0).sum(axis=1)
+
+    # value_k = factor_k * value_{k-1} - fixed_k, solved with cumulative sums:
+    factor = growth * (1 - cost_rate * turnover)
+    cumulative = np.cumprod(factor)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        value = cumulative * (start_capital - np.cumsum(fixed / cumulative))
+    value_before = np.r_[start_capital, value[:-1]] * growth
+
+    n_dates = len(close)
+    period = _period_index(rows, n_dates)
+    invested = period >= 0
+    period = np.maximum(period, 0)
+    shares = np.zeros_like(prices)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rebalance_shares = np.where(
+            targets != 0,
+            targets * value[:, None] / at_rebalance,
+            0.0,
+        )
+    shares[invested] = rebalance_shares[period[invested]]
+    trades = np.diff(shares, axis=0, prepend=0.0)
+    costs = np.zeros_like(prices)
+    costs[rows] = cost_rate * traded * value_before[:, None] + fixed_cost * (traded > 0)
+    cash = np.where(
+        invested,
+        (value * (1 - targets.sum(axis=1)))[period],
+        float(start_capital),
+    )
+    turnover_series = np.zeros(n_dates)
+    turnover_series[rows] = turnover
+    return _results(
+        close,
+        shares,
+        trades,
+        prices,
+        costs=costs,
+        cash=cash,
+        turnover=turnover_series,
+    )
+
+
+@instrument
+def backtest_shares(
+    close,
+    shares,
+    start_capital=100000,
+    cost_rate=0.0,
+    fixed_cost=0.0,
+):
+    """Simulate a portfolio holding given share counts.
+
+    ``shares`` holds the share count of each ticker (negative for short
+    positions) from each of its dates (a subset of the close dates) to the
+    next one; before its first date nothing is held. Trades pay ``cost_rate``
+    times their value plus ``fixed_cost`` each, out of the cash, which may go
+    negative. The turnover is the traded value over the value before trading.
+
+    input: dataframe (dates x tickers), dataframe (dates x tickers),
+        float(optional), float(optional), float(optional).
+    output: the two dataframes of backtest_weights.
+    """
+    rows = _rebalance_rows(close, shares)
+    prices = _prices(close)
+    counts = np.nan_to_num(_targets(close, shares))
+    period = _period_index(rows, len(close))
+    invested = period >= 0
+    positions = np.zeros_like(prices)
+    positions[invested] = counts[period[invested]]
+    trades = np.diff(positions, axis=0, prepend=0.0)
+    if np.isnan(prices[trades != 0]).any():
+        raise ValueError("Trades at dates without any price of the ticker")
+
+    traded_value = np.abs(trades) * np.nan_to_num(prices)
+    costs = cost_rate * traded_value + fixed_cost * (trades != 0)
+    flows = (trades * np.nan_to_num(prices)).sum(axis=1) + costs.sum(axis=1)
+    cash = start_capital - np.cumsum(flows)
+    # Value before trading: previous cash and shares at the current prices.
+    previous = positions - trades
+    before = np.r_[start_capital, cash[:-1]] + np.where(
+        previous != 0,
+        previous * np.nan_to_num(prices),
+        0.0,
+    ).sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        turnover = np.where(before != 0, traded_value.sum(axis=1) / before, np.nan)
+    return _results(
+        close,
+        positions,
+        trades,
+        prices,
+        costs=costs,
+        cash=cash,
+        turnover=turnover,
+    )
+
+
+@instrument
+def trade_records(assets, close):
+    """Round trips of every ticker of a backtest.
+
+    A trade opens when a ticker's position leaves 0 and closes when it goes
+    back to 0 or changes sign (a reversal closes one trade and opens the next
+    one on the same date). Its profit is the cash it received minus the cash
+    it paid, costs included; rebalancing in between counts towards it. The
+    round trips are found with cumulative sums over the flattened (ticker,
+    date) matrix, without a loop. As in trade_evaluation, a position still
+    open at the last date is not reported.
+
+    input: the per-ticker dataframe of backtest_weights or backtest_shares,
+        dataframe (dates x tickers).
+    output: dataframe, one row per trade, sorted by ticker and entry date.
+    """
+    tickers = assets["Position"].columns
+    # Flatten ticker by ticker, so that the dates of a ticker are contiguous:
+    positions = assets["Position"].to_numpy(dtype=float).T.ravel()
+    trades = assets["Entry/Exit Position"].to_numpy(dtype=float).T.ravel()
+    costs = assets["Costs"].to_numpy(dtype=float).T.ravel()
+    prices = np.nan_to_num(_prices(close[tickers]).T.ravel())
+    n_dates = len(assets)
+    previous = positions - trades
+    sign = np.sign(positions)
+    previous_sign = np.sign(previous)
+    closes = (previous_sign != 0) & (sign != previous_sign)
+    opens = (sign != 0) & (sign != previous_sign)
+    if not closes.any():
+        return pd.DataFrame(columns=TRADE_COLUMNS)
+
+    # Trade of each cell: the one open after the cell's own trade, if any:
+    trade_id = np.cumsum(opens) - 1
+    # The closing part of a cell sells the previous position and pays its
+    # share of the costs, the rest belongs to the trade open after the cell:
+    with np.errstate(divide="ignore", invalid="ignore"):
+        closing_share = np.where(closes, np.abs(previous) / np.abs(trades), 0.0)
+    closing_costs = closing_share * costs
+    open_costs = costs - closing_costs
+    closing_flow = np.where(closes, previous * prices, 0.0) - closing_costs
+    open_flow = np.where(closes, -positions, -trades) * prices - open_costs
+    held = sign != 0
+    n_trades = int(opens.sum())
+    profit = np.bincount(trade_id[held], open_flow[held], minlength=n_trades)
+    paid = np.bincount(trade_id[held], open_costs[held], minlength=n_trades)
+    # A closing cell closes the trade open at the previous cell:
+    closed_id = trade_id[closes] - opens[closes]
+
+    entry_cells = np.flatnonzero(opens)[closed_id]
+    exit_cells = np.flatnonzero(closes)
+    return pd.DataFrame(
+        {
+            "Ticker": tickers[exit_cells // n_dates],
+            "Entry Date": assets.index[entry_cells % n_dates],
+            "Exit Date": assets.index[exit_cells % n_dates],
+            "Shares": positions[entry_cells],
+            "Entry Share Price": prices[entry_cells],
+            "Exit Share Price": prices[exit_cells],
+            "Costs": paid[closed_id] + closing_costs[closes],
+            "Profit/Loss": profit[closed_id] + closing_flow[closes],
+        },
+        columns=TRADE_COLUMNS,
+    )
@@ -0,0 +1,251 @@
+"""Provide block and stationary bootstrap confidence intervals.
+
+Functions:
+---------
+
+bootstrap_indices:
+    Drawing the row indices of many resamples at once.
+
+bootstrap:
+    Computing a statistic over thousands of resamples, on a process pool.
+
+bootstrap_ratios:
+    Confidence intervals of the Sharpe and Sortino ratios.
+
+bootstrap_alphas:
+    Confidence intervals of the alphas and betas of the factor regressions.
+
+bootstrap_premia:
+    Confidence intervals of the Fama-MacBeth factor premia.
+
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from fico.regression import FACTOR_COLUMNS, align, design
+
+# Resamples with more (replicate x row) cells than this run on a process pool:
+PARALLEL_MIN_CELLS = 20_000_000
+
+
+def bootstrap_indices(n_rows, n_replicates, block_size, method="stationary", rng=None):
+    """Draw the row indices of many resamples at once.
+
+    ``method="block"`` glues blocks of ``block_size`` consecutive rows (moving
+    block bootstrap); ``method="stationary"`` uses blocks of geometric length
+    with mean ``block_size``, wrapping around the end (Politis and Romano).
+
+    input: int, int, int, str(optional), numpy Generator(optional).
+    output: 2D int array (replicates x rows).
+    """
+    rng = rng or np.random.default_rng()
+    block_size = max(1, min(block_size, n_rows))
+    if method == "block":
+        n_blocks = -(-n_rows // block_size)
+        starts = rng.integers(0, n_rows - block_size + 1, (n_replicates, n_blocks))
+        indices = starts[:, :, None] + np.arange(block_size)
+        return indices.reshape(n_replicates, -1)[:, :n_rows]
+    if method != "stationary":
+        raise ValueError(f"Unknown bootstrap method: {method}")
+    rows = np.arange(n_rows)
+    new_block = rng.random((n_replicates, n_rows)) < 1 / block_size
+    new_block[:, 0] = True
+    starts = rng.integers(0, n_rows, (n_replicates, n_rows))
+    block_start = np.maximum.accumulate(np.where(new_block, rows, 0), axis=1)
+    first = np.take_along_axis(starts, block_start, axis=1)
+    return (first + rows - block_start) % n_rows
+
+
+def _run_chunk(size, seed, *, values, statistic, block_size, method):  # noqa: PLR0913
+    """Worker of bootstrap: draw one chunk of resamples and evaluate them."""
+    rng = np.random.default_rng(seed)
+    indices = bootstrap_indices(len(values), size, block_size, method, rng)
+    return statistic(values, indices)
+
+
+def bootstrap(  # noqa: PLR0913
+    values,
+    statistic,
+    n_replicates=10000,
+    *,
+    block_size=20,
+    method="stationary",
+    seed=None,
+    max_workers=None,
+    chunk_size=500,
+):
+    """Compute a statistic over thousands of resamples of the rows of values.
+
+    ``statistic(values, indices)`` receives the 2D data array and a (replicates
+    x rows) index array and returns one row of results per replicate, so a
+    whole chunk of replicates is evaluated with batched array operations.
+    Chunks are spread over a process pool for large problems; each chunk gets
+    its own seed spawned from ``seed``, so the results do not depend on the
+    number of workers.
+
+    input: 2D array, callable, int(optional), int(optional), str(optional),
+        int(optional), int(optional), int(optional).
+    output: 2D array (replicates x statistics).
+    """
+    values = np.asarray(values, dtype=float)
+    sizes = [
+        min(chunk_size, n_replicates - start)
+        for start in range(0, n_replicates, chunk_size)
+    ]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    if max_workers is None and n_replicates * len(values) < PARALLEL_MIN_CELLS:
+        max_workers = 1
+    run = partial(
+        _run_chunk,
+        values=values,
+        statistic=statistic,
+        block_size=block_size,
+        method=method,
+    )
+    if max_workers == 1 or len(sizes) <= 1:
+        results = list(map(run, sizes, seeds))
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count()) as pool:
+            results = list(pool.map(run, sizes, seeds))
+    return np.concatenate(results)
+
+
+def _summary(estimate, replicates, names, confidence):
+    """Point estimate, bootstrap standard error and percentile interval."""
+    tail = (1 - confidence) / 2
+    replicates = pd.DataFrame(replicates, columns=names)
+    return {
+        "estimate": pd.Series(estimate, index=names, name="estimate"),
+        "stderr": replicates.std(),
+        "lower": replicates.quantile(tail),
+        "upper": replicates.quantile(1 - tail),
+        "replicates": replicates,
+    }
+
+
+def ratios_statistic(values, indices, periods=252):
+    """Sharpe and Sortino ratios of every column for each resample.
+
+    input: 2D array (rows x strategies), 2D int array (replicates x rows),
+        int(optional).
+    output: 2D array (replicates x 2 * strategies).
+    """
+    sample = values[indices]
+    count = (~np.isnan(sample)).sum(axis=1)
+    sample = np.nan_to_num(sample, copy=False)
+    losses = np.minimum(sample, 0.0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = sample.sum(axis=1) / count
+        squares = np.einsum("rtm,rtm->rm", sample, sample)
+        std = np.sqrt((squares - count * mean**2) / (count - 1))
+        # Same definitions as evaluate_returns, NaN rows counting as no loss:
+        downside = np.sqrt(np.einsum("rtm,rtm->rm", losses, losses) / len(values))
+        sharpe = mean / std * np.sqrt(periods)
+        sortino = mean / downside * np.sqrt(periods)
+    return np.stack([sharpe, sortino], axis=2).reshape(len(indices), -1)
+
+
+def bootstrap_ratios(daily_returns, confidence=0.95, periods=252, **kwargs):
+    """Confidence intervals of the Sharpe and Sortino ratios.
+
+    Takes the `Portfolio Daily Returns` of generate_signals, or a (dates x
+    strategies) frame. The other keyword arguments go to bootstrap.
+
+    input: series or dataframe, float(optional), int(optional).
+    output: dict with "estimate", "stderr", "lower" and "upper" series and the
+        "replicates" dataframe.
+    """
+    if isinstance(daily_returns, pd.Series):
+        daily_returns = daily_returns.to_frame()
+    values = daily_returns.to_numpy(dtype=float)
+    statistic = partial(ratios_statistic, periods=periods)
+    names = pd.MultiIndex.from_product(
+        [daily_returns.columns, ["Sharpe Ratio", "Sortino Ratio"]],
+    )
+    estimate = statistic(values, np.arange(len(values))[None, :])[0]
+    return _summary(estimate, bootstrap(values, statistic, **kwargs), names, confidence)
+
+
+def alphas_statistic(values, indices, n_stocks):
+    """Factor regression coefficients of every stock for each resample.
+
+    ``values`` holds the excess returns of the stocks in its first
+    ``n_stocks`` columns and the design matrix (intercept first) after them.
+
+    input: 2D array, 2D int array (replicates x rows), int.
+    output: 2D array (replicates x stocks * k).
+    """
+    sample = values[indices]
+    y = sample[:, :, :n_stocks]
+    x = sample[:, :, n_stocks:]
+    mask = ~np.isnan(y)
+    y = np.where(mask, y, 0.0)
+    xtx = np.einsum("rtn,rti,rtj->rnij", mask.astype(float), x, x)
+    xty = np.einsum("rti,rtn->rni", x, y)
+    coef = np.einsum("rnij,rnj->rni", np.linalg.pinv(xtx), xty)
+    return coef.reshape(len(indices), -1)
+
+
+def bootstrap_alphas(
+    returns,
+    factors,
+    factor_columns=None,
+    excess=True,
+    confidence=0.95,
+    **kwargs,
+):
+    """Confidence intervals of the alphas and betas of the factor regressions.
+
+    Resamples the dates of the merged returns/factors frame and refits
+    factor_regression for every replicate. The other keyword arguments go to
+    bootstrap.
+
+    input: dataframe (date x ticker), dataframe, list(optional), bool(optional),
+        float(optional).
+    output: dict with "estimate", "stderr", "lower" and "upper" series and the
+        "replicates" dataframe, indexed by (ticker, term).
+    """
+    factor_columns = factor_columns or FACTOR_COLUMNS
+    returns, factors = align(returns, factors)
+    y = returns.to_numpy(dtype=float)
+    if excess and "Risk_free" in factors.columns:
+        y = y - factors[["Risk_free"]].to_numpy(dtype=float)
+    values = np.column_stack([y, design(factors, factor_columns)])
+    statistic = partial(alphas_statistic, n_stocks=y.shape[1])
+    names = pd.MultiIndex.from_product(
+        [returns.columns, ["alpha", *factor_columns]],
+        names=["ticker", "term"],
+    )
+    estimate = statistic(values, np.arange(len(values))[None, :])[0]
+    return _summary(estimate, bootstrap(values, statistic, **kwargs), names, confidence)
+
+
+def mean_statistic(values, indices):
+    """Column means of each resample, skipping NaN.
+
+    input: 2D array, 2D int array (replicates x rows).
+    output: 2D array (replicates x columns).
+    """
+    with np.errstate(invalid="ignore"):
+        return np.nanmean(values[indices], axis=1)
+
+
+def bootstrap_premia(gamma, confidence=0.95, **kwargs):
+    """Confidence intervals of the Fama-MacBeth factor premia.
+
+    ``gamma`` is the per-date coefficients frame returned by fama_macbeth. The
+    other keyword arguments go to bootstrap.
+
+    input: dataframe, float(optional).
+    output: dict with "estimate", "stderr", "lower" and "upper" series and the
+        "replicates" dataframe.
+    """
+    gamma = gamma.dropna()
+    values = gamma.to_numpy(dtype=float)
+    estimate = values.mean(axis=0)
+    replicates = bootstrap(values, mean_statistic, **kwargs)
+    return _summary(estimate, replicates, gamma.columns, confidence)
@@ -0,0 +1,165 @@
+"""Provide a persistent on-disk cache for parsed source files.
+
+Functions:
+---------
+
+file_fingerprint:
+    Identify a source file by its modification time and size (or content hash).
+
+save_frame:
+    Store a dataframe in a binary columnar file (Parquet or NumPy .npz).
+
+load_frame:
+    Read back a dataframe stored by save_frame.
+
+cached_frame:
+    Load a parsed source from the cache, parsing it again only when it changed.
+
+"""
+import hashlib
+import importlib.util
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+MANIFEST_NAME = "manifest.json"
+
+
+def parquet_available():
+    """Check if a Parquet engine (pyarrow) is installed.
+
+    output: bool.
+    """
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def file_fingerprint(path, content_hash=False):
+    """Identify a source file so that changes can be detected.
+
+    By default only the modification time and the size are used, which costs a
+    single ``stat`` call. With ``content_hash=True`` the sha256 of the file
+    replaces the modification time, so touched but unchanged files still hit the
+    cache.
+
+    input: str or Path, bool(optional).
+    output: dict.
+    """
+    path = Path(path)
+    stat = path.stat()
+    fingerprint = {"size": stat.st_size}
+    if not content_hash:
+        fingerprint["mtime_ns"] = stat.st_mtime_ns
+    else:
+        digest = hashlib.sha256()
+        with path.open("rb") as source:
+            for chunk in iter(lambda: source.read(1 << 20), b""):
+                digest.update(chunk)
+        fingerprint["sha256"] = digest.hexdigest()
+    return fingerprint
+
+
+def _to_array(values):
+    """Convert to a NumPy array that can be stored without pickle."""
+    array = np.asarray(values)
+    if array.dtype == object:
+        array = array.astype(str)
+    return array
+
+
+def save_frame(frame, path):
+    """Store a dataframe in a binary columnar file.
+
+    Parquet is used when pyarrow is available, otherwise every column is stored
+    as its own array inside an uncompressed NumPy ``.npz`` archive.
+
+    input: dataframe, str or Path (without suffix).
+    output: Path of the written file.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if parquet_available():
+        target = path.with_suffix(".parquet")
+        tmp = target.with_suffix(".parquet.tmp")
+        frame.to_parquet(tmp, index=True)
+    else:
+        target = path.with_suffix(".npz")
+        tmp = target.with_suffix(".tmp.npz")
+        arrays = {
+            f"col_{i}": _to_array(frame.iloc[:, i]) for i in range(frame.shape[1])
+        }
+        arrays["__index__"] = _to_array(frame.index)
+        arrays["__index_name__"] = np.array(frame.index.name or "")
+        arrays["__columns__"] = np.array([str(column) for column in frame.columns])
+        np.savez(tmp, **arrays)
+    # Replace atomically so a crash never leaves a half written cache file:
+    tmp.replace(target)
+    return target
+
+
+def load_frame(path):
+    """Read back a dataframe stored by save_frame.
+
+    input: str or Path (with suffix).
+    output: dataframe.
+    """
+    path = Path(path)
+    if path.suffix == ".parquet":
+        return pd.read_parquet(path)
+    with np.load(path, allow_pickle=False) as archive:
+        columns = list(archive["__columns__"])
+        name = str(archive["__index_name__"]) or None
+        index = pd.Index(archive["__index__"], name=name)
+        data = {column: archive[f"col_{i}"] for i, column in enumerate(columns)}
+    return pd.DataFrame(data, index=index, columns=columns)
+
+
+def _read_manifest(cache_dir):
+    manifest_path = Path(cache_dir) / MANIFEST_NAME
+    if not manifest_path.exists():
+        return {}
+    try:
+        return json.loads(manifest_path.read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_manifest(cache_dir, manifest):
+    manifest_path = Path(cache_dir) / MANIFEST_NAME
+    tmp = manifest_path.with_suffix(".json.tmp")
+    tmp.write_text(json.dumps(manifest, indent=4, sort_keys=True))
+    tmp.replace(manifest_path)
+
+
+def cached_frame(source, parser, cache_dir, key=None, content_hash=False):
+    """Load a parsed source from the cache, parsing it again only when it changed.
+
+    The cache entry is valid while the fingerprint of ``source`` matches the one
+    recorded in the manifest of ``cache_dir``.
+
+    input: str or Path, callable(Path) -> dataframe, str or Path, str(optional),
+        bool(optional).
+    output: dataframe, bool (True when the source had to be parsed).
+    """
+    source = Path(source)
+    cache_dir = Path(cache_dir)
+    key = key or source.stem
+    fingerprint = file_fingerprint(source, content_hash=content_hash)
+    manifest = _read_manifest(cache_dir)
+    entry = manifest.get(key)
+    if entry is not None and entry.get("fingerprint") == fingerprint:
+        cache_file = cache_dir / entry["file"]
+        if cache_file.exists():
+            return load_frame(cache_file), False
+
+    frame = parser(source)
+    cache_file = save_frame(frame, cache_dir / key)
+    manifest = _read_manifest(cache_dir)
+    manifest[key] = {
+        "source": str(source),
+        "fingerprint": fingerprint,
+        "file": cache_file.name,
+    }
+    _write_manifest(cache_dir, manifest)
+    return frame, True
@@ -8,6 +8,20 @@ generate_signals:
 Generating signals dataframe, Where it simulates a portfolio with
 an arbitrary start capital and a fixed number of shares traded each operation.
 
+batch_signals:
+
+Simulating the generate_signals portfolio for many tickers or parameter sets
+at once, with dates as rows and one column per ticker or parameter set.
+
+
+cumprod, pct_change:
+
+Cumulative product and percentage change along the dates of 2D arrays,
+skipping NaN as pandas does (shared with fico.backtest).
+
+evaluate_returns:
+
+Compute all the performance metrics for many strategies or tickers at once.
 
 *algo_evaluation*:
 
@@ -33,65 +47,194 @@ Perform a quantitative analysis of the underlying returns.
 import numpy as np
 import pandas as pd
 
+from fico.instrument import instrument
+
+
+def _diff(values):
+    """First difference along the dates, NaN in the first row (as pandas)."""
+    values = values.astype(float, copy=False)
+    return np.concatenate([np.full_like(values[:1], np.nan), np.diff(values, axis=0)])
+
+
+def _cumsum(values):
+    """Cumulative sum along the dates skipping NaN (as pandas)."""
+    return np.where(np.isnan(values), np.nan, np.nancumsum(values, axis=0))
+
+
+def cumprod(values):
+    """Cumulative product along the dates skipping NaN (as pandas)."""
+    return np.where(np.isnan(values), np.nan, np.nancumprod(values, axis=0))
+
+
+def pct_change(values):
+    """Percentage change along the dates of the forward filled values."""
+    rows = np.where(np.isnan(values), 0, np.arange(len(values))[:, None])
+    filled = np.take_along_axis(values, np.maximum.accumulate(rows, axis=0), axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.concatenate(
+            [np.full_like(filled[:1], np.nan), filled[1:] / filled[:-1] - 1],
+        )
+
+
+@instrument
+def batch_signals(close, buy_signal, start_capital=100000, share_count=2000):
+    """Simulate the generate_signals portfolio for many columns at once.
+
+    input: 2D array or dataframe, 2D array or dataframe, float or 1D array
+    (optional), int or 1D array (optional).
+
+    Runs a single NumPy pass over every column of ``close`` and ``buy_signal``
+    (dates as rows, tickers or parameter sets as columns). ``start_capital`` and
+    ``share_count`` are either scalars or hold one value per column.
+
+    output: dict of 2D arrays keyed by the generate_signals column names, or a
+    dataframe with (field, column) columns when ``close`` is a dataframe.
+    """
+    frame = close if isinstance(close, pd.DataFrame) else None
+    close = np.asarray(close)
+    buy_signal = np.asarray(buy_signal)
+    vector = close.ndim == 1
+    if vector:
+        close = close[:, None]
+        buy_signal = buy_signal[:, None]
+    close, buy_signal = np.broadcast_arrays(close, buy_signal)
+    initial_capital = np.asarray(start_capital, dtype=float)
+
+    # Take a position of share_count shares where the Buy Signal is 1:
+    position = np.asarray(share_count) * buy_signal
+    entry_exit = _diff(buy_signal)
+    entry_exit_position = _diff(position)
+    # Holdings, liquid cash and total value of the portfolio:
+    holdings = close * _cumsum(entry_exit_position)
+    cash = initial_capital - _cumsum(close * entry_exit_position)
+    total = cash + holdings
+    daily_returns = pct_change(total)
+    cumulative_returns = cumprod(1 + daily_returns) - 1
+
+    results = {
+        "Position": position,
+        "Entry/Exit": entry_exit,
+        "Entry/Exit Position": entry_exit_position,
+        "Portfolio Holdings": holdings,
+        "Portfolio Cash": cash,
+        "Portfolio Total": total,
+        "Portfolio Daily Returns": daily_returns,
+        "Portfolio Cumulative Returns": cumulative_returns,
+    }
+    if vector:
+        return {name: values[:, 0] for name, values in results.items()}
+    if frame is not None:
+        return pd.concat(
+            {
+                name: pd.DataFrame(values, index=frame.index, columns=frame.columns)
+                for name, values in results.items()
+            },
+            axis="columns",
+            names=["field", frame.columns.name],
+        )
+    return results
+
 
 # Define function to generate signals dataframe for algorithm:
+@instrument
 def generate_signals(input_df, start_capital=100000, share_count=2000):
     """input: dataframe, int(optional), int(optional).
 
     Generating signals dataframe, Where it simulates a portfolio with
     an arbitrary start capital and a fixed number of shares traded each operation.
 
+    Thin wrapper around batch_signals for a single ticker.
+
     output: dataframe.
     """
-    # Set initial capital:
-    initial_capital = float(start_capital)
-
+    results = batch_signals(
+        input_df["Close"].to_numpy(),
+        input_df["Buy Signal"].to_numpy(),
+        start_capital=start_capital,
+        share_count=share_count,
+    )
     signals_df = input_df.copy()
+    for name, values in results.items():
+        signals_df[name] = values
+    return signals_df
 
-    # Set the share size:
-    share_size = share_count
 
-    # Take a 500 share position where the Buy Signal is 1
-    # (prior day's predictions greater than prior day's returns):
-    signals_df["Position"] = share_size * signals_df["Buy Signal"]
+# Metrics reported by algo_evaluation, in order:
+METRICS = [
+    "Annual Return",
+    "Cumulative Returns",
+    "Annual Volatility",
+    "Sharpe Ratio",
+    "Sortino Ratio",
+]
 
-    # Make Entry / Exit Column:
-    signals_df["Entry/Exit"] = signals_df["Buy Signal"].diff()
+# Additional metrics computed by evaluate_returns:
+EXTRA_METRICS = ["Max Drawdown", "Calmar Ratio", "Hit Rate"]
 
-    # Find the points in time where a 500 share position is bought or sold:
-    signals_df["Entry/Exit Position"] = signals_df["Position"].diff()
 
-    # Multiply share price by entry/exit positions and get the cumulative sum:
-    signals_df["Portfolio Holdings"] = (
-        signals_df["Close"] * signals_df["Entry/Exit Position"].cumsum()
-    )
+@instrument
+def evaluate_returns(daily_returns, cumulative_returns=None, periods=252):
+    """Compute every metric for all the columns of a returns array at once.
 
-    # Subtract the initial capital by the portfolio holdings to get the amount of
-    # liquid cash in the portfolio:
-    signals_df["Portfolio Cash"] = (
-        initial_capital
-        - (signals_df["Close"] * signals_df["Entry/Exit Position"]).cumsum()
-    )
+    input: 2D array or dataframe (dates x strategies), 2D array or dataframe
+    (optional), int(optional).
 
-    # Get the total portfolio value by adding the cash amount by the portfolio holdings
-    # (or investments):
-    signals_df["Portfolio Total"] = (
-        signals_df["Portfolio Cash"] + signals_df["Portfolio Holdings"]
-    )
+    Each column is a strategy or ticker. NaN returns are skipped, as pandas
+    does. The cumulative return is the last row of ``cumulative_returns`` when
+    given, otherwise the compounded daily returns. The hit rate is the share
+    of positive days among the days with a non-zero return.
 
-    # Calculate the portfolio daily returns:
-    signals_df["Portfolio Daily Returns"] = signals_df["Portfolio Total"].pct_change()
-
-    # Calculate the cumulative returns:
-    signals_df["Portfolio Cumulative Returns"] = (
-        1 + signals_df["Portfolio Daily Returns"]
-    ).cumprod() - 1
-
-    # signals_df = signals_df.dropna()
-
-    return signals_df
+    output: dataframe (metrics x columns).
+    """
+    columns = getattr(daily_returns, "columns", None)
+    returns = np.asarray(daily_returns, dtype=float)
+    if returns.ndim == 1:
+        returns = returns[:, None]
+    valid = ~np.isnan(returns)
+    filled = np.where(valid, returns, 0.0)
+    count = valid.sum(axis=0)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = filled.sum(axis=0) / count
+        # The sample standard deviation needs two returns (NaN as in pandas):
+        std = np.where(
+            count > 1,
+            np.sqrt(
+                (np.where(valid, returns - mean, 0.0) ** 2).sum(axis=0) / (count - 1),
+            ),
+            np.nan,
+        )
+        # Downside deviation over all rows, NaN rows counting as no loss:
+        downside = np.sqrt(np.where(returns < 0, returns**2, 0.0).mean(axis=0))
+        growth = np.cumprod(1 + filled, axis=0)
+        if cumulative_returns is None:
+            cumulative = growth[-1] - 1
+        else:
+            cumulative = np.asarray(cumulative_returns, dtype=float).reshape(
+                len(returns),
+                -1,
+            )[-1]
+        drawdown = (growth / np.maximum.accumulate(growth, axis=0) - 1).min(axis=0)
+        annual_return = mean * periods
+        annual_volatility = std * np.sqrt(periods)
+        metrics = [
+            annual_return,
+            cumulative,
+            annual_volatility,
+            annual_return / annual_volatility,
+            annual_return / (downside * np.sqrt(periods)),
+            drawdown,
+            annual_return / np.abs(drawdown),
+            (returns > 0).sum(axis=0) / (valid & (returns != 0)).sum(axis=0),
+        ]
+    return pd.DataFrame(
+        np.vstack(metrics),
+        index=METRICS + EXTRA_METRICS,
+        columns=columns,
+    )
 
 
+@instrument
 def algo_evaluation(signals_df):
     """input: dataframe.
 
@@ -99,56 +242,17 @@ def algo_evaluation(signals_df):
 
     output: dataframe.
     """
-    # Prepare dataframe for metrics
-    metrics = [
-        "Annual Return",
-        "Cumulative Returns",
-        "Annual Volatility",
-        "Sharpe Ratio",
-        "Sortino Ratio",
-    ]
-
-    columns = ["Backtest"]
-
-    # Initialize the DataFrame with index set to evaluation metrics
-    #  and column as `Backtest` (just like PyFolio)
-    portfolio_evaluation_df = pd.DataFrame(index=metrics, columns=columns)
-    # Calculate cumulative returns:
-    portfolio_evaluation_df.loc["Cumulative Returns"] = signals_df[
-        "Portfolio Cumulative Returns"
-    ][-1]
-    # Calculate annualized returns:
-    portfolio_evaluation_df.loc["Annual Return"] = (
-        signals_df["Portfolio Daily Returns"].mean() * 252
+    # One column `Backtest` (just like PyFolio), metrics as index:
+    evaluation = evaluate_returns(
+        signals_df[["Portfolio Daily Returns"]],
+        signals_df[["Portfolio Cumulative Returns"]],
     )
-    # Calculate annual volatility:
-    portfolio_evaluation_df.loc["Annual Volatility"] = signals_df[
-        "Portfolio Daily Returns"
-    ].std() * np.sqrt(252)
-    # Calculate Sharpe Ratio:
-    portfolio_evaluation_df.loc["Sharpe Ratio"] = (
-        signals_df["Portfolio Daily Returns"].mean() * 252
-    ) / (signals_df["Portfolio Daily Returns"].std() * np.sqrt(252))
-
-    # Calculate Sortino Ratio/Downside Return:
-    sortino_ratio_df = signals_df[["Portfolio Daily Returns"]].copy()
-    sortino_ratio_df.loc[:, "Downside Returns"] = 0
-
-    target = 0
-    mask = sortino_ratio_df["Portfolio Daily Returns"] < target
-    sortino_ratio_df.loc[mask, "Downside Returns"] = (
-        sortino_ratio_df["Portfolio Daily Returns"] ** 2
-    )
-    down_stdev = np.sqrt(sortino_ratio_df["Downside Returns"].mean()) * np.sqrt(252)
-    expected_return = sortino_ratio_df["Portfolio Daily Returns"].mean() * 252
-    sortino_ratio = expected_return / down_stdev
-
-    portfolio_evaluation_df.loc["Sortino Ratio"] = sortino_ratio
-
-    return portfolio_evaluation_df
+    evaluation.columns = ["Backtest"]
+    return evaluation.loc[METRICS]
 
 
 # Define function to evaluate the underlying asset:
+@instrument
 def underlying_evaluation(signals_df):
     """input: dataframe.
 
@@ -156,118 +260,96 @@ def underlying_evaluation(signals_df):
 
     output: dataframe.
     """
-    underlying = pd.DataFrame()
-    underlying["Close"] = signals_df["Close"]
-    # underlying["Portfolio Daily Returns"] = underlying["Close"].pct_change()
-    underlying["Portfolio Daily Returns"] = signals_df["Returns"]
-
-    # in case of error:
-    # underlying["Portfolio Daily Returns"].fillna(0, inplace=True)
-    underlying["Portfolio Daily Returns"].fillna(0)
-    underlying["Portfolio Cumulative Returns"] = (
-        1 + underlying["Portfolio Daily Returns"]
-    ).cumprod() - 1
-
-    return algo_evaluation(underlying)
+    evaluation = evaluate_returns(signals_df[["Returns"]])
+    evaluation.columns = ["Backtest"]
+    return evaluation.loc[METRICS]
 
 
 # Define function to return algo evaluation relative to underlying asset
 #  combines the two evaluations into a single dataframe
+@instrument
 def algo_vs_underlying(signals_df):
     """Compares the algo evaluation to the underlying asset evaluation.
 
+    Both columns are computed in a single evaluate_returns call.
+
     input: dataframe.
 
     output: dataframe.
     """
-    metrics = [
-        "Annual Return",
-        "Cumulative Returns",
-        "Annual Volatility",
-        "Sharpe Ratio",
-        "Sortino Ratio",
-    ]
-
-    columns = ["Algo", "Underlying"]
-    algo = algo_evaluation(signals_df)
-    underlying = underlying_evaluation(signals_df)
-
-    comparison_df = pd.DataFrame(index=metrics, columns=columns)
-    comparison_df["Algo"] = algo["Backtest"]
-    comparison_df["Underlying"] = underlying["Backtest"]
-
-    return comparison_df
+    daily_returns = signals_df[["Portfolio Daily Returns", "Returns"]].to_numpy()
+    comparison_df = evaluate_returns(daily_returns)
+    comparison_df.columns = ["Algo", "Underlying"]
+    comparison_df.loc["Cumulative Returns", "Algo"] = signals_df[
+        "Portfolio Cumulative Returns"
+    ].iloc[-1]
+    return comparison_df.loc[METRICS]
 
 
 # Define function which accepts daily signals dataframe and
 # returns evaluations of individual trades:
+@instrument
 def trade_evaluation(signals_df):
     """input: dataframe.
 
     Perform a quantitative analysis of the algorithm performance
     and generates a trade evaluation DataFrame.
+
+    Entries and exits are located with boolean masks on `Entry/Exit`, so the
+    cost is linear in the number of rows. A position still open at the last
+    row is not reported.
     output: dataframe.
     """
-    # initialize dataframe
-    trade_evaluation_df = pd.DataFrame(
-        columns=[
-            "Entry Date",
-            "Exit Date",
-            "Shares",
-            "Entry Share Price",
-            "Exit Share Price",
-            "Entry Portfolio Holding",
-            "Exit Portfolio Holding",
-            "Profit/Loss",
-        ],
+    columns = [
+        "Entry Date",
+        "Exit Date",
+        "Shares",
+        "Entry Share Price",
+        "Exit Share Price",
+        "Entry Portfolio Holding",
+        "Exit Portfolio Holding",
+        "Profit/Loss",
+    ]
+    entry_exit = signals_df["Entry/Exit"].to_numpy()
+    # Each exit (`Entry/Exit` is -1) closes the trade opened by the latest entry
+    # (`Entry/Exit` is 1) before it:
+    rows = np.arange(len(entry_exit))
+    last_entry = np.maximum.accumulate(np.where(entry_exit == 1, rows, -1))
+    exits = np.flatnonzero(entry_exit == -1)
+    if len(exits) == 0:
+        return pd.DataFrame(columns=columns)
+    entries = last_entry[exits]
+    opened = entries >= 0
+    # An exit without a previous entry keeps the empty entry metrics:
+    entries = np.where(opened, entries, 0)
+
+    def at_entry(values):
+        return np.where(opened, values[entries], 0)
+
+    entry_dates = signals_df.index[entries]
+    if not opened.all():
+        entry_dates = entry_dates.astype(object).where(opened, "")
+    total = signals_df["Portfolio Total"].to_numpy()
+    close = signals_df["Close"].to_numpy()
+    entry_portfolio_holding = at_entry(total)
+    exit_portfolio_holding = np.abs(total[exits])
+    return pd.DataFrame(
+        {
+            "Entry Date": entry_dates,
+            "Exit Date": signals_df.index[exits],
+            "Shares": at_entry(signals_df["Entry/Exit Position"].to_numpy()),
+            "Entry Share Price": at_entry(close),
+            "Exit Share Price": close[exits],
+            "Entry Portfolio Holding": entry_portfolio_holding,
+            "Exit Portfolio Holding": exit_portfolio_holding,
+            "Profit/Loss": exit_portfolio_holding - entry_portfolio_holding,
+        },
+        columns=columns,
     )
 
-    entry_date = ""
-    exit_date = ""
-    entry_portfolio_holding = 0
-    exit_portfolio_holding = 0
-    share_size = 0
-    entry_share_price = 0
-    exit_share_price = 0
-
-    # Loop through signal DataFrame
-    # If `Entry/Exit` is 1, set entry trade metrics
-    # Else if `Entry/Exit` is -1, set exit trade metrics and calculate profit,
-    # Then append the record to the trade evaluation DataFrame
-    for index, row in signals_df.iterrows():
-        if row["Entry/Exit"] == 1:
-            entry_date = index
-            entry_portfolio_holding = row["Portfolio Total"]
-            share_size = row["Entry/Exit Position"]
-            entry_share_price = row["Close"]
-
-        elif row["Entry/Exit"] == -1:
-            exit_date = index
-            exit_portfolio_holding = abs(row["Portfolio Total"])
-            exit_share_price = row["Close"]
-            profit_loss = exit_portfolio_holding - entry_portfolio_holding
-            trade_evaluation_df = pd.concat(
-                [
-                    trade_evaluation_df,
-                    pd.DataFrame(
-                        {
-                            "Entry Date": [entry_date],
-                            "Exit Date": [exit_date],
-                            "Shares": [share_size],
-                            "Entry Share Price": [entry_share_price],
-                            "Exit Share Price": [exit_share_price],
-                            "Entry Portfolio Holding": [entry_portfolio_holding],
-                            "Exit Portfolio Holding": [exit_portfolio_holding],
-                            "Profit/Loss": [profit_loss],
-                        },
-                    ),
-                ],
-                ignore_index=True,
-            )
-    return trade_evaluation_df
-
 
 # Define function that plots Algo Cumulative Returns vs. Underlying Cumulative Returns:
+@instrument
 def underlying_returns(signals_df):
     """Generates a graph of the algo cumulative returns.
 
@@ -0,0 +1,151 @@
+"""Provide Fama-MacBeth cross-sectional regressions to test if factors are priced.
+
+Functions:
+---------
+
+cross_sectional_regressions:
+    Regressing the returns of each date on the betas or characteristics.
+
+fama_macbeth:
+    Averaging the per-date coefficients into factor premia with Newey-West
+    adjusted t-statistics.
+
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+# Panels with more (date x ticker) cells than this are solved on a process pool:
+PARALLEL_MIN_CELLS = 5_000_000
+
+
+def _stack_panels(returns, characteristics):
+    """Align the characteristic panels to the returns as a (date, ticker, k) array."""
+    if isinstance(characteristics, pd.DataFrame):
+        names = list(characteristics.columns.get_level_values(0).unique())
+        characteristics = {name: characteristics[name] for name in names}
+    names = list(characteristics)
+    x = np.stack(
+        [
+            characteristics[name]
+            .reindex(index=returns.index, columns=returns.columns)
+            .to_numpy(dtype=float)
+            for name in names
+        ],
+        axis=2,
+    )
+    return names, x
+
+
+def _solve_dates(y, x):
+    """Solve the cross-sectional OLS of every date of a chunk at once.
+
+    input: 2D array (dates x tickers), 3D array (dates x tickers x k).
+    output: 2D array (dates x (k + 1)) of coefficients, 1D array of counts.
+    """
+    mask = ~np.isnan(y) & ~np.isnan(x).any(axis=2)
+    design = np.concatenate([np.ones((*y.shape, 1)), x], axis=2)
+    design = np.where(mask[:, :, None], design, 0.0)
+    y = np.where(mask, y, 0.0)
+    xtx = np.einsum("tni,tnj->tij", design, design)
+    xty = np.einsum("tni,tn->ti", design, y)
+    nobs = mask.sum(axis=1)
+    coef = np.full(xty.shape, np.nan)
+    ready = nobs > design.shape[2]
+    if ready.any():
+        coef[ready] = np.einsum(
+            "tij,tj->ti",
+            np.linalg.pinv(xtx[ready]),
+            xty[ready],
+        )
+    return coef, nobs
+
+
+def cross_sectional_regressions(
+    returns,
+    characteristics,
+    max_workers=None,
+    chunk_size=250,
+):
+    """Regress the returns of each date on the betas or characteristics.
+
+    ``returns`` is a (date x ticker) frame and ``characteristics`` either a dict
+    of (date x ticker) frames or a frame with (name, ticker) columns, such as
+    rolling_factor_betas (lag it one date to avoid look-ahead). All the
+    regressions of a chunk of dates are solved in one batched call; large
+    panels spread the chunks over a process pool.
+
+    input: dataframe, dict or dataframe, int(optional), int(optional).
+    output: dataframe (date x [intercept, names]), series of observations.
+    """
+    names, x = _stack_panels(returns, characteristics)
+    y = returns.to_numpy(dtype=float)
+    bounds = range(0, len(y), chunk_size)
+    chunks = [(y[i : i + chunk_size], x[i : i + chunk_size]) for i in bounds]
+    if max_workers is None and y.size < PARALLEL_MIN_CELLS:
+        max_workers = 1
+    if max_workers == 1 or len(chunks) <= 1:
+        results = [_solve_dates(*chunk) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count()) as pool:
+            results = list(pool.map(_solve_dates, *zip(*chunks, strict=True)))
+    columns = ["intercept", *names]
+    if not results:
+        return pd.DataFrame(columns=columns), pd.Series(dtype=int, name="nobs")
+    coef = np.concatenate([result[0] for result in results])
+    nobs = np.concatenate([result[1] for result in results])
+    return (
+        pd.DataFrame(coef, index=returns.index, columns=columns),
+        pd.Series(nobs, index=returns.index, name="nobs"),
+    )
+
+
+def _newey_west_variance(values, lags):
+    """Newey-West long-run variance of each column, divided by the sample size."""
+    values = values - values.mean(axis=0)
+    n_rows = len(values)
+    variance = (values**2).sum(axis=0) / n_rows
+    for lag in range(1, lags + 1):
+        weight = 1 - lag / (lags + 1)
+        variance += 2 * weight * (values[lag:] * values[:-lag]).sum(axis=0) / n_rows
+    return variance / n_rows
+
+
+def fama_macbeth(
+    returns,
+    characteristics,
+    newey_west_lags=None,
+    max_workers=None,
+    chunk_size=250,
+):
+    """Average the per-date coefficients into factor premia.
+
+    The standard errors of the averages are Newey-West adjusted with
+    ``newey_west_lags`` lags (default ``floor(4 * (T / 100) ** (2 / 9))``).
+    Dates without enough stocks are skipped.
+
+    input: dataframe, dict or dataframe, int(optional), int(optional),
+        int(optional).
+    output: dict with the per-date "gamma" dataframe and the "nobs" series,
+        and the "premia", "stderr" and "tstat" series.
+    """
+    gamma, nobs = cross_sectional_regressions(
+        returns,
+        characteristics,
+        max_workers=max_workers,
+        chunk_size=chunk_size,
+    )
+    values = gamma.dropna().to_numpy()
+    if newey_west_lags is None:
+        newey_west_lags = int(4 * (len(values) / 100) ** (2 / 9))
+    premia = values.mean(axis=0)
+    stderr = np.sqrt(_newey_west_variance(values, newey_west_lags))
+    return {
+        "gamma": gamma,
+        "nobs": nobs,
+        "premia": pd.Series(premia, index=gamma.columns, name="premia"),
+        "stderr": pd.Series(stderr, index=gamma.columns, name="stderr"),
+        "tstat": pd.Series(premia / stderr, index=gamma.columns, name="tstat"),
+    }
@@ -0,0 +1,285 @@
+"""Provide opt-in instrumentation of the pipeline functions.
+
+The public functions of fico.portfolio and fico.evaluation are wrapped with
+instrument. While instrumentation is disabled (the default) the wrapper only
+checks the module state and calls the function; once enabled, every call sends a
+record with its wall time, rows in and out and, optionally, the peak memory
+allocated during the call to the sinks.
+
+The memory peak is measured for the whole process: it is the highest memory
+traced while the call runs, minus the memory traced when it started. Calls
+running at the same time on other threads (e.g. the stages of a Pipeline)
+count towards each other's peaks; run them with ``max_workers=1`` to measure
+each call on its own.
+
+Functions:
+---------
+
+instrument:
+    Decorator recording the calls of a function while instrumentation is on.
+
+enable:
+    Sending the records of every instrumented call to the given sinks.
+
+disable:
+    Switching the instrumentation off.
+
+profiling:
+    Context manager enabling the instrumentation inside a block.
+
+Classes:
+-------
+
+MemorySink:
+    Keeping the records in a list, with a dataframe view.
+
+LogSink:
+    Writing each record to a logger.
+
+JsonLinesSink:
+    Appending each record to a JSON lines file.
+
+"""
+import functools
+import json
+import logging
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+
+import pandas as pd
+
+
+class _State:
+    """Settings of the instrumentation, shared by every wrapper."""
+
+    # Sinks of the enabled instrumentation, empty while disabled:
+    sinks = ()
+    trace_memory = False
+    started_tracemalloc = False
+
+
+_STATE = _State()
+# Per-thread depth of the calls in progress:
+_LOCAL = threading.local()
+# Highest traced memory of every call in progress, in any thread, keyed by a
+# token of the call; tracemalloc's peak is only read and reset under the lock:
+_MEMORY_LOCK = threading.Lock()
+_PEAKS = {}
+
+
+def _rows(value):
+    """Number of rows of a frame, series, array or Portifolio (None otherwise)."""
+    if isinstance(value, tuple) and value:
+        return _rows(value[0])
+    frame = getattr(value, "frame", None)
+    if frame is not None:
+        return _rows(frame)
+    shape = getattr(value, "shape", None)
+    if shape:
+        return int(shape[0])
+    return None
+
+
+def _rows_in(args, kwargs):
+    """Rows of the first argument that has any."""
+    for value in (*args, *kwargs.values()):
+        rows = _rows(value)
+        if rows is not None:
+            return rows
+    return None
+
+
+def _emit(record):
+    """Send a record to every sink."""
+    for sink in _STATE.sinks:
+        sink(record)
+
+
+def _fold_peak():
+    """Fold the peak since the last reset into the calls in progress.
+
+    Must hold _MEMORY_LOCK. Every call in progress was running during the whole
+    interval since the last reset (calls only start and end here), so the peak
+    of the interval belongs to all of them.
+
+    output: int (bytes traced now).
+    """
+    current, peak = tracemalloc.get_traced_memory()
+    for token, highest in _PEAKS.items():
+        _PEAKS[token] = max(highest, peak)
+    tracemalloc.reset_peak()
+    return current
+
+
+def _call(name, function, args, kwargs):
+    """Run an instrumented call and emit its record."""
+    depth = getattr(_LOCAL, "depth", 0)
+    record = {
+        "function": name,
+        "depth": depth,
+        "start": time.time(),
+        "rows_in": _rows_in(args, kwargs),
+    }
+    token = None
+    if _STATE.trace_memory:
+        token = object()
+        with _MEMORY_LOCK:
+            base = _PEAKS[token] = _fold_peak()
+    _LOCAL.depth = depth + 1
+    start = time.perf_counter()
+    error = None
+    try:
+        result = function(*args, **kwargs)
+    except BaseException as exception:
+        error = type(exception).__name__
+        raise
+    finally:
+        record["seconds"] = time.perf_counter() - start
+        _LOCAL.depth = depth
+        if token is not None:
+            with _MEMORY_LOCK:
+                _fold_peak()
+                peak = _PEAKS.pop(token)
+            record["peak_mib"] = (peak - base) / 2**20
+        if error is not None:
+            record["rows_out"] = None
+            record["error"] = error
+            _emit(record)
+    record["rows_out"] = _rows(result)
+    record["error"] = None
+    _emit(record)
+    return result
+
+
+def instrument(function):
+    """Record the calls of a function while instrumentation is enabled.
+
+    Generator functions are not supported: only the creation of the generator
+    would be timed.
+
+    input: function.
+    output: function.
+    """
+    name = f"{function.__module__}.{function.__qualname__}"
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if not _STATE.sinks:
+            return function(*args, **kwargs)
+        return _call(name, function, args, kwargs)
+
+    return wrapper
+
+
+def enable(*sinks, memory=False):
+    """Send the records of every instrumented call to the sinks.
+
+    A sink is any callable taking the record dict. ``memory=True`` also
+    records the peak memory allocated during each call, with tracemalloc,
+    which slows the pipeline down noticeably. The peak is process-wide, so
+    calls running concurrently on other threads are included in it.
+
+    input: callables, bool(optional).
+    """
+    if not sinks:
+        raise ValueError("At least one sink is required")
+    disable()
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        _STATE.started_tracemalloc = True
+    _STATE.trace_memory = memory
+    _STATE.sinks = tuple(sinks)
+
+
+def disable():
+    """Switch the instrumentation off."""
+    _STATE.sinks = ()
+    _STATE.trace_memory = False
+    if _STATE.started_tracemalloc:
+        tracemalloc.stop()
+        _STATE.started_tracemalloc = False
+
+
+@contextmanager
+def profiling(*sinks, memory=False):
+    """Enable the instrumentation inside a with block.
+
+    Without sinks, a MemorySink is created and returned.
+
+    input: callables, bool(optional).
+    output: the first sink.
+    """
+    sinks = sinks or (MemorySink(),)
+    enable(*sinks, memory=memory)
+    try:
+        yield sinks[0]
+    finally:
+        disable()
+
+
+class MemorySink:
+    """Keep the records in memory."""
+
+    def __init__(self):
+        """Initialize an empty list of records."""
+        self.records = []
+
+    def __call__(self, record):
+        """Store a record."""
+        self.records.append(record)
+
+    def to_frame(self):
+        """Records as a dataframe.
+
+        output: dataframe.
+        """
+        return pd.DataFrame(self.records)
+
+    def summary(self):
+        """Calls, total and maximum seconds of each function, slowest first.
+
+        output: dataframe.
+        """
+        frame = self.to_frame()
+        if frame.empty:
+            return frame
+        summary = frame.groupby("function")["seconds"].agg(["count", "sum", "max"])
+        return summary.sort_values("sum", ascending=False)
+
+
+class LogSink:
+    """Write each record to a logger, as JSON in the message and as ``extra``."""
+
+    def __init__(self, logger="fico.instrument", level=logging.INFO):
+        """Set the logger (or its name) and the level."""
+        if isinstance(logger, str):
+            logger = logging.getLogger(logger)
+        self.logger = logger
+        self.level = level
+
+    def __call__(self, record):
+        """Log a record."""
+        self.logger.log(
+            self.level,
+            "%s",
+            json.dumps(record),
+            extra={"fico": record},
+        )
+
+
+class JsonLinesSink:
+    """Append each record to a JSON lines file."""
+
+    def __init__(self, path):
+        """Set the file, created on the first record."""
+        self.path = Path(path)
+        self._lock = threading.Lock()
+
+    def __call__(self, record):
+        """Append a record."""
+        line = json.dumps(record) + "\n"
+        with self._lock, self.path.open("a") as file:
+            file.write(line)
@@ -0,0 +1,182 @@
+"""Provide a streaming evaluator for live portfolios.
+
+Classes:
+-------
+
+OnlineEvaluator:
+    Update the generate_signals portfolio and the algo_evaluation metrics one
+    bar at a time, in O(1) per bar.
+
+"""
+import json
+import math
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from fico.evaluation import METRICS
+
+
+class OnlineEvaluator:
+    """Stateful version of generate_signals and algo_evaluation.
+
+    Each new bar (close price and buy signal) updates holdings, cash and the
+    cumulative return, and the running mean, variance (Welford) and downside
+    sums used by the Sharpe and Sortino ratios. The state is a small dict, so
+    a restarted process can resume with from_dict / load instead of replaying
+    the history.
+    """
+
+    def __init__(self, start_capital=100000, share_count=2000, periods=252):
+        """Initialize the evaluator with the generate_signals parameters."""
+        self.start_capital = float(start_capital)
+        self.share_count = share_count
+        self.periods = periods
+        self.rows = 0
+        self.buy_signal = math.nan
+        self.shares = 0.0
+        self.cash_flow = 0.0
+        self.total = math.nan
+        self.growth = 1.0
+        self.cumulative_returns = math.nan
+        # Welford accumulators of the daily returns:
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        # Sum of the squared negative returns (Sortino):
+        self.downside = 0.0
+
+    def update(self, close, buy_signal):
+        """Add one bar.
+
+        input: float, float.
+        output: dict with the generate_signals columns of the new row.
+        """
+        close = float(close)
+        buy_signal = float(buy_signal)
+        # NaN on the first bar, and on the bars at or after a NaN signal:
+        entry_exit = buy_signal - self.buy_signal
+        entry_exit_position = self.share_count * entry_exit
+        self.rows += 1
+        self.buy_signal = buy_signal
+
+        # As the cumulative sums of batch_signals, NaN changes are skipped (no
+        # position change) and leave the bar without holdings or cash:
+        holdings = cash = math.nan
+        if not math.isnan(entry_exit_position):
+            self.shares += entry_exit_position
+            holdings = close * self.shares
+        cash_flow = close * entry_exit_position
+        if not math.isnan(cash_flow):
+            self.cash_flow += cash_flow
+            cash = self.start_capital - self.cash_flow
+        total = cash + holdings
+
+        # Daily return on the last known total (pct_change pads missing totals):
+        daily_return = math.nan
+        if not math.isnan(self.total):
+            if math.isnan(total):
+                daily_return = 0.0 if self.total else math.nan
+            else:
+                daily_return = total / self.total - 1 if self.total else math.inf
+        if not math.isnan(total):
+            self.total = total
+
+        cumulative = math.nan
+        if not math.isnan(daily_return):
+            self.growth *= 1 + daily_return
+            cumulative = self.growth - 1
+            self.cumulative_returns = cumulative
+            self.count += 1
+            delta = daily_return - self.mean
+            self.mean += delta / self.count
+            self.m2 += delta * (daily_return - self.mean)
+            if daily_return < 0:
+                self.downside += daily_return**2
+
+        return {
+            "Close": close,
+            "Buy Signal": buy_signal,
+            "Position": self.share_count * buy_signal,
+            "Entry/Exit": entry_exit,
+            "Entry/Exit Position": entry_exit_position,
+            "Portfolio Holdings": holdings,
+            "Portfolio Cash": cash,
+            "Portfolio Total": total,
+            "Portfolio Daily Returns": daily_return,
+            "Portfolio Cumulative Returns": cumulative,
+        }
+
+    def update_many(self, frame):
+        """Add a small batch of bars.
+
+        input: dataframe with Close and Buy Signal columns.
+        output: dataframe with the generate_signals columns of the new rows.
+        """
+        rows = [
+            self.update(close, buy_signal)
+            for close, buy_signal in zip(
+                frame["Close"].to_numpy(),
+                frame["Buy Signal"].to_numpy(),
+                strict=True,
+            )
+        ]
+        return pd.DataFrame(rows, index=frame.index)
+
+    def metrics(self):
+        """Current algo_evaluation metrics.
+
+        output: dataframe.
+        """
+        annual_return = self.mean * self.periods if self.count else math.nan
+        std = math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else math.nan
+        annual_volatility = std * math.sqrt(self.periods)
+        down_stdev = math.sqrt(self.downside / self.rows) if self.rows else math.nan
+        down_stdev *= math.sqrt(self.periods)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            values = [
+                annual_return,
+                self.cumulative_returns,
+                annual_volatility,
+                np.divide(annual_return, annual_volatility),
+                np.divide(annual_return, down_stdev),
+            ]
+        return pd.DataFrame({"Backtest": values}, index=METRICS, dtype=float)
+
+    def to_dict(self):
+        """Serializable state of the evaluator.
+
+        output: dict.
+        """
+        return dict(vars(self))
+
+    @classmethod
+    def from_dict(cls, state):
+        """Rebuild an evaluator from to_dict.
+
+        input: dict.
+        output: OnlineEvaluator.
+        """
+        evaluator = cls()
+        vars(evaluator).update(state)
+        return evaluator
+
+    def save(self, path):
+        """Write the state as json, atomically.
+
+        input: str or Path.
+        """
+        path = Path(path)
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        tmp.write_text(json.dumps(self.to_dict()))
+        tmp.replace(path)
+
+    @classmethod
+    def load(cls, path):
+        """Read an evaluator saved with save.
+
+        input: str or Path.
+        output: OnlineEvaluator.
+        """
+        return cls.from_dict(json.loads(Path(path).read_text()))
@@ -0,0 +1,298 @@
+"""Provide a memoized pipeline runner for the evaluation workflow.
+
+Each stage of a pipeline is a function of the outputs of other stages, of
+keyword parameters and, optionally, of source files. The output of every
+stage is cached on disk under a key hashing the function code, its
+parameters, the content of its source files and the keys of its inputs, so a
+change only recomputes the stages below it. Stages whose inputs are ready run
+concurrently, e.g. the branches of different tickers.
+
+Classes:
+-------
+
+Stage:
+    A named function with its inputs, source files and parameters.
+
+Pipeline:
+    Declaring stages and running them with on-disk memoization.
+
+Functions:
+---------
+
+stock_pipeline:
+    Declaring the build_factors_frame -> choose_stock -> process_stock ->
+    merge_portifolio -> split_data -> model -> generate_signals ->
+    algo_vs_underlying / trade_evaluation workflow for many tickers.
+
+"""
+import hashlib
+import inspect
+import json
+import pickle
+import re
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import partial
+from pathlib import Path
+
+from fico.cache import file_fingerprint
+from fico.evaluation import algo_vs_underlying, generate_signals, trade_evaluation
+from fico.portfolio import (
+    FACTOR_FILES,
+    FACTORS_DIR,
+    STOCKS_DIR,
+    build_factors_frame,
+    choose_stock,
+    merge_portifolio,
+    process_stock,
+    split_data,
+)
+
+PIPELINE_CACHE_DIR = "../data/.pipeline"
+
+# Columns the signal model must return (Returns is read by algo_vs_underlying):
+SIGNAL_COLUMNS = ["Close", "Returns", "Buy Signal"]
+
+
+def _function_token(function):
+    """Identify a function by its name and source code (arguments of partials)."""
+    if isinstance(function, partial):
+        return {
+            "function": _function_token(function.func),
+            "args": repr(function.args),
+            "keywords": repr(sorted(function.keywords.items())),
+        }
+    name = f"{function.__module__}.{function.__qualname__}"
+    try:
+        code = inspect.getsource(function)
+    except (OSError, TypeError):
+        code = getattr(getattr(function, "__code__", None), "co_code", b"").hex()
+    return {"name": name, "code": hashlib.sha256(code.encode()).hexdigest()}
+
+
+def _signals(predicted):
+    """Stage of stock_pipeline: check the signal model output, then simulate it."""
+    missing = [column for column in SIGNAL_COLUMNS if column not in predicted]
+    if missing:
+        raise ValueError(f"The signal model output lacks the columns {missing}")
+    return generate_signals(predicted)
+
+
+class Stage:
+    """A named function of the outputs of other stages."""
+
+    def __init__(self, name, function, inputs=(), sources=(), params=None):
+        """Store the stage definition.
+
+        ``function(*input_outputs, **params)`` computes the output; ``sources``
+        are the files it reads, whose content is part of the cache key.
+        """
+        self.name = name
+        self.function = function
+        self.inputs = tuple(inputs)
+        self.sources = tuple(Path(source) for source in sources)
+        self.params = dict(params or {})
+
+    def key(self, input_keys):
+        """Hash of the function, parameters, sources and input keys.
+
+        input: list of str.
+        output: str.
+        """
+        token = {
+            "function": _function_token(self.function),
+            "params": self.params,
+            "sources": [
+                file_fingerprint(source, content_hash=True) if source.exists() else None
+                for source in self.sources
+            ],
+            "inputs": list(input_keys),
+        }
+        text = json.dumps(token, sort_keys=True, default=str)
+        return hashlib.sha256(text.encode()).hexdigest()
+
+
+class Pipeline:
+    """Run stages with on-disk memoization and concurrent branches."""
+
+    def __init__(self, cache_dir=PIPELINE_CACHE_DIR, max_workers=None):
+        """Set the cache directory and the number of worker threads."""
+        self.cache_dir = Path(cache_dir)
+        self.max_workers = max_workers
+        self.stages = {}
+        # Status of every stage of the last run: "computed" or "cached".
+        self.last_run = {}
+
+    def add(self, name, function, inputs=(), sources=(), **params):
+        """Declare a stage; its inputs must already be declared.
+
+        input: str, callable, list of str(optional), list of paths(optional),
+            keyword parameters of the function.
+        output: str (the name, to be used as input of other stages).
+        """
+        if name in self.stages:
+            raise ValueError(f"Stage already declared: {name}")
+        missing = [stage for stage in inputs if stage not in self.stages]
+        if missing:
+            raise KeyError(f"Unknown input stages of {name}: {missing}")
+        self.stages[name] = Stage(name, function, inputs, sources, params)
+        return name
+
+    def keys(self):
+        """Cache key of every stage, from the sources down.
+
+        output: dict of str.
+        """
+        keys = {}
+        # Stages are declared after their inputs, so this is a topological order:
+        for name, stage in self.stages.items():
+            keys[name] = stage.key([keys[stage_input] for stage_input in stage.inputs])
+        return keys
+
+    def _cache_file(self, name, key):
+        return self.cache_dir / re.sub(r"[^\w.-]", "_", name) / f"{key}.pkl"
+
+    def _load(self, path):
+        with path.open("rb") as file:
+            return pickle.load(file)
+
+    def _compute(self, name, path, *inputs):
+        stage = self.stages[name]
+        output = stage.function(*inputs, **stage.params)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        with tmp.open("wb") as file:
+            pickle.dump(output, file, protocol=pickle.HIGHEST_PROTOCOL)
+        tmp.replace(path)
+        return output
+
+    def _plan(self, targets, keys, force):
+        """Stages to compute and stages to load from the cache."""
+        plan = {}
+
+        def visit(name):
+            if name in plan:
+                return
+            path = self._cache_file(name, keys[name])
+            if name not in force and path.exists():
+                plan[name] = "cached"
+                return
+            plan[name] = "computed"
+            for stage_input in self.stages[name].inputs:
+                visit(stage_input)
+
+        for target in targets:
+            visit(target)
+        return plan
+
+    def run(self, targets=None, force=()):
+        """Compute (or load) the target stages.
+
+        Only the missing stages above the targets are computed, and a cached
+        stage is not loaded unless a target or a recomputed stage needs it.
+        ``force`` lists stages to recompute, with the stages below them, even
+        when cached. The targets default to every stage that no other stage
+        uses.
+
+        input: list of str(optional), list of str(optional).
+        output: dict with the output of each target.
+        """
+        if targets is None:
+            used = {name for stage in self.stages.values() for name in stage.inputs}
+            targets = [name for name in self.stages if name not in used]
+        unknown = [name for name in [*targets, *force] if name not in self.stages]
+        if unknown:
+            raise KeyError(f"Unknown stages: {unknown}")
+        # A forced stage also invalidates every stage below it:
+        force = set(force)
+        for name, stage in self.stages.items():
+            if force.intersection(stage.inputs):
+                force.add(name)
+        keys = self.keys()
+        plan = self._plan(targets, keys, force)
+        outputs = {}
+        pending = dict(plan)
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            while pending or running:
+                for name, status in list(pending.items()):
+                    path = self._cache_file(name, keys[name])
+                    if status == "cached":
+                        running[pool.submit(self._load, path)] = name
+                    elif all(stage in outputs for stage in self.stages[name].inputs):
+                        inputs = [outputs[stage] for stage in self.stages[name].inputs]
+                        running[pool.submit(self._compute, name, path, *inputs)] = name
+                    else:
+                        continue
+                    del pending[name]
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    outputs[running.pop(future)] = future.result()
+        self.last_run = plan
+        return {name: outputs[name] for name in targets}
+
+    def prune(self):
+        """Delete the cache files that no longer match any stage key.
+
+        output: int (number of deleted files).
+        """
+        current = {self._cache_file(name, key) for name, key in self.keys().items()}
+        deleted = 0
+        for path in self.cache_dir.glob("*/*.pkl"):
+            if path not in current:
+                path.unlink()
+                deleted += 1
+        return deleted
+
+
+def stock_pipeline(  # noqa: PLR0913
+    tickers,
+    signal_model,
+    *,
+    cache_dir=PIPELINE_CACHE_DIR,
+    factors_dir=FACTORS_DIR,
+    stocks_dir=STOCKS_DIR,
+    rate=0.8,
+    max_workers=None,
+):
+    """Declare the evaluation workflow of every ticker.
+
+    ``signal_model`` receives the (X_train, X_test, y_train, y_test,
+    close_test) tuple of split_data and returns a dataframe with the Close,
+    Returns (y_test) and Buy Signal columns of the test dates, like the
+    tutorial notebook; a missing column raises a ValueError. Its source code
+    is part of the cache key, so editing it recomputes the stages below it
+    only. The stages of a ticker are named "<stage>/<ticker>":
+    "stock", "processed", "merged", "split", "predicted", "signals",
+    "vs_underlying" and "trades"; the shared factors stage is "factors".
+
+    input: list of str, callable, str(optional), str(optional), str(optional),
+        float(optional), int(optional).
+    output: Pipeline.
+    """
+    pipeline = Pipeline(cache_dir, max_workers=max_workers)
+    factors = pipeline.add(
+        "factors",
+        build_factors_frame,
+        sources=[Path(factors_dir) / file_name for file_name in FACTOR_FILES.values()],
+        factors_dir=str(factors_dir),
+    )
+    for ticker in tickers:
+        stock = pipeline.add(
+            f"stock/{ticker}",
+            choose_stock,
+            sources=[Path(stocks_dir) / f"{ticker}.csv"],
+            ticker=ticker,
+            stocks_dir=str(stocks_dir),
+        )
+        processed = pipeline.add(f"processed/{ticker}", process_stock, [stock])
+        merged = pipeline.add(
+            f"merged/{ticker}",
+            merge_portifolio,
+            [processed, factors],
+        )
+        split = pipeline.add(f"split/{ticker}", split_data, [merged], rate=rate)
+        predicted = pipeline.add(f"predicted/{ticker}", signal_model, [split])
+        signals = pipeline.add(f"signals/{ticker}", _signals, [predicted])
+        pipeline.add(f"vs_underlying/{ticker}", algo_vs_underlying, [signals])
+        pipeline.add(f"trades/{ticker}", trade_evaluation, [signals])
+    return pipeline
@@ -9,12 +9,27 @@ build_factors_frame:
 pre_processing:
     Pre-processing the Factors dataframe.
 
+format_dates:
+    Formatting a datetime index as strings before exporting.
+
+as_datetime_index:
+    Parsing a "%Y/%m/%d" string index back into a DatetimeIndex.
+
 choose_stock:
     Choosing the stock to be evaluated.
 
 process_stock:
     Processing the stock to be evaluated.
 
+load_stock_panel:
+    Loading many stocks in parallel into a single (date x ticker) panel.
+
+build_stock_store:
+    Ingesting the stock csv files into a memory-mapped panel store.
+
+update_stock_store:
+    Appending only the new rows of the stock csv files to the panel store.
+
 analyse_stock:
     Analysing the stock to be evaluated.
 
@@ -24,79 +39,251 @@ merge_portifolio:
 portfolio_build:
     Building the portfolio.
 
+Portifolio.build_factors:
+    Building the market, size and long-short factor returns from the
+    cross-section, with 2x3 value-weighted sorts.
+
 split_data:
     Splitting the data into train and test.
 
+walk_forward_split:
+    Splitting the data into rolling or expanding walk-forward folds.
+
+rank_legs:
+    Selecting the top-k and bottom-k stocks of each date.
+
 """
 # Importing libraries:
 
+import hashlib
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
 
 import numpy as np
 import pandas as pd
-import seaborn as sns
-
 
-def build_factors_frame():
-    """Creating a dataframe with all factors. Concatenating all factors.
+from fico.cache import cached_frame, file_fingerprint, parquet_available
+from fico.instrument import instrument
+from fico.store import open_store, write_store
+
+FACTORS_DIR = "../data/risk_factors"
+STOCKS_DIR = "../data/stocks"
+# Memory-mapped panel store of the stock csv files, inside STOCKS_DIR:
+STORE_DIR_NAME = ".panel"
+# Bytes before the ingested end of a source file checked before appending:
+TAIL_CHECK_BYTES = 4096
+
+# Numeric columns of the stock csv files (written with decimal comma):
+STOCK_NUMERIC_COLUMNS = [
+    "fech_ajustado",
+    "variacao(pct)",
+    "fech_historico",
+    "abertura_ajustado",
+    "min_ajustado",
+    "medio_ajustado",
+    "max_ajustado",
+    "vol_(mm_r$)",
+    "negocios",
+    "fator",
+    "quant_em_aluguel",
+    "vol_em_aluguel(mm_r$)",
+]
+
+# Columns of the stock csv files used by process_stock:
+PROCESS_COLUMNS = ["fech_ajustado", "variacao(pct)"]
+
+# Characteristic sorts of Portifolio.build_factors: factor -> (column, whether
+# the long leg holds the high values):
+FACTOR_SORTS = {
+    # High minus low book-to-market - Value Factor
+    "hml": ("book_to_market", True),
+    # Winners minus losers - Momentum Factor
+    "wml": ("ret12m", True),
+}
+
+# Format of the date strings used as index when not working with datetimes:
+DATE_FORMAT = "%Y/%m/%d"
+
+# Source file of each factor, in the column order of the factors dataframe:
+FACTOR_FILES = {
+    # Rm - Market Factor
+    "mkt": "Market_Factor.xls",
+    # High minus low - Value Factor
+    "hml": "HML_Factor.xls",
+    # Illiquid Minus Liquid - Liquidity Factor
+    "iml": "IML_Factor.xls",
+    # Small minus big - Size Factor
+    "smb": "SMB_Factor.xls",
+    # Winners Minus Loser - Momentum Factor
+    "wml": "WML_Factor.xls",
+    # Daily Risk Free - rf
+    "rf": "Risk_Free.xls",
+}
 
-    Date is the index.
 
-    Creating a csv file with all factors.
+def _read_factor(path):
+    """Parse and pre-process a single factor .xls file."""
+    return pre_processing(pd.read_excel(path, index_col=None), as_datetime=True)
 
-    return: factors dataframe.
-    """
-    # Rm - Market Factor
-    mkt = pd.read_excel("../data/risk_factors/Market_Factor.xls", index_col=None)
 
-    # High minus low - Value Factor
-    hml = pd.read_excel("../data/risk_factors/HML_Factor.xls", index_col=None)
+@instrument
+def build_factors_frame(
+    factors_dir=FACTORS_DIR,
+    use_cache=True,
+    content_hash=False,
+    as_datetime=False,
+):
+    """Creating a dataframe with all factors. Concatenating all factors.
 
-    # Illiquid Minus Liquid - Liquidity Factor
-    iml = pd.read_excel("../data/risk_factors/IML_Factor.xls", index_col=None)
+    Date is the index. With ``as_datetime=True`` the index is kept as a native
+    DatetimeIndex, otherwise it is formatted as "%Y/%m/%d" strings.
 
-    # Small minus big - Size Factor
-    smb = pd.read_excel("../data/risk_factors/SMB_Factor.xls", index_col=None)
+    Each parsed factor is kept in a binary columnar cache inside
+    ``factors_dir/.cache``, so only the .xls files whose modification time and
+    size (or content, with ``content_hash=True``) changed are parsed again.
 
-    # Winners Minus Loser - Momentum Factor
-    wml = pd.read_excel("../data/risk_factors/WML_Factor.xls", index_col=None)
+    Creating a csv file with all factors whenever a factor was parsed again.
+    With the cache, only the dates after the last row of the existing csv file
+    are appended to it, as long as that row did not change.
 
-    # Daily Risk Free - rf
-    rf = pd.read_excel("../data/risk_factors/Risk_Free.xls", index_col=None)
-    # Pre-processing:
-    hml = pre_processing(hml)
-    mkt = pre_processing(mkt)
-    iml = pre_processing(iml)
-    smb = pre_processing(smb)
-    wml = pre_processing(wml)
-    rf = pre_processing(rf)
+    input: str(optional), bool(optional), bool(optional), bool(optional).
+    return: factors dataframe.
+    """
+    factors_dir = Path(factors_dir)
+    cache_dir = factors_dir / ".cache"
+    frames = []
+    parsed = False
+    for key, file_name in FACTOR_FILES.items():
+        if use_cache:
+            frame, missed = cached_frame(
+                factors_dir / file_name,
+                _read_factor,
+                cache_dir,
+                key=key,
+                content_hash=content_hash,
+            )
+        else:
+            frame, missed = _read_factor(factors_dir / file_name), True
+        frames.append(frame)
+        parsed = parsed or missed
     # Concatenate all factors:
-    factors = pd.concat([mkt, hml, iml, smb, wml, rf], axis=1)
+    factors = pd.concat(frames, axis=1)
     # Save to csv:
-    factors.to_csv("../data/risk_factors/factors.csv", index=True)
+    csv_path = factors_dir / "factors.csv"
+    if not use_cache or not csv_path.exists():
+        factors.to_csv(csv_path, index=True, date_format=DATE_FORMAT)
+    elif parsed:
+        _update_factors_csv(factors, csv_path)
+    if not as_datetime:
+        factors = format_dates(factors)
     return factors
 
 
-def pre_processing(raw_factor):
+def _last_line(path):
+    """Last non-empty line of a text file, read from the end."""
+    with Path(path).open("rb") as source:
+        size = source.seek(0, os.SEEK_END)
+        source.seek(max(0, size - TAIL_CHECK_BYTES))
+        lines = source.read().splitlines()
+    lines = [line for line in lines if line.strip()]
+    return lines[-1].decode() if lines else ""
+
+
+def _update_factors_csv(factors, csv_path):
+    """Append the new dates to factors.csv, rewriting it if its last row changed."""
+    last_line = _last_line(csv_path)
+    try:
+        last_date = pd.to_datetime(last_line.split(",")[0], format=DATE_FORMAT)
+        position = factors.index.get_loc(last_date)
+    except (ValueError, KeyError):
+        position = None
+    if position is not None:
+        last_row = factors.iloc[[position]].to_csv(
+            header=False,
+            date_format=DATE_FORMAT,
+        )
+        if last_row.strip() == last_line.strip():
+            new_rows = factors.iloc[position + 1 :]
+            if len(new_rows):
+                _append_text(
+                    csv_path,
+                    new_rows.to_csv(header=False, date_format=DATE_FORMAT),
+                )
+            return
+    factors.to_csv(csv_path, index=True, date_format=DATE_FORMAT)
+
+
+def _append_text(path, text):
+    """Append text to a file, truncating it back if the write fails."""
+    with Path(path).open("a", newline="") as file:
+        start = file.tell()
+        try:
+            file.write(text)
+            file.flush()
+            os.fsync(file.fileno())
+        except BaseException:
+            file.truncate(start)
+            raise
+
+
+@instrument
+def pre_processing(raw_factor, as_datetime=False):
     """Steps made before the data is ready to be consumed.
 
     No calculation or transformation is made.
-    input: dataframe
+    input: dataframe, bool(optional)
     output:dateframe.
     """
     # Convert the "year," "month," and "date" columns to datetime format
     raw_factor["date"] = pd.to_datetime(raw_factor[["year", "month", "day"]])
 
     # Format the "date" column to the desired format
-    raw_factor["date"] = raw_factor["date"].dt.strftime("%Y/%m/%d")
+    if not as_datetime:
+        raw_factor["date"] = raw_factor["date"].dt.strftime(DATE_FORMAT)
     raw_factor = raw_factor.drop(["year", "month", "day"], axis=1)
     raw_factor = raw_factor.set_index("date")
     return raw_factor
 
 
-def choose_stock(ticker):
+@instrument
+def format_dates(frame, date_format=DATE_FORMAT):
+    """Format a DatetimeIndex as strings, only needed when exporting.
+
+    Frames whose index is not a DatetimeIndex are returned unchanged.
+
+    input: dataframe, str(optional)
+    output: dataframe.
+    """
+    if not isinstance(frame.index, pd.DatetimeIndex):
+        return frame
+    frame = frame.copy(deep=False)
+    frame.index = pd.Index(frame.index.strftime(date_format), name=frame.index.name)
+    return frame
+
+
+@instrument
+def choose_stock(
+    ticker,
+    as_datetime=False,
+    stocks_dir=STOCKS_DIR,
+    columns=None,
+    use_store=True,
+):
     """Read and store ticker information.
 
+    With ``as_datetime=True`` the date index is kept as a DatetimeIndex,
+    otherwise it is formatted as "%Y/%m/%d" strings.
+
+    ``columns`` restricts the columns read from the file, e.g.
+    ``PROCESS_COLUMNS`` when only process_stock will consume the result.
+    The file is parsed once, with the pyarrow engine when it is installed.
+
+    When build_stock_store has ingested the csv file, and the file has not
+    changed since, the rows are read from the memory-mapped store instead
+    (disable with ``use_store=False``).
+
     'data': Date in format: 'dd/mm/yyyy',
 
     'fech_ajustado': Close price adjusted for splits and dividends,
@@ -128,44 +315,86 @@ def choose_stock(ticker):
     output:dataframe.
 
     """
-    file_path = f"../data/stocks/{ticker}.csv"
-    # verifu if file_path exists:
-    file_path = Path(file_path)
-    if file_path.exists():
-        stock = pd.read_csv(file_path, index_col=None)
-    else:
+    file_path = Path(stocks_dir) / f"{ticker}.csv"
+    if use_store:
+        stock = _stock_from_store(ticker, file_path, columns)
+        if stock is not None:
+            return stock if as_datetime else format_dates(stock)
+    try:
+        stock = _parse_stock(file_path, columns)
+    except FileNotFoundError:
         print("File not found")
         return pd.DataFrame()
-
-    stock = pd.read_csv(f"../data/stocks/{ticker}.csv", index_col=None)
-    # Convert datetime column to desired format
-    # print(stock.columns)
+    return stock if as_datetime else format_dates(stock)
+
+
+def _parse_stock(source, columns=None):
+    """Parse a stock csv file (or buffer) with a DatetimeIndex named date."""
+    if columns is not None:
+        columns = ["data", *columns]
+    # Single pass: decimal comma, "nd" markers and dates are handled by the parser
+    # (empty cells stay NaN, as with the default NA handling):
+    stock = pd.read_csv(
+        source,
+        index_col=None,
+        usecols=columns,
+        decimal=",",
+        na_values=["nd"],
+        dtype=dict.fromkeys(STOCK_NUMERIC_COLUMNS, "float64"),
+        engine="pyarrow" if parquet_available() else "c",
+    )
     stock = stock.rename(columns={"data": "date"})
     stock["date"] = pd.to_datetime(stock["date"], format="%d/%m/%Y")
-    stock["date"] = stock["date"].dt.strftime("%Y/%m/%d")
-    # transform all nd to NaN:
-    stock = stock.replace("nd", np.nan)
-    # all columns to float64, except date and type:
-    columns_to_convert = [
-        "fech_ajustado",
-        "variacao(pct)",
-        "fech_historico",
-        "abertura_ajustado",
-        "min_ajustado",
-        "medio_ajustado",
-        "max_ajustado",
-        "vol_(mm_r$)",
-        "negocios",
-        "fator",
-        "quant_em_aluguel",
-        "vol_em_aluguel(mm_r$)",
-    ]
-    stock[columns_to_convert] = stock[columns_to_convert].replace(",", ".", regex=True)
-    stock[columns_to_convert] = stock[columns_to_convert].astype(float)
-    stock = stock.set_index("date")
-    return stock
+    # The pyarrow engine gives None for empty text cells, the C engine NaN:
+    for column in stock.columns[stock.dtypes == "object"].drop("date", errors="ignore"):
+        stock[column] = stock[column].where(stock[column].notna(), np.nan)
+    return stock.set_index("date")
+
+
+def _source_offset(path, size):
+    """Ingested size of a source file and a digest of the bytes before it."""
+    with Path(path).open("rb") as source:
+        start = source.seek(max(0, size - TAIL_CHECK_BYTES))
+        before = source.read(size - start)
+    return {"size": size, "tail": hashlib.sha256(before).hexdigest()}
 
 
+def _read_stock_tail(file_path, offset):
+    """Parse the rows appended to a stock csv file since it was ingested.
+
+    output: dataframe, new offset, bool (False when a partial last line was
+    left for later), or None when the file was not just appended to.
+    """
+    size = file_path.stat().st_size
+    if offset is None or size < offset["size"]:
+        return None
+    if _source_offset(file_path, offset["size"]) != offset:
+        return None
+    with file_path.open("rb") as source:
+        header = source.readline()
+        source.seek(offset["size"])
+        data = source.read(size - offset["size"])
+    # Complete lines only:
+    end = data.rfind(b"\n") + 1
+    stock = _parse_stock(io.BytesIO(header + data[:end]))
+    return stock, _source_offset(file_path, offset["size"] + end), end == len(data)
+
+
+def _stock_from_store(ticker, file_path, columns):
+    """Read a ticker from the store of its directory, None if missing or stale."""
+    store = open_store(file_path.parent / STORE_DIR_NAME)
+    if store is None or ticker not in store:
+        return None
+    try:
+        fingerprint = file_fingerprint(file_path)
+    except FileNotFoundError:
+        return None
+    if not store.is_fresh(ticker, fingerprint):
+        return None
+    return store.stock(ticker, columns=columns)
+
+
+@instrument
 def process_stock(frame):
     """Process the stock dataframe to be ready to be consumed.
 
@@ -173,8 +402,7 @@ def process_stock(frame):
     output:dataframe.
     """
     # Selecting columns to keep:
-    column_to_keep = ["fech_ajustado", "variacao(pct)"]
-    frame = frame.loc[:, column_to_keep]
+    frame = frame.loc[:, PROCESS_COLUMNS]
     # Renaming to Close and Returns:
     frame = frame.rename(columns={"fech_ajustado": "Close", "variacao(pct)": "Returns"})
     # dropna:
@@ -183,22 +411,195 @@ def process_stock(frame):
     return frame
 
 
+def _load_stock(ticker, as_datetime, stocks_dir, processed):
+    """Worker of load_stock_panel: read (and process) a single ticker."""
+    stock = choose_stock(
+        ticker,
+        as_datetime=as_datetime,
+        stocks_dir=stocks_dir,
+        columns=PROCESS_COLUMNS if processed else None,
+    )
+    return process_stock(stock) if processed else stock
+
+
+@instrument
+def load_stock_panel(  # noqa: PLR0913
+    tickers,
+    as_datetime=False,
+    *,
+    stocks_dir=STOCKS_DIR,
+    processed=True,
+    max_workers=None,
+    use_processes=True,
+):
+    """Load many tickers in parallel and align them into a single panel.
+
+    The csv files are parsed on a process pool (or a thread pool with
+    ``use_processes=False``). The result has one column per (field, ticker)
+    pair, so ``panel["Close"]`` is a (date x ticker) frame. Dates missing for
+    some ticker are filled with NaN.
+
+    With ``processed=True`` the fields are the ones of process_stock (Close and
+    Returns), otherwise all the columns of choose_stock are kept.
+
+    input: list of str, bool(optional), str(optional), bool(optional),
+        int(optional), bool(optional).
+    output: dataframe with (field, ticker) columns, list of missing tickers.
+    """
+    stocks_dir = Path(stocks_dir)
+    tickers = list(dict.fromkeys(tickers))
+    missing = [t for t in tickers if not (stocks_dir / f"{t}.csv").exists()]
+    found = [t for t in tickers if t not in missing]
+    if not found:
+        return pd.DataFrame(), missing
+
+    workers = max_workers or os.cpu_count() or 1
+    executor_class = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+    with executor_class(max_workers=workers) as executor:
+        frames = list(
+            executor.map(
+                _load_stock,
+                found,
+                [as_datetime] * len(found),
+                [stocks_dir] * len(found),
+                [processed] * len(found),
+                chunksize=max(1, len(found) // (4 * workers)),
+            ),
+        )
+
+    panel = pd.concat(frames, axis="columns", keys=found, names=["ticker", "field"])
+    panel = panel.swaplevel(axis="columns").sort_index(axis="columns", level=0)
+    return panel.sort_index(), missing
+
+
+@instrument
+def build_stock_store(
+    stocks_dir=STOCKS_DIR,
+    tickers=None,
+    max_workers=None,
+    use_processes=True,
+):
+    """Ingest the stock csv files into a memory-mapped panel store.
+
+    The csv files (all of ``stocks_dir`` by default) are parsed once on a
+    process pool and written as one (date x ticker) array per column inside
+    ``stocks_dir/.panel``. From then on choose_stock reads the tickers whose
+    csv file did not change from the store, and ``store.frame("fech_ajustado")``
+    gives the close prices of the whole universe without parsing anything.
+
+    input: str(optional), list of str(optional), int(optional), bool(optional).
+    output: PanelStore.
+    """
+    stocks_dir = Path(stocks_dir)
+    if tickers is None:
+        tickers = sorted(path.stem for path in stocks_dir.glob("*.csv"))
+    fingerprints = {t: file_fingerprint(stocks_dir / f"{t}.csv") for t in tickers}
+    offsets = {
+        t: _source_offset(stocks_dir / f"{t}.csv", fingerprints[t]["size"])
+        for t in tickers
+    }
+    workers = max_workers or os.cpu_count() or 1
+    executor_class = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+    with executor_class(max_workers=workers) as executor:
+        frames = executor.map(
+            _load_stock,
+            tickers,
+            [True] * len(tickers),
+            [stocks_dir] * len(tickers),
+            [False] * len(tickers),
+            chunksize=max(1, len(tickers) // (4 * workers)),
+        )
+        frames = dict(zip(tickers, frames, strict=True))
+    return write_store(stocks_dir / STORE_DIR_NAME, frames, fingerprints, offsets)
+
+
+@instrument
+def update_stock_store(stocks_dir=STOCKS_DIR, max_tail_rows=250, max_workers=None):
+    """Append the new rows of the stock csv files to the panel store.
+
+    Only the bytes added to each csv file since it was ingested are parsed:
+    the store records the ingested size of every file and a digest of the
+    bytes before it, so a file that was rewritten rather than appended to (e.g.
+    prices adjusted for a dividend) is reported as stale and read from its csv
+    file by choose_stock until the next rebuild. The new rows go to the tail
+    segment of the store; the other tickers keep their fingerprints, so only
+    the updated ones are invalidated downstream.
+
+    Once the tail holds more than ``max_tail_rows`` dates, the store is rebuilt
+    (from the store itself for the unchanged tickers), which also ingests the
+    new csv files. Without a store, the store is built.
+
+    input: str(optional), int(optional), int(optional).
+    output: dict with the "appended", "stale" and "new" lists of tickers.
+    """
+    stocks_dir = Path(stocks_dir)
+    on_disk = sorted(path.stem for path in stocks_dir.glob("*.csv"))
+    store = open_store(stocks_dir / STORE_DIR_NAME)
+    if store is None:
+        build_stock_store(stocks_dir, on_disk, max_workers=max_workers)
+        return {"appended": [], "stale": [], "new": on_disk}
+
+    base_rows = store.segments[0][1]
+    frames, fingerprints, offsets, stale = {}, {}, {}, []
+    for ticker in store.tickers:
+        file_path = stocks_dir / f"{ticker}.csv"
+        try:
+            fingerprint = file_fingerprint(file_path)
+        except FileNotFoundError:
+            continue
+        if store.is_fresh(ticker, fingerprint):
+            continue
+        tail = _read_stock_tail(file_path, store.offsets.get(ticker))
+        if tail is None or (
+            base_rows
+            and len(tail[0])
+            and tail[0].index.min() <= store.dates[base_rows - 1]
+        ):
+            stale.append(ticker)
+            continue
+        frames[ticker], offsets[ticker], complete = tail
+        if complete:
+            fingerprints[ticker] = fingerprint
+    new = [ticker for ticker in on_disk if ticker not in store]
+    if frames:
+        store = store.append(frames, fingerprints, offsets)
+        if len(store.dates) - store.segments[0][1] > max_tail_rows:
+            build_stock_store(stocks_dir, on_disk, max_workers=max_workers)
+    return {"appended": sorted(frames), "stale": stale, "new": new}
+
+
+@instrument
 def analyse_stock(stock_data):
     """input: Dataframe.
 
     output:None, Stdout: Multiple Plots.
     """
+    # seaborn (and matplotlib) are only imported when plotting:
+    try:
+        import seaborn as sns
+    except ImportError as error:
+        raise ImportError("analyse_stock requires seaborn to be installed") from error
     sns.lineplot(data=stock_data, x="Data", y="Returns")
 
 
+@instrument
 def merge_portifolio(portfolio, factors):
     """input: dataframe,dataframe.
 
     Generate a single portfolio that contains all Factors columns
     in addiction to the portfolio value weighted returns
 
+    Both frames must use the same kind of index: either "%Y/%m/%d" strings or
+    a DatetimeIndex (faster to align). A mix of both is aligned on datetimes.
+
     output: dataframe.
     """
+    if isinstance(factors.index, pd.DatetimeIndex) != isinstance(
+        portfolio.index,
+        pd.DatetimeIndex,
+    ):
+        factors = as_datetime_index(factors)
+        portfolio = as_datetime_index(portfolio)
     combined_df = pd.concat([factors, portfolio], axis="columns", join="inner")
     combined_df = combined_df.dropna()
     combined_df = combined_df.drop("Risk_free", axis=1)
@@ -206,6 +607,26 @@ def merge_portifolio(portfolio, factors):
     return combined_df
 
 
+def as_datetime_index(frame):
+    """Parse a "%Y/%m/%d" string index into a DatetimeIndex.
+
+    The inverse of format_dates: frames already indexed by dates are
+    returned unchanged.
+
+    input: dataframe.
+    output: dataframe.
+    """
+    if isinstance(frame.index, pd.DatetimeIndex):
+        return frame
+    frame = frame.copy(deep=False)
+    frame.index = pd.DatetimeIndex(
+        pd.to_datetime(frame.index, format=DATE_FORMAT),
+        name=frame.index.name,
+    )
+    return frame
+
+
+@instrument
 def split_data(data, rate=0.8):
     """input: dataframe, float.
 
@@ -214,19 +635,131 @@ def split_data(data, rate=0.8):
     output: X_train, X_test, y_train, y_test,close_test.
     """
     # Define X and y variables:
-    x = data.drop("Returns", axis=1)
-    x = x.drop("Close", axis=1)
-    y = data.loc[:, "Returns"]
+    x, y, close = _features(data)
     # Split into Training/Testing Data:
     split = int(rate * len(x))
     x_train = x[:split]
     x_test = x[split:]
     y_train = y[:split]
     y_test = y[split:]
-    close_test = data["Close"][split:]
+    close_test = close[split:]
     return x_train, x_test, y_train, y_test, close_test
 
 
+def _features(data):
+    """Split the merged frame into X, y and Close with a single column selection."""
+    features = [column for column in data.columns if column not in ("Returns", "Close")]
+    return data[features], data["Returns"], data["Close"]
+
+
+def walk_forward_folds(  # noqa: PLR0913
+    n_rows,
+    train_size,
+    test_size,
+    *,
+    step=None,
+    embargo=0,
+    expanding=False,
+):
+    """Generate the row ranges of walk-forward train/test folds.
+
+    Each fold trains on ``train_size`` rows (all the rows since the start with
+    ``expanding=True``), skips ``embargo`` rows and tests on the next
+    ``test_size`` rows. Folds move forward by ``step`` rows (default
+    ``test_size``).
+
+    input: int, int, int, int(optional), int(optional), bool(optional).
+    output: generator of (train slice, test slice).
+    """
+    step = step or test_size
+    if min(train_size, test_size, step) <= 0 or embargo < 0:
+        raise ValueError(
+            "train_size, test_size and step must be positive, embargo non-negative",
+        )
+    train_end = train_size
+    while train_end + embargo + test_size <= n_rows:
+        train_start = 0 if expanding else train_end - train_size
+        test_start = train_end + embargo
+        yield slice(train_start, train_end), slice(test_start, test_start + test_size)
+        train_end += step
+
+
+def walk_forward_split(  # noqa: PLR0913
+    data,
+    train_size,
+    test_size,
+    *,
+    step=None,
+    embargo=0,
+    expanding=False,
+):
+    """Walk-forward version of split_data.
+
+    X, y and Close are selected once and every fold is a positional slice of
+    them, so the features are shared across folds instead of copied.
+
+    input: dataframe, int, int, int(optional), int(optional), bool(optional).
+    output: generator of (X_train, X_test, y_train, y_test, close_test).
+    """
+    x, y, close = _features(data)
+    for train, test in walk_forward_folds(
+        len(data),
+        train_size,
+        test_size,
+        step=step,
+        embargo=embargo,
+        expanding=expanding,
+    ):
+        yield x.iloc[train], x.iloc[test], y.iloc[train], y.iloc[test], close.iloc[test]
+
+
+@instrument
+def rank_legs(frame, column, k=8, by="date"):
+    """Select the k largest and the k smallest rows of each date at once.
+
+    Same selection as ``groupby(by).apply(lambda x: x.nlargest(k, column))``
+    (and nsmallest), ties kept in their original order and NaN values skipped,
+    but computed with one sort over the whole frame instead of a Python call
+    per date.
+
+    input: dataframe, str, int(optional), str(optional).
+    output: dataframe (top leg), dataframe (bottom leg), sorted by date and
+    ranking value.
+    """
+    values = frame[column].to_numpy(dtype=float)
+    groups = pd.factorize(frame[by], sort=True)[0]
+    rows = np.flatnonzero(~np.isnan(values) & (groups >= 0))
+    groups = groups[rows]
+    values = values[rows]
+
+    def leg(keys):
+        # Sort by date, then by value, ties broken by the original position:
+        order = np.lexsort((rows, keys, groups))
+        sorted_groups = groups[order]
+        starts = np.flatnonzero(np.r_[True, sorted_groups[1:] != sorted_groups[:-1]])
+        sizes = np.diff(np.r_[starts, len(order)])
+        rank = np.arange(len(order)) - np.repeat(starts, sizes)
+        return frame.iloc[rows[order[rank < k]]]
+
+    return leg(-values), leg(values)
+
+
+def _sort_buckets(values, groups, breakpoints):
+    """Bucket of each value among the values of its group (0 = lowest).
+
+    ``breakpoints`` are percentiles, e.g. (0.3, 0.7) for terciles 30/40/30.
+    """
+    percentile = pd.Series(values).groupby(groups).rank(pct=True).to_numpy()
+    return np.searchsorted(breakpoints, percentile)
+
+
+def _weighted_means(keys, n_keys, values, weights):
+    """Weighted mean of the values of each key (NaN for empty keys)."""
+    total = np.bincount(keys, weights, minlength=n_keys)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.bincount(keys, weights * values, minlength=n_keys) / total
+
+
 class Portifolio:
     """Class to handle the portfolio.
 
@@ -247,16 +780,31 @@ class Portifolio:
         # 'volatilidade_anualizada1_mes', 'ev', 'valor_de_mercado']
         self.frame = dataframe
 
-    def pre_processing(self):
+    def memory_usage(self):
+        """Memory footprint of the frame in bytes, object strings included.
+
+        output: int.
+        """
+        return int(self.frame.memory_usage(deep=True).sum())
+
+    @instrument
+    def pre_processing(self, compact=False):
         """Preprocess the frame to enable the analysis.
 
         change the columns types and names.
         also fill the missing values with 0
 
+        The cleaning works column by column, so the full frame is copied only
+        once, when the outlier rows are removed. With ``compact=True`` tickers
+        and names are stored as categoricals and numeric columns as float32.
+        The memory footprint before and after is kept in ``memory_before`` and
+        ``memory_after``.
+
         """
+        self.memory_before = self.memory_usage()
         self.frame["data_da_analise"] = pd.to_datetime(self.frame["data_da_analise"])
         self.frame["ticker"] = self.frame["ticker"].astype(str)
-        # renomear as colunas:
+        # renomear as colunas (sem copiar os dados):
         self.frame = self.frame.rename(
             columns={
                 "data_da_analise": "date",
@@ -277,10 +825,13 @@ class Portifolio:
                 "ev": "entreprise_value",
                 "preco_de_fechamento": "closed_price",
             },
+            copy=False,
         )
 
-        # transforma valores [] em NaN:
-        self.frame = self.frame.replace("[]", np.nan)
+        # transforma valores [] em NaN (only text columns can hold them):
+        for column in self.frame.columns[self.frame.dtypes == "object"]:
+            if (self.frame[column] == "[]").any():
+                self.frame[column] = self.frame[column].replace("[]", np.nan)
         # Remove commas from numeric columns and convert them to numeric values
         self.numeric_columns = [
             "net_worth",
@@ -306,55 +857,64 @@ class Portifolio:
                 self.frame[column] = (
                     self.frame[column].str.replace(",", ".").astype(float)
                 )
-        # replace NaNs with 0:
-        # remover 'date' = 2005-12-29 'ticker': 'ARCE3' -> due to outlier from data
-        # provider:
-        self.frame = self.frame.loc[
-            ~((self.frame["date"] == "2005-12-29") & (self.frame["ticker"] == "ARCE3"))
-        ]
-        self.frame = self.frame.loc[
-            ~((self.frame["date"] == "2004-12-30") & (self.frame["ticker"] == "ACES4"))
-        ]
-        self.frame = self.frame.fillna(0)
+        # remover 'date' = 2005-12-29 'ticker': 'ARCE3' and 'date' = 2004-12-30
+        # 'ticker': 'ACES4' -> due to outlier from data provider:
+        keep = ~(
+            (self.frame["date"] == "2005-12-29") & (self.frame["ticker"] == "ARCE3")
+        )
+        keep &= ~(
+            (self.frame["date"] == "2004-12-30") & (self.frame["ticker"] == "ACES4")
+        )
         # outliers:
-        self.frame = self.frame.drop(index=[1151, 963, 964, 990, 579, 883, 868, 274])
+        outliers = [1151, 963, 964, 990, 579, 883, 868, 274]
+        missing = [label for label in outliers if label not in self.frame.index[keep]]
+        if missing:
+            raise KeyError(f"{missing} not found in axis")
+        keep &= ~self.frame.index.isin(outliers)
+        self.frame = self.frame.loc[keep]
+        # replace NaNs with 0:
+        for column in self.frame.columns[self.frame.isna().any()]:
+            self.frame[column] = self.frame[column].fillna(0)
+        if compact:
+            self._compact()
+        self.memory_after = self.memory_usage()
         return self.frame
 
-    def build_momentum_portfolio(self):
+    def _compact(self):
+        """Store tickers and names as categoricals and numbers as float32."""
+        for column in ("ticker", "name"):
+            if column in self.frame.columns:
+                self.frame[column] = self.frame[column].astype("category")
+        for column in self.frame.columns[self.frame.dtypes == "float64"]:
+            self.frame[column] = self.frame[column].astype("float32")
+
+    @instrument
+    def build_momentum_portfolio(self, k=8):
         """Momentum portfolio.
 
-        Generate a momentum portfolio based on the 8 stocks with the highest returns
-        in the last 12 months.
+        Generate a momentum portfolio based on the k (default 8) stocks with the
+        highest returns in the last 12 months.
 
         Returns a dataframe of returns, with all stocks equally weighted.
         """
-        self.momentum = (
-            self.frame.groupby("date")
-            .apply(lambda x: x.nlargest(8, "ret12m"))
-            .reset_index(drop=True)
-        )
+        top, _ = rank_legs(self.frame, "ret12m", k=k)
+        self.momentum = top.reset_index(drop=True)
         return (
             self.momentum.groupby("date")["closed_price"].mean().reset_index(drop=True)
         )
 
-    def build_size_portfolio(self):
+    @instrument
+    def build_size_portfolio(self, k=8):
         """Small and big portfolio.
 
-        Generate a size portfolio based on the 8 stocks with the highest market
-        cap in the last 12 months.
+        Generate a size portfolio based on the k (default 8) stocks with the
+        highest and the lowest market cap in the last 12 months.
 
         Returns a dataframe
         """
-        self.size_big = (
-            self.frame.groupby("date")
-            .apply(lambda x: x.nlargest(8, "VM"))
-            .reset_index(drop=True)
-        )
-        self.size_small = (
-            self.frame.groupby("date")
-            .apply(lambda x: x.nsmallest(8, "VM"))
-            .reset_index(drop=True)
-        )
+        size_big, size_small = rank_legs(self.frame, "mkt_value", k=k)
+        self.size_big = size_big.reset_index(drop=True)
+        self.size_small = size_small.reset_index(drop=True)
 
         return (
             self.size_small.groupby("date")["closed_price"]
@@ -362,18 +922,118 @@ class Portifolio:
             .reset_index(drop=True)
         )
 
-    def build_value_portfolio(self):
+    @instrument
+    def build_value_portfolio(self, k=8):
         """book-to-market portfolio.
 
-        Generate a book-to-market portfolio based on the 8 stocks with the highest
-        book-to-market in the last 12 months.
+        Generate a book-to-market portfolio based on the k (default 8) stocks with
+        the highest book-to-market in the last 12 months.
 
         Returns a dataframe grouped by date, with all stocks equally weighted.
         """
-        self.frame["B/M"] = self.frame["VM"] / self.frame["PL"]
-        self.value = (
-            self.frame.groupby("date")
-            .apply(lambda x: x.nsmallest(8, "B/M"))
-            .reset_index(drop=True)
-        )
+        # Book value (net worth) over market value, skipping a zero market value:
+        book_to_market = self.frame["net_worth"] / self.frame["mkt_value"]
+        self.frame["B/M"] = book_to_market.replace([np.inf, -np.inf], np.nan)
+        value, _ = rank_legs(self.frame, "B/M", k=k)
+        self.value = value.reset_index(drop=True)
         return self.value.groupby("date")["closed_price"].mean().reset_index(drop=True)
+
+    @instrument
+    def build_factors(  # noqa: PLR0913
+        self,
+        returns="ret1m",
+        weight="mkt_value",
+        *,
+        sorts=None,
+        liquidity=None,
+        size_breakpoint=0.5,
+        breakpoints=(0.3, 0.7),
+    ):
+        """Market, size and long-short factor returns (Fama-French 2x3 sorts).
+
+        At every rebalance date the stocks are split in small and big at the
+        ``size_breakpoint`` percentile of ``weight`` (market value) and, for
+        each characteristic of ``sorts``, in low, neutral and high at the
+        ``breakpoints`` percentiles. The six portfolios are value-weighted by
+        ``weight`` and held until the next date, whose ``returns`` they earn.
+        Each factor is the mean of the two high portfolios minus the mean of
+        the two low ones (reversed when the long leg holds the low values),
+        SMB the mean of the small portfolios minus the big ones, averaged over
+        the sorts, and mkt the value-weighted return of all stocks.
+
+        ``sorts`` maps factor names to (column, long high) pairs and defaults
+        to FACTOR_SORTS; a ``liquidity`` column adds IML (illiquid minus
+        liquid). book_to_market is added to the frame when missing, as
+        net_worth / mkt_value of the firms with positive net worth.
+
+        All the dates are computed together with grouped ranks and bincounts.
+        The 2x3 portfolio returns are kept in ``sort_portfolios``.
+
+        input: str(optional), str(optional), dict(optional), str(optional),
+            float(optional), tuple(optional).
+        output: dataframe (date x [mkt, smb, factors]) in the units of the
+            returns column.
+        """
+        sorts = dict(FACTOR_SORTS if sorts is None else sorts)
+        if liquidity is not None:
+            sorts["iml"] = (liquidity, False)
+        if "book_to_market" not in self.frame.columns:
+            net_worth = self.frame["net_worth"].where(self.frame["net_worth"] > 0)
+            self.frame["book_to_market"] = net_worth / self.frame["mkt_value"]
+
+        date_codes, dates = pd.factorize(self.frame["date"], sort=True)
+        ticker_codes = pd.factorize(self.frame["ticker"])[0]
+        # Formation row of each row: the same ticker at the previous date.
+        order = np.lexsort((date_codes, ticker_codes))
+        follows = (ticker_codes[order][1:] == ticker_codes[order][:-1]) & (
+            date_codes[order][1:] == date_codes[order][:-1] + 1
+        )
+        rows = order[1:][follows]
+        formation = order[:-1][follows]
+
+        values = self.frame[returns].to_numpy(dtype=float)[rows]
+        weights = self.frame[weight].to_numpy(dtype=float)[formation]
+        groups = date_codes[rows]
+        valid = ~np.isnan(values) & (weights > 0)
+        values, weights, groups = values[valid], weights[valid], groups[valid]
+        formation = formation[valid]
+        n_dates = len(dates)
+        n_buckets = len(breakpoints) + 1
+
+        market = _weighted_means(groups, n_dates, values, weights)
+        size = _sort_buckets(weights, groups, (size_breakpoint,))
+        portfolios = {}
+        long_short = {}
+        small_minus_big = []
+        for name, (column, long_high) in sorts.items():
+            characteristic = self.frame[column].to_numpy(dtype=float)[formation]
+            ok = ~np.isnan(characteristic)
+            bucket = _sort_buckets(characteristic[ok], groups[ok], breakpoints)
+            keys = (groups[ok] * 2 + size[ok]) * n_buckets + bucket
+            means = _weighted_means(
+                keys,
+                n_dates * 2 * n_buckets,
+                values[ok],
+                weights[ok],
+            ).reshape(n_dates, 2, n_buckets)
+            spread = means[:, :, -1].mean(axis=1) - means[:, :, 0].mean(axis=1)
+            long_short[name] = spread if long_high else -spread
+            small_minus_big.append(means[:, 0].mean(axis=1) - means[:, 1].mean(axis=1))
+            portfolios[name] = means.reshape(n_dates, -1)
+        factors = {"mkt": market}
+        if small_minus_big:
+            factors["smb"] = np.mean(small_minus_big, axis=0)
+        factors.update(long_short)
+
+        # The first date has no formation date:
+        self.factors = pd.DataFrame(factors, index=pd.Index(dates, name="date"))
+        self.factors = self.factors.iloc[1:]
+        self.sort_portfolios = pd.DataFrame(
+            np.hstack([np.empty((n_dates, 0)), *portfolios.values()])[1:],
+            index=self.factors.index,
+            columns=pd.MultiIndex.from_product(
+                [list(portfolios), ["small", "big"], range(n_buckets)],
+                names=["sort", "size", "bucket"],
+            ),
+        )
+        return self.factors
@@ -0,0 +1,222 @@
+"""Provide batched time-series regressions of stock returns on the risk factors.
+
+Functions:
+---------
+
+align:
+    Putting returns and factors on the same dates.
+
+design:
+    Design matrix of the factors, with an intercept column.
+
+factor_regression:
+    Regressing the excess returns of many stocks on the factors at once.
+
+newey_west_covariance:
+    Newey-West (HAC) covariance of batched regression coefficients.
+
+rolling_factor_betas:
+    Rolling factor exposures of many stocks, updated incrementally.
+
+"""
+import numpy as np
+import pandas as pd
+
+from fico.portfolio import as_datetime_index
+
+# Factors of the 5-factor model, as named by merge_portifolio:
+FACTOR_COLUMNS = ["mkt-rf", "HML", "IML", "SMB", "WML"]
+
+
+def align(returns, factors):
+    """Put returns and factors on the same dates, renaming the market factor.
+
+    input: dataframe or series (date x ticker), dataframe.
+    output: dataframe, dataframe.
+    """
+    if isinstance(returns, pd.Series):
+        returns = returns.to_frame()
+    factors = factors.rename(columns={"Rm_minus_Rf": "mkt-rf"})
+    if isinstance(factors.index, pd.DatetimeIndex) != isinstance(
+        returns.index,
+        pd.DatetimeIndex,
+    ):
+        factors = as_datetime_index(factors)
+        returns = as_datetime_index(returns)
+    dates = returns.index.intersection(factors.index)
+    return returns.loc[dates], factors.loc[dates]
+
+
+def design(factors, factor_columns):
+    """Design matrix with an intercept column (alpha) first.
+
+    input: dataframe, list of str.
+    output: 2D array (dates x (1 + factors)).
+    """
+    x = factors[factor_columns].to_numpy(dtype=float)
+    return np.column_stack([np.ones(len(x)), x])
+
+
+def _batched_ols(x, y):
+    """Solve one OLS per column of y, skipping the rows where y is NaN.
+
+    The cross-products of the shared design matrix are computed once per row
+    and masked per stock, so every stock is fitted in the same array calls.
+    """
+    mask = ~np.isnan(y)
+    y0 = np.where(mask, y, 0.0)
+    n_rows, k = x.shape
+    outer = (x[:, :, None] * x[:, None, :]).reshape(n_rows, k * k)
+    xtx = (mask.T.astype(float) @ outer).reshape(-1, k, k)
+    xty = x.T @ y0
+    xtx_inv = np.linalg.pinv(xtx)
+    coef = np.einsum("nij,jn->ni", xtx_inv, xty)
+    residuals = np.where(mask, y0 - x @ coef.T, 0.0)
+    return coef, residuals, xtx_inv, mask
+
+
+def newey_west_covariance(x, residuals, xtx_inv, lags):
+    """Newey-West (HAC) covariance of batched regression coefficients.
+
+    input: 2D array (dates x k), 2D array (dates x stocks), 3D array
+        (stocks x k x k), int.
+    output: 3D array (stocks x k x k).
+    """
+    scores = x[:, :, None] * residuals[:, None, :]
+    meat = np.einsum("tin,tjn->nij", scores, scores)
+    for lag in range(1, lags + 1):
+        weight = 1 - lag / (lags + 1)
+        gamma = np.einsum("tin,tjn->nij", scores[lag:], scores[:-lag])
+        meat += weight * (gamma + gamma.transpose(0, 2, 1))
+    return xtx_inv @ meat @ xtx_inv
+
+
+def factor_regression(
+    returns,
+    factors,
+    factor_columns=None,
+    excess=True,
+    newey_west_lags=None,
+):
+    """Regress the excess returns of many stocks on the factors at once.
+
+    ``returns`` is a (date x ticker) frame, e.g. ``panel["Returns"]`` from
+    load_stock_panel, and ``factors`` the frame of build_factors_frame. When
+    ``excess`` is True the ``Risk_free`` column is subtracted from the returns.
+    Missing returns are dropped per stock, without leaving the batched solve.
+    With ``newey_west_lags`` the standard errors are Newey-West adjusted.
+
+    input: dataframe, dataframe, list(optional), bool(optional), int(optional).
+    output: dict with "coef", "stderr" and "tstat" dataframes (ticker x
+        [alpha, factors]) and "r2", "resid_var" (residual variance) and "nobs"
+        series.
+    """
+    factor_columns = factor_columns or FACTOR_COLUMNS
+    returns, factors = align(returns, factors)
+    y = returns.to_numpy(dtype=float)
+    if excess and "Risk_free" in factors.columns:
+        y = y - factors[["Risk_free"]].to_numpy(dtype=float)
+    x = design(factors, factor_columns)
+    k = x.shape[1]
+
+    coef, residuals, xtx_inv, mask = _batched_ols(x, y)
+    nobs = mask.sum(axis=0)
+    dof = nobs - k
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sse = (residuals**2).sum(axis=0)
+        sigma2 = np.where(dof > 0, sse / dof, np.nan)
+        if newey_west_lags is None:
+            variance = np.diagonal(xtx_inv, axis1=1, axis2=2) * sigma2[:, None]
+        else:
+            covariance = newey_west_covariance(x, residuals, xtx_inv, newey_west_lags)
+            variance = np.diagonal(covariance, axis1=1, axis2=2).copy()
+            variance[dof <= 0] = np.nan
+        stderr = np.sqrt(variance)
+        mean = np.nansum(y, axis=0) / nobs
+        sst = (np.where(mask, y - mean, 0.0) ** 2).sum(axis=0)
+        r2 = 1 - sse / sst
+
+    terms = ["alpha", *factor_columns]
+    tickers = returns.columns
+    return {
+        "coef": pd.DataFrame(coef, index=tickers, columns=terms),
+        "stderr": pd.DataFrame(stderr, index=tickers, columns=terms),
+        "tstat": pd.DataFrame(coef / stderr, index=tickers, columns=terms),
+        "r2": pd.Series(r2, index=tickers, name="r2"),
+        "resid_var": pd.Series(sigma2, index=tickers, name="resid_var"),
+        "nobs": pd.Series(nobs, index=tickers, name="nobs"),
+    }
+
+
+def _solve(xtx, xty):
+    """Batched solve, falling back to the pseudo-inverse on singular systems."""
+    try:
+        return np.linalg.solve(xtx, xty[:, :, None])[:, :, 0]
+    except np.linalg.LinAlgError:
+        return np.einsum("nij,nj->ni", np.linalg.pinv(xtx), xty)
+
+
+def rolling_factor_betas(  # noqa: PLR0913
+    returns,
+    factors,
+    window=252,
+    *,
+    min_periods=None,
+    factor_columns=None,
+    excess=True,
+):
+    """Rolling factor exposures of many stocks, updated incrementally.
+
+    Running sums of the cross-products X'X and X'y of every stock are updated
+    as a row enters and another leaves the window, so each step costs
+    O(stocks x k^2) whatever the window length. Missing returns are skipped
+    per stock and a stock needs ``min_periods`` (default ``window``) valid rows
+    in the window to get a value.
+
+    input: dataframe (date x ticker), dataframe, int(optional), int(optional),
+        list(optional), bool(optional).
+    output: dataframe with (term, ticker) columns, term being alpha or a factor.
+    """
+    factor_columns = factor_columns or FACTOR_COLUMNS
+    min_periods = min_periods or window
+    returns, factors = align(returns, factors)
+    y = returns.to_numpy(dtype=float)
+    if excess and "Risk_free" in factors.columns:
+        y = y - factors[["Risk_free"]].to_numpy(dtype=float)
+    x = design(factors, factor_columns)
+    mask = ~np.isnan(y)
+    y = np.where(mask, y, 0.0)
+    n_rows, k = x.shape
+    n_stocks = y.shape[1]
+    outer = x[:, :, None] * x[:, None, :]
+
+    xtx = np.zeros((n_stocks, k, k))
+    xty = np.zeros((n_stocks, k))
+    count = np.zeros(n_stocks, dtype=int)
+    betas = np.full((n_rows, k, n_stocks), np.nan)
+    for row in range(n_rows):
+        # Row entering the window:
+        valid = mask[row]
+        xtx[valid] += outer[row]
+        xty[valid] += x[row] * y[row, valid, None]
+        count += valid
+        # Row leaving the window:
+        if row >= window:
+            old = row - window
+            valid = mask[old]
+            xtx[valid] -= outer[old]
+            xty[valid] -= x[old] * y[old, valid, None]
+            count -= valid
+        ready = count >= max(min_periods, k)
+        if ready.any():
+            betas[row, :, ready] = _solve(xtx[ready], xty[ready])
+
+    terms = ["alpha", *factor_columns]
+    return pd.DataFrame(
+        betas.reshape(n_rows, k * n_stocks),
+        index=returns.index,
+        columns=pd.MultiIndex.from_product(
+            [terms, returns.columns],
+            names=["term", returns.columns.name or "ticker"],
+        ),
+    )
@@ -0,0 +1,279 @@
+"""Provide a low-rank factor covariance model and portfolio optimizers.
+
+The covariance of N stocks is modelled as B F B' + D: the (N x k) factor
+loadings B of factor_regression, the (k x k) covariance F of the factors of
+build_factors_frame and the diagonal D of the residual variances. Only these
+O(N k) numbers are stored; products and solves go through them (the
+Woodbury identity for the solves), so nothing of size N x N is ever built.
+
+Classes:
+-------
+
+FactorCovariance:
+    Covariance B F B' + D with products, solves and risk decompositions.
+
+Functions:
+---------
+
+factor_covariance:
+    Estimating the factor covariance of many stocks from their returns.
+
+minimum_variance:
+    Minimum-variance weights, optionally long-only.
+
+risk_parity:
+    Weights whose risk contributions match the given budgets.
+
+"""
+import numpy as np
+import pandas as pd
+
+from fico.instrument import instrument
+from fico.regression import FACTOR_COLUMNS, align, factor_regression
+
+# Newton decrement below which risk_parity takes full (undamped) steps:
+FULL_STEP_DECREMENT = 0.25
+
+
+def _woodbury_solve(loadings, factor_covariance, diagonal, values):
+    """Solve (B F B' + D) x = values with the Woodbury identity.
+
+    Uses (B F B' + D)^-1 = D^-1 - D^-1 B F (I + B' D^-1 B F)^-1 B' D^-1,
+    which only needs a k x k solve and stays valid when F is singular.
+    """
+    scaled = values / (diagonal if values.ndim == 1 else diagonal[:, None])
+    scaled_loadings = loadings / diagonal[:, None]
+    capacitance = np.eye(len(factor_covariance)) + (
+        loadings.T @ scaled_loadings @ factor_covariance
+    )
+    correction = factor_covariance @ np.linalg.solve(capacitance, loadings.T @ scaled)
+    return scaled - scaled_loadings @ correction
+
+
+class FactorCovariance:
+    """Covariance matrix B F B' + D of many stocks, kept in factor form."""
+
+    def __init__(self, loadings, factor_covariance, specific_variance):
+        """Store the loadings, factor covariance and residual variances.
+
+        input: dataframe or 2D array (stocks x factors), dataframe or 2D array
+            (factors x factors), series or 1D array (stocks).
+        """
+        self.tickers = getattr(loadings, "index", pd.RangeIndex(len(loadings)))
+        self.factors = getattr(
+            loadings,
+            "columns",
+            pd.RangeIndex(np.shape(loadings)[1]),
+        )
+        self.loadings = np.asarray(loadings, dtype=float)
+        self.factor_covariance = np.asarray(factor_covariance, dtype=float)
+        self.specific_variance = np.asarray(specific_variance, dtype=float)
+        if (self.specific_variance <= 0).any():
+            raise ValueError("The residual variances must be positive")
+
+    def __len__(self):
+        """Number of stocks."""
+        return len(self.loadings)
+
+    def align(self, values):
+        """Values as an array in the order of the stocks.
+
+        Series and dataframes are reindexed on the tickers (NaN for the
+        missing ones); arrays are taken as already in order.
+
+        input: series, dataframe or array (stocks, or stocks x m).
+        output: array.
+        """
+        if isinstance(values, pd.Series | pd.DataFrame):
+            values = values.reindex(self.tickers)
+        return np.asarray(values, dtype=float)
+
+    def dot(self, values):
+        """Product of the covariance with a vector or the columns of a matrix.
+
+        input: series or array (stocks) or 2D array (stocks x m).
+        output: array of the same shape.
+        """
+        values = self.align(values)
+        diagonal = (
+            self.specific_variance
+            if values.ndim == 1
+            else self.specific_variance[:, None]
+        )
+        return self.loadings @ (self.factor_covariance @ (self.loadings.T @ values)) + (
+            diagonal * values
+        )
+
+    def solve(self, values):
+        """Solve covariance @ x = values, in O(stocks x factors^2).
+
+        input: series or array (stocks) or 2D array (stocks x m).
+        output: array of the same shape.
+        """
+        return _woodbury_solve(
+            self.loadings,
+            self.factor_covariance,
+            self.specific_variance,
+            self.align(values),
+        )
+
+    def diagonal(self):
+        """Variance of every stock.
+
+        output: series.
+        """
+        systematic = np.einsum(
+            "nk,kl,nl->n",
+            self.loadings,
+            self.factor_covariance,
+            self.loadings,
+        )
+        return pd.Series(systematic + self.specific_variance, index=self.tickers)
+
+    def variance(self, weights):
+        """Variance of a portfolio.
+
+        input: series or array (stocks).
+        output: float.
+        """
+        weights = self.align(weights)
+        exposure = self.loadings.T @ weights
+        return float(
+            exposure @ self.factor_covariance @ exposure
+            + (self.specific_variance * weights**2).sum(),
+        )
+
+    def risk_contributions(self, weights):
+        """Share of the portfolio variance coming from each stock.
+
+        input: series or array (stocks).
+        output: series summing to 1.
+        """
+        weights = self.align(weights)
+        contributions = weights * self.dot(weights)
+        return pd.Series(contributions / contributions.sum(), index=self.tickers)
+
+    def subset(self, tickers):
+        """Covariance of some of the stocks.
+
+        input: list of tickers.
+        output: FactorCovariance.
+        """
+        rows = self.tickers.get_indexer(tickers)
+        if (rows < 0).any():
+            raise KeyError(f"Unknown tickers: {list(pd.Index(tickers)[rows < 0])}")
+        return FactorCovariance(
+            pd.DataFrame(
+                self.loadings[rows],
+                index=self.tickers[rows],
+                columns=self.factors,
+            ),
+            self.factor_covariance,
+            self.specific_variance[rows],
+        )
+
+
+@instrument
+def factor_covariance(
+    returns,
+    factors,
+    factor_columns=None,
+    excess=True,
+    periods=252,
+):
+    """Estimate the factor covariance of many stocks from their returns.
+
+    The loadings and residual variances come from factor_regression and the
+    factor covariance from the factor returns over the same dates. Both are
+    scaled by ``periods`` (252 annualizes daily returns). Stocks without
+    enough returns for the regression are left out.
+
+    input: dataframe (date x ticker), dataframe, list(optional),
+        bool(optional), int(optional).
+    output: FactorCovariance.
+    """
+    factor_columns = factor_columns or FACTOR_COLUMNS
+    regression = factor_regression(returns, factors, factor_columns, excess=excess)
+    loadings = regression["coef"][factor_columns]
+    residual = regression["resid_var"]
+    fitted = np.isfinite(loadings).all(axis=1) & (residual > 0)
+    _, factors = align(returns, factors)
+    return FactorCovariance(
+        loadings[fitted],
+        factors[factor_columns].cov().to_numpy() * periods,
+        residual[fitted].to_numpy() * periods,
+    )
+
+
+@instrument
+def minimum_variance(covariance, long_only=False, max_iter=100):
+    """Minimum-variance weights summing to 1.
+
+    Without constraints the weights are proportional to covariance^-1 @ 1,
+    one Woodbury solve. With ``long_only`` an active-set loop solves on the
+    stocks with positive weights, dropping the negative ones and taking back
+    those whose marginal variance is below the portfolio's, until the
+    optimality conditions hold (or ``max_iter`` is reached).
+
+    input: FactorCovariance, bool(optional), int(optional).
+    output: series of weights.
+    """
+    ones = np.ones(len(covariance))
+    weights = covariance.solve(ones)
+    weights /= weights.sum()
+    if long_only:
+        active = weights > 0
+        for _ in range(max_iter):
+            subset = covariance.subset(covariance.tickers[active])
+            weights = np.zeros(len(covariance))
+            weights[active] = subset.solve(np.ones(active.sum()))
+            weights /= weights.sum()
+            marginal = covariance.dot(weights)
+            # Optimal when no weight is negative and no stock left out would
+            # lower the variance (marginal variance below the portfolio's):
+            entering = ~active & (marginal < weights @ marginal)
+            leaving = active & (weights < 0)
+            if not (entering.any() or leaving.any()):
+                break
+            active = (active & ~leaving) | entering
+        weights = np.maximum(weights, 0)
+    return pd.Series(weights, index=covariance.tickers)
+
+
+@instrument
+def risk_parity(covariance, budgets=None, max_iter=100, tol=1e-10):
+    """Long-only weights whose risk contributions match the budgets.
+
+    Minimizes x' C x / 2 - sum(budgets * log(x)) with damped Newton steps;
+    the Hessian C + diag(budgets / x^2) is again a factor covariance, so each
+    step is one Woodbury solve. The weights are x rescaled to sum to 1.
+
+    input: FactorCovariance, series or array(optional, equal budgets),
+        int(optional), float(optional).
+    output: series of weights.
+    """
+    n_stocks = len(covariance)
+    budgets = (
+        np.full(n_stocks, 1 / n_stocks)
+        if budgets is None
+        else covariance.align(budgets)
+    )
+    budgets = budgets / budgets.sum()
+    x = budgets / np.sqrt(covariance.diagonal().to_numpy())
+    x /= np.sqrt(covariance.variance(x))
+    for _ in range(max_iter):
+        gradient = covariance.dot(x) - budgets / x
+        step = -_woodbury_solve(
+            covariance.loadings,
+            covariance.factor_covariance,
+            covariance.specific_variance + budgets / x**2,
+            gradient,
+        )
+        decrement = np.sqrt(max(-(gradient @ step), 0.0))
+        if decrement < tol:
+            break
+        size = 1.0 if decrement < FULL_STEP_DECREMENT else 1 / (1 + decrement)
+        while (x + size * step <= 0).any():
+            size /= 2
+        x = x + size * step
+    return pd.Series(x / x.sum(), index=covariance.tickers)
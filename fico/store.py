@@ -0,0 +1,413 @@
+"""Provide a memory-mapped, column-oriented store of the stock universe.
+
+Every field of the stock csv files is kept as one contiguous (date x ticker)
+array in its own .npy file, in Fortran order so that the series of a ticker
+is contiguous. The arrays are opened with ``mmap_mode="r"``: slicing a date
+range or a contiguous range of tickers is a zero-copy view, and worker
+processes opening the same store share the pages of the operating system
+cache instead of each holding a parsed copy.
+
+New rows are appended to a small tail segment, rewritten on every append,
+while the base segment holding the history is left untouched until the store
+is rebuilt.
+
+Classes:
+-------
+
+PanelStore:
+    Reading fields, panels and single stocks from a store, and appending
+    new rows.
+
+Functions:
+---------
+
+write_store:
+    Writing the per-ticker dataframes into a new store, atomically.
+
+open_store:
+    Opening a store once per process (None when there is no store).
+
+"""
+import json
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+META_NAME = "meta.json"
+
+# Per process cache of the open stores, keyed by path:
+_OPEN_STORES = {}
+
+
+class PanelStore:
+    """Read-only view of a store written by write_store."""
+
+    def __init__(self, path):
+        """Read the metadata and the date index; fields are mapped on use."""
+        self.path = Path(path)
+        self.meta = json.loads((self.path / META_NAME).read_text())
+        self.columns = self.meta["columns"]
+        self.tickers = pd.Index(self.meta["tickers"], name="ticker")
+        self.dates = pd.DatetimeIndex(
+            np.load(self.path / self.meta["dates"]),
+            name="date",
+        )
+        self.fingerprints = self.meta["fingerprints"]
+        self.offsets = self.meta["offsets"]
+        # (first row, stop row, directory) of the base and the tail segments:
+        self.segments = []
+        first = 0
+        for segment in self.meta["segments"]:
+            stop = first + segment["rows"]
+            self.segments.append((first, stop, self.path / segment["dir"]))
+            first = stop
+        self._arrays = {}
+
+    def __contains__(self, ticker):
+        """Check if the ticker is in the store."""
+        return ticker in self.fingerprints
+
+    def _array(self, name):
+        """Memory-mapped (date x ticker) arrays of a column in each segment."""
+        if name not in self._arrays:
+            file_name = self.meta["files"][name]
+            self._arrays[name] = [
+                np.load(directory / file_name, mmap_mode="r")
+                for _, _, directory in self.segments
+            ]
+        return self._arrays[name]
+
+    def _rows(self, start, end):
+        """Slice of the dates between start and end (both included)."""
+        first = 0 if start is None else self.dates.searchsorted(pd.Timestamp(start))
+        last = (
+            len(self.dates)
+            if end is None
+            else self.dates.searchsorted(pd.Timestamp(end), side="right")
+        )
+        return slice(first, last)
+
+    def _columns(self, tickers):
+        """Slice (zero-copy) or positions of the tickers."""
+        if tickers is None:
+            return slice(None)
+        positions = self.tickers.get_indexer(list(tickers))
+        if (positions < 0).any():
+            missing = [t for t, p in zip(tickers, positions, strict=True) if p < 0]
+            raise KeyError(f"Tickers not in the store: {missing}")
+        if len(positions) and (np.diff(positions) == 1).all():
+            return slice(positions[0], positions[-1] + 1)
+        return positions
+
+    def array(self, column, tickers=None, start=None, end=None):
+        """(date x ticker) values of a column.
+
+        A view of the mapped file when the dates lie in a single segment and
+        ``tickers`` is a contiguous run of the (sorted) tickers of the store.
+        Text columns hold the codes of ``meta["labels"][column]`` (-1 when
+        missing).
+
+        input: str, list of str(optional), date(optional), date(optional).
+        output: 2D array.
+        """
+        rows = self._rows(start, end)
+        columns = self._columns(tickers)
+        parts = []
+        for (first, stop, _), values in zip(
+            self.segments,
+            self._array(column),
+            strict=True,
+        ):
+            if rows.start < stop and rows.stop > first:
+                parts.append(values[max(rows.start - first, 0) : rows.stop - first])
+        if not parts:
+            parts = [self._array(column)[0][:0]]
+        if isinstance(columns, slice):
+            parts = [values[:, columns] for values in parts]
+        else:
+            parts = [values.take(columns, axis=1) for values in parts]
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+    def frame(self, column, tickers=None, start=None, end=None):
+        """(date x ticker) dataframe of a numeric column, without copying.
+
+        input: str, list of str(optional), date(optional), date(optional).
+        output: dataframe.
+        """
+        rows = self._rows(start, end)
+        columns = self._columns(tickers)
+        return pd.DataFrame(
+            self.array(column, tickers, start, end),
+            index=self.dates[rows],
+            columns=self.tickers[columns],
+            copy=False,
+        )
+
+    def panel(self, columns=None, tickers=None, start=None, end=None):
+        """Panel with (field, ticker) columns, like load_stock_panel.
+
+        input: list of str(optional), list of str(optional), date(optional),
+            date(optional).
+        output: dataframe.
+        """
+        columns = columns or self.meta["numeric"]
+        return pd.concat(
+            {column: self.frame(column, tickers, start, end) for column in columns},
+            axis="columns",
+            names=["field", "ticker"],
+        )
+
+    def stock(self, ticker, columns=None):
+        """Rows of a single ticker, as choose_stock parses them.
+
+        input: str, list of str(optional).
+        output: dataframe with a DatetimeIndex.
+        """
+        present = np.flatnonzero(self.array("present", [ticker])[:, 0])
+        rows = present
+        # Trading days without gaps (the usual case) are sliced, not gathered:
+        if len(present) and present[-1] - present[0] + 1 == len(present):
+            rows = slice(present[0], present[-1] + 1)
+        data = {}
+        for column in columns or self.columns:
+            values = self.array(column, [ticker])[rows, 0]
+            labels = self.meta["labels"].get(column)
+            if labels is not None:
+                values = pd.Categorical.from_codes(values, labels).astype(object)
+            data[column] = values
+        return pd.DataFrame(data, index=self.dates[rows])
+
+    def is_fresh(self, ticker, fingerprint):
+        """Check if the stored ticker matches its source file fingerprint.
+
+        input: str, dict (file_fingerprint of the csv file).
+        output: bool.
+        """
+        return self.fingerprints.get(ticker) == fingerprint
+
+    def append(self, frames, fingerprints, offsets):
+        """Append the new rows of some tickers, in a new tail segment.
+
+        The tail segment (the rows after the base segment) is rewritten with
+        its previous rows and the new ones, then swapped in by replacing the
+        metadata file, so the cost grows with the tail and not with the
+        history. The new rows must be dated after the base segment.
+
+        input: dict of ticker -> dataframe (DatetimeIndex) of new rows, dict of
+            ticker -> file fingerprint, dict of ticker -> source offset.
+        output: PanelStore.
+        """
+        unknown = [ticker for ticker in frames if ticker not in self]
+        if unknown:
+            raise KeyError(f"Tickers not in the store: {unknown}")
+        base_rows = self.segments[0][1]
+        if base_rows:
+            base_end = self.dates[base_rows - 1]
+            early = [
+                t for t, f in frames.items() if len(f) and f.index.min() <= base_end
+            ]
+            if early:
+                raise ValueError(f"Rows dated inside the base segment: {early}")
+        previous = self.dates[base_rows:]
+        dates = previous
+        for frame in frames.values():
+            dates = dates.union(frame.index)
+
+        meta = dict(self.meta)
+        meta["version"] = version = self.meta["version"] + 1
+        meta["labels"] = _extend_labels(
+            self.meta["labels"],
+            frames.values(),
+            self.columns,
+            self.meta["numeric"],
+        )
+        tail = f"tail_{version}"
+        tail_arrays = {}
+        if len(self.segments) > 1:
+            tail_arrays = {name: self._array(name)[-1] for name in self.meta["files"]}
+        _write_segment(
+            self.path / tail,
+            dates,
+            list(self.tickers),
+            {t: f.reindex(columns=self.columns) for t, f in frames.items()},
+            meta,
+            previous=(dates.get_indexer(previous), tail_arrays),
+        )
+        meta["dates"] = f"dates_{version}.npy"
+        np.save(
+            self.path / meta["dates"],
+            _plain_dates(self.dates[:base_rows].append(dates)),
+        )
+        meta["segments"] = [self.meta["segments"][0], {"dir": tail, "rows": len(dates)}]
+        meta["fingerprints"] = {**self.fingerprints, **fingerprints}
+        meta["offsets"] = {**self.offsets, **offsets}
+        _write_meta(self.path, meta)
+
+        # Keep the previous tail for the readers that have not reopened yet:
+        keep = {tail, meta["dates"], *(s["dir"] for s in self.meta["segments"])}
+        keep.add(self.meta["dates"])
+        for old in [*self.path.glob("tail_*"), *self.path.glob("dates_*.npy")]:
+            if old.name not in keep:
+                if old.is_dir():
+                    shutil.rmtree(old, ignore_errors=True)
+                else:
+                    old.unlink()
+        return PanelStore(self.path)
+
+
+def _plain_dates(dates):
+    """Plain datetime64 values (the pyarrow parser attaches dtype metadata)."""
+    return dates.as_unit("ns").asi8.view("datetime64[ns]")
+
+
+def _extend_labels(labels, frames, columns, numeric):
+    """Add the new values of the text columns, keeping the existing codes."""
+    labels = {column: list(values) for column, values in labels.items()}
+    frames = list(frames)
+    for column in columns:
+        if column in numeric:
+            continue
+        known = labels.setdefault(column, [])
+        values = [frame[column] for frame in frames if column in frame]
+        if values:
+            found = set(pd.concat(values).dropna().astype(str))
+            known.extend(sorted(found.difference(known)))
+    return labels
+
+
+def _write_segment(  # noqa: PLR0913
+    directory,
+    dates,
+    tickers,
+    frames,
+    meta,
+    *,
+    previous=None,
+):
+    """Write the (date x ticker) arrays of a segment.
+
+    ``previous`` is (rows, arrays): arrays of a previous segment copied to the
+    given rows before the frames are written.
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    shape = (len(dates), len(tickers))
+    arrays = {}
+    for name, file_name in meta["files"].items():
+        if name == "present":
+            dtype, fill = bool, False
+        elif name in meta["numeric"]:
+            dtype, fill = float, np.nan
+        else:
+            dtype, fill = np.int16, -1
+        arrays[name] = np.lib.format.open_memmap(
+            directory / file_name,
+            mode="w+",
+            dtype=dtype,
+            shape=shape,
+            fortran_order=True,
+        )
+        arrays[name][:] = fill
+    if previous is not None:
+        rows, values = previous
+        for name, array in values.items():
+            arrays[name][rows] = array
+    positions = {ticker: position for position, ticker in enumerate(tickers)}
+    for ticker, frame in frames.items():
+        position = positions[ticker]
+        rows = dates.get_indexer(frame.index)
+        arrays["present"][rows, position] = True
+        for column in frame:
+            values = frame[column]
+            if column in meta["labels"]:
+                # Missing values become "nan", which is not a label (code -1):
+                values = pd.Categorical(values.astype(str), meta["labels"][column])
+                values = values.codes
+            arrays[column][rows, position] = values
+    for array in arrays.values():
+        array.flush()
+
+
+def _write_meta(path, meta):
+    """Replace the metadata file atomically."""
+    tmp = Path(path) / (META_NAME + ".tmp")
+    tmp.write_text(json.dumps(meta, indent=4))
+    tmp.replace(Path(path) / META_NAME)
+
+
+def write_store(path, frames, fingerprints, offsets=None):
+    """Write the per-ticker dataframes into a new store.
+
+    The store is written next to ``path`` and swapped in at the end, so
+    readers never see a half-written store. ``offsets`` records, for each
+    ticker, how much of its source file was ingested (see PanelStore.append).
+
+    input: str or Path, dict of ticker -> dataframe (DatetimeIndex), dict of
+        ticker -> file fingerprint, dict(optional).
+    output: PanelStore.
+    """
+    path = Path(path)
+    tickers = sorted(frames)
+    dates = pd.DatetimeIndex([], name="date")
+    for frame in frames.values():
+        dates = dates.union(frame.index)
+    columns = list(dict.fromkeys(c for frame in frames.values() for c in frame))
+    numeric = [
+        column
+        for column in columns
+        if all(
+            pd.api.types.is_numeric_dtype(frame[column])
+            for frame in frames.values()
+            if column in frame
+        )
+    ]
+    meta = {
+        "version": 0,
+        "dates": "dates_0.npy",
+        "segments": [{"dir": ".", "rows": len(dates)}],
+        "columns": columns,
+        "numeric": numeric,
+        "labels": _extend_labels({}, frames.values(), columns, numeric),
+        "tickers": tickers,
+        "files": {
+            "present": "present.npy",
+            **{column: f"column_{i}.npy" for i, column in enumerate(columns)},
+        },
+        "fingerprints": {ticker: fingerprints[ticker] for ticker in tickers},
+        "offsets": {ticker: (offsets or {}).get(ticker) for ticker in tickers},
+    }
+    tmp = path.with_name(path.name + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    _write_segment(tmp, dates, tickers, frames, meta)
+    np.save(tmp / meta["dates"], _plain_dates(dates))
+    _write_meta(tmp, meta)
+    # Swap the directories; readers of the old store keep their mapped files:
+    old = path.with_name(path.name + ".old")
+    shutil.rmtree(old, ignore_errors=True)
+    if path.exists():
+        path.replace(old)
+    tmp.replace(path)
+    shutil.rmtree(old, ignore_errors=True)
+    _OPEN_STORES.pop(str(path.resolve()), None)
+    return PanelStore(path)
+
+
+def open_store(path):
+    """Open a store once per process.
+
+    The open store is reused until its metadata file is replaced.
+
+    input: str or Path.
+    output: PanelStore or None when there is no store at path.
+    """
+    meta_path = Path(path) / META_NAME
+    try:
+        version = meta_path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+    key = str(Path(path).resolve())
+    cached = _OPEN_STORES.get(key)
+    if cached is None or cached[0] != version:
+        cached = _OPEN_STORES[key] = (version, PanelStore(path))
+    return cached[1]
@@ -0,0 +1,244 @@
+"""Provide a parallel parameter sweep of the generate_signals strategy.
+
+Functions:
+---------
+
+parameter_grid:
+    Listing every combination of tickers and strategy settings.
+
+run_sweep:
+    Backtesting every combination of a grid on a process pool, with the
+    price panel in shared memory and a checkpoint per chunk.
+
+"""
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from fico.evaluation import EXTRA_METRICS, METRICS, batch_signals, evaluate_returns
+
+# Sweeps with more (combination x date) cells than this run on a process pool:
+PARALLEL_MIN_CELLS = 20_000_000
+
+# Arrays shared with the worker processes, attached by _attach_shared:
+_SHARED = {}
+
+
+def parameter_grid(
+    tickers,
+    share_count=(2000,),
+    start_capital=(100000,),
+    threshold=(0.0,),
+):
+    """List every combination of tickers and strategy settings.
+
+    input: list of str, list of int(optional), list of float(optional), list of
+        float(optional).
+    output: dataframe with ticker, share_count, start_capital and threshold
+        columns.
+    """
+    index = pd.MultiIndex.from_product(
+        [tickers, share_count, start_capital, threshold],
+        names=["ticker", "share_count", "start_capital", "threshold"],
+    )
+    return index.to_frame(index=False)
+
+
+def _evaluate_chunk(close, score, chunk, periods):
+    """Backtest the combinations of a chunk in one batched pass.
+
+    input: 2D array, 2D array, dict of 1D arrays (positions, share_count,
+        start_capital, threshold), int.
+    output: 2D array (combinations x metrics).
+    """
+    positions = chunk["positions"]
+    buy_signal = np.where(score[:, positions] > chunk["threshold"], 1.0, 0.0)
+    results = batch_signals(
+        close[:, positions],
+        buy_signal,
+        start_capital=chunk["start_capital"],
+        share_count=chunk["share_count"],
+    )
+    metrics = evaluate_returns(
+        results["Portfolio Daily Returns"],
+        results["Portfolio Cumulative Returns"],
+        periods=periods,
+    )
+    return metrics.to_numpy().T
+
+
+def _attach_shared(specs):
+    """Initializer of the workers: map the shared arrays."""
+    for name, (memory_name, shape, dtype) in specs.items():
+        memory = shared_memory.SharedMemory(name=memory_name)
+        _SHARED[name] = (memory, np.ndarray(shape, dtype=dtype, buffer=memory.buf))
+
+
+def _run_shared_chunk(number, chunk, periods):
+    """Worker of run_sweep: backtest a chunk on the shared arrays."""
+    close = _SHARED["close"][1]
+    score = _SHARED["score"][1]
+    return number, _evaluate_chunk(close, score, chunk, periods)
+
+
+@contextmanager
+def _shared_arrays(arrays):
+    """Copy arrays into shared memory, freed on exit.
+
+    output: dict of (memory name, shape, dtype) for _attach_shared.
+    """
+    memories = []
+    try:
+        specs = {}
+        for name, array in arrays.items():
+            memory = shared_memory.SharedMemory(create=True, size=array.nbytes)
+            memories.append(memory)
+            shared = np.ndarray(array.shape, dtype=array.dtype, buffer=memory.buf)
+            shared[:] = array
+            del shared
+            specs[name] = (memory.name, array.shape, array.dtype.str)
+        yield specs
+    finally:
+        for memory in memories:
+            memory.close()
+            memory.unlink()
+
+
+def _chunk_results(close, score, chunks, periods, max_workers):
+    """Yield the number and results of every chunk, as they finish.
+
+    A single worker runs the chunks in this process; otherwise they run on a
+    process pool mapping the panels from shared memory.
+    """
+    if max_workers == 1 or len(chunks) <= 1:
+        for number, chunk in chunks.items():
+            yield number, _evaluate_chunk(close, score, chunk, periods)
+        return
+    with _shared_arrays({"close": close, "score": score}) as specs, ProcessPoolExecutor(
+        max_workers=max_workers or os.cpu_count(),
+        initializer=_attach_shared,
+        initargs=(specs,),
+    ) as pool:
+        futures = [
+            pool.submit(_run_shared_chunk, number, chunk, periods)
+            for number, chunk in chunks.items()
+        ]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def _grid_chunks(grid, positions, chunk_size):
+    """Split the grid into chunks of 1D arrays for _evaluate_chunk."""
+    chunks = {}
+    for number, start in enumerate(range(0, len(grid), chunk_size)):
+        rows = slice(start, start + chunk_size)
+        chunks[number] = {
+            "positions": positions[rows],
+            "share_count": grid["share_count"].to_numpy()[rows],
+            "start_capital": grid["start_capital"].to_numpy(dtype=float)[rows],
+            "threshold": grid["threshold"].to_numpy(dtype=float)[rows],
+        }
+    return chunks
+
+
+def _sweep_key(close, score, grid, chunk_size, periods):
+    """Hash identifying a sweep, to refuse resuming a different one."""
+    digest = hashlib.sha256()
+    for array in (close, score):
+        digest.update(np.ascontiguousarray(array).tobytes())
+    digest.update(pd.util.hash_pandas_object(grid, index=False).to_numpy().tobytes())
+    digest.update(json.dumps([chunk_size, periods]).encode())
+    return digest.hexdigest()
+
+
+def _open_checkpoint(checkpoint_dir, key):
+    """Results of the chunks already checkpointed for this sweep."""
+    checkpoint_dir = Path(checkpoint_dir)
+    checkpoint_dir.mkdir(parents=True, exist_ok=True)
+    meta_path = checkpoint_dir / "sweep.json"
+    if meta_path.exists():
+        if json.loads(meta_path.read_text())["key"] != key:
+            raise ValueError(
+                f"{checkpoint_dir} holds the checkpoints of another sweep",
+            )
+    else:
+        meta_path.write_text(json.dumps({"key": key}))
+    return {
+        int(path.stem.split("_")[1]): np.load(path)
+        for path in checkpoint_dir.glob("chunk_*.npy")
+    }
+
+
+def _save_chunk(checkpoint_dir, number, metrics):
+    """Write the results of a chunk atomically."""
+    path = Path(checkpoint_dir) / f"chunk_{number:06d}.npy"
+    tmp = path.with_suffix(".tmp")
+    with tmp.open("wb") as file:
+        np.save(file, metrics)
+    tmp.replace(path)
+
+
+def run_sweep(  # noqa: PLR0913
+    close,
+    score,
+    grid=None,
+    *,
+    chunk_size=256,
+    max_workers=None,
+    checkpoint_dir=None,
+    periods=252,
+):
+    """Backtest every combination of tickers and strategy settings.
+
+    ``close`` and ``score`` are (date x ticker) frames, e.g. the Close field
+    of load_stock_panel and the model predictions. ``grid`` lists the
+    combinations, as made by parameter_grid (by default every ticker of
+    ``close`` with the default settings). The Buy Signal of a combination is 1
+    where the score of its ticker is above its threshold (pass the buy
+    signals themselves as score with a 0.5 threshold). The grid is split into
+    chunks of ``chunk_size`` combinations; each chunk runs batch_signals and
+    evaluate_returns once over all its combinations.
+
+    Large sweeps run on a process pool: the panels are copied once into shared
+    memory, which every worker maps instead of receiving a pickled copy. With
+    ``checkpoint_dir`` every finished chunk is saved, so an interrupted sweep
+    resumes with the remaining chunks when run again with the same arguments.
+
+    input: dataframe, dataframe, dataframe(optional), int(optional),
+        int(optional), str or Path(optional), int(optional).
+    output: dataframe with the grid columns and one column per metric.
+    """
+    if grid is None:
+        grid = parameter_grid(list(close.columns))
+    prices = close.to_numpy(dtype=float)
+    scores = score.reindex(index=close.index, columns=close.columns)
+    scores = scores.to_numpy(dtype=float)
+    positions = close.columns.get_indexer(grid["ticker"])
+    if (positions < 0).any():
+        missing = sorted(set(grid["ticker"][positions < 0]))
+        raise KeyError(f"Tickers not in the close panel: {missing}")
+
+    chunks = _grid_chunks(grid, positions, chunk_size)
+    done = {}
+    if checkpoint_dir is not None:
+        key = _sweep_key(prices, scores, grid, chunk_size, periods)
+        done = _open_checkpoint(checkpoint_dir, key)
+    todo = {number: chunk for number, chunk in chunks.items() if number not in done}
+    if max_workers is None and len(grid) * len(prices) < PARALLEL_MIN_CELLS:
+        max_workers = 1
+    for number, metrics in _chunk_results(prices, scores, todo, periods, max_workers):
+        done[number] = metrics
+        if checkpoint_dir is not None:
+            _save_chunk(checkpoint_dir, number, metrics)
+
+    names = METRICS + EXTRA_METRICS
+    metrics = [done[number] for number in sorted(chunks)] or [np.empty((0, len(names)))]
+    metrics = pd.DataFrame(np.concatenate(metrics), columns=names)
+    return pd.concat([grid, metrics], axis="columns")
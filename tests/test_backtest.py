@@ -0,0 +1,129 @@
+"""Tests of the vectorized backtests of fico.backtest against per-row loops."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from fico.backtest import WEIGHT_TOLERANCE, backtest_shares, backtest_weights
+
+START_CAPITAL = 10000.0
+COST_RATE = 0.001
+FIXED_COST = 1.0
+
+
+@pytest.fixture
+def close():
+    """Prices of three tickers, one listed late and one with missing days."""
+    rng = np.random.default_rng(0)
+    dates = pd.bdate_range("2020-01-01", periods=40)
+    close = pd.DataFrame(
+        20 * np.exp(np.cumsum(rng.normal(0, 0.02, (40, 3)), axis=0)),
+        index=dates,
+        columns=["AAAA3", "BBBB4", "CCCC3"],
+    )
+    close.iloc[:8, 2] = np.nan
+    close.iloc[[15, 16, 30], 1] = np.nan
+    return close
+
+
+def _signals(close, rows, values):
+    return pd.DataFrame(values, index=close.index[rows], columns=close.columns)
+
+
+def _weights_loop(close, weights):
+    """Rebalance to the target weights one date at a time."""
+    prices = close.ffill().to_numpy()
+    shares = np.zeros(close.shape[1])
+    cash = START_CAPITAL
+    totals, costs = [], []
+    for date, price in zip(close.index, prices, strict=True):
+        cost = 0.0
+        held = np.where(shares != 0, shares * np.nan_to_num(price), 0.0)
+        if date in weights.index:
+            value = cash + held.sum()
+            drifted = held / value
+            target = np.nan_to_num(weights.loc[date].to_numpy(dtype=float))
+            target[np.isnan(price)] = 0.0
+            traded = np.abs(target - drifted)
+            traded[traded < WEIGHT_TOLERANCE] = 0.0
+            cost = COST_RATE * traded.sum() * value + FIXED_COST * (traded > 0).sum()
+            value -= cost
+            shares = np.where(target != 0, target * value / price, 0.0)
+            cash = value * (1 - target.sum())
+            held = np.where(shares != 0, shares * np.nan_to_num(price), 0.0)
+        totals.append(cash + held.sum())
+        costs.append(cost)
+    return np.array(totals), np.array(costs)
+
+
+def _shares_loop(close, counts):
+    """Trade to the share counts one date at a time."""
+    prices = np.nan_to_num(close.ffill().to_numpy())
+    shares = np.zeros(close.shape[1])
+    cash = START_CAPITAL
+    totals, costs = [], []
+    for date, price in zip(close.index, prices, strict=True):
+        cost = 0.0
+        if date in counts.index:
+            target = np.nan_to_num(counts.loc[date].to_numpy(dtype=float))
+            trade = target - shares
+            cost = (COST_RATE * np.abs(trade) * price).sum() + FIXED_COST * (
+                trade != 0
+            ).sum()
+            cash -= (trade * price).sum() + cost
+            shares = target
+        totals.append(cash + (shares * price).sum())
+        costs.append(cost)
+    return np.array(totals), np.array(costs)
+
+
+def test_backtest_weights_matches_loop(close):
+    """Drift, costs, flat (all cash) and NaN target rows match the loop."""
+    weights = _signals(
+        close,
+        [2, 5, 10, 17, 25, 33],
+        [
+            [0.5, 0.5, 0.0],
+            [0.5, 0.5, 0.0],  # unchanged targets: only the drift is traded
+            [0.2, 0.3, 0.4],
+            [0.0, 0.0, 0.0],  # flat: everything back to cash
+            [np.nan, np.nan, np.nan],  # missing targets are flat too
+            [np.nan, 0.6, 0.3],
+        ],
+    )
+    portfolio, assets = backtest_weights(
+        close,
+        weights,
+        start_capital=START_CAPITAL,
+        cost_rate=COST_RATE,
+        fixed_cost=FIXED_COST,
+    )
+    totals, costs = _weights_loop(close, weights)
+    np.testing.assert_allclose(portfolio["Portfolio Total"], totals)
+    np.testing.assert_allclose(portfolio["Transaction Costs"], costs, atol=1e-9)
+    assert (assets["Position"].iloc[17:25] == 0).all(axis=None)
+
+
+def test_backtest_shares_matches_loop(close):
+    """Share counts with flat and NaN rows match the loop."""
+    counts = _signals(
+        close,
+        [0, 4, 9, 20, 28],
+        [
+            [100.0, -50.0, 0.0],
+            [100.0, -50.0, 0.0],  # unchanged counts: no trade
+            [np.nan, 20.0, 30.0],  # missing count: the position is closed
+            [0.0, 0.0, 0.0],
+            [10.0, np.nan, 5.0],
+        ],
+    )
+    portfolio, assets = backtest_shares(
+        close,
+        counts,
+        start_capital=START_CAPITAL,
+        cost_rate=COST_RATE,
+        fixed_cost=FIXED_COST,
+    )
+    totals, costs = _shares_loop(close, counts)
+    np.testing.assert_allclose(portfolio["Portfolio Total"], totals)
+    np.testing.assert_allclose(portfolio["Transaction Costs"], costs)
+    assert (assets["Entry/Exit Position"].iloc[4] == 0).all()
@@ -0,0 +1,41 @@
+"""Tests of the bootstrap confidence intervals of fico.bootstrap."""
+import numpy as np
+import pytest
+
+from fico.bootstrap import bootstrap, bootstrap_indices, mean_statistic
+
+N_REPLICATES = 1200
+N_ROWS = 100
+BLOCK_SIZE = 10
+
+
+@pytest.fixture
+def values():
+    """Daily returns of three strategies."""
+    return np.random.default_rng(0).normal(0.001, 0.02, (250, 3))
+
+
+@pytest.mark.parametrize("method", ["block", "stationary"])
+def test_same_seed_gives_the_same_replicates(values, method):
+    """A seed fixes the replicates, serially or on a process pool."""
+    options = {"n_replicates": N_REPLICATES, "method": method, "chunk_size": 500}
+    first = bootstrap(values, mean_statistic, seed=7, max_workers=1, **options)
+    again = bootstrap(values, mean_statistic, seed=7, max_workers=1, **options)
+    pooled = bootstrap(values, mean_statistic, seed=7, max_workers=2, **options)
+    other = bootstrap(values, mean_statistic, seed=8, max_workers=1, **options)
+    assert first.shape == (N_REPLICATES, values.shape[1])
+    np.testing.assert_array_equal(first, again)
+    np.testing.assert_array_equal(first, pooled)
+    assert not np.array_equal(first, other)
+
+
+@pytest.mark.parametrize("method", ["block", "stationary"])
+def test_indices_are_runs_of_consecutive_rows(method):
+    """Resamples keep the rows of a block together."""
+    rng = np.random.default_rng(0)
+    indices = bootstrap_indices(N_ROWS, 50, BLOCK_SIZE, method, rng)
+    assert indices.shape == (50, N_ROWS)
+    assert ((indices >= 0) & (indices < N_ROWS)).all()
+    # Steps of one row, but at the starts of the blocks (one in BLOCK_SIZE):
+    jumps = (np.diff(indices, axis=1) % N_ROWS) != 1
+    assert jumps.mean() < 2 / BLOCK_SIZE
@@ -0,0 +1,103 @@
+"""Tests of the batched metrics of fico.evaluation."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from fico.evaluation import (
+    algo_evaluation,
+    batch_signals,
+    evaluate_returns,
+    generate_signals,
+    trade_evaluation,
+)
+
+# Entry, repeated signal, exit, NaN signal, re-entry lost to the NaN, exit and
+# a last entry still open:
+CLOSE = [10.0, 11.0, 12.0, 13.0, 13.0, 14.0, 15.0, 16.0]
+BUY_SIGNAL = [0.0, 1.0, 1.0, 0.0, np.nan, 1.0, 0.0, 1.0]
+
+
+def test_evaluate_returns_matches_pandas_per_column():
+    """Volatility and Sharpe ratio match the pandas definitions."""
+    rng = np.random.default_rng(0)
+    returns = pd.DataFrame(rng.normal(0.001, 0.02, (300, 3)), columns=list("abc"))
+    returns.iloc[:50, 1] = np.nan
+    metrics = evaluate_returns(returns)
+    volatility = returns.std() * np.sqrt(252)
+    sharpe = returns.mean() * 252 / volatility
+    assert metrics.loc["Annual Volatility"].to_numpy() == pytest.approx(volatility)
+    assert metrics.loc["Sharpe Ratio"].to_numpy() == pytest.approx(sharpe)
+
+
+def test_evaluate_returns_without_enough_returns_is_nan():
+    """Columns with fewer than two returns have no volatility (not -0.0)."""
+    returns = np.array([[np.nan, np.nan], [np.nan, 0.02], [np.nan, np.nan]])
+    metrics = evaluate_returns(returns)
+    assert np.isnan(metrics.loc["Annual Volatility"]).all()
+    assert np.isnan(metrics.loc["Sharpe Ratio"]).all()
+
+
+@pytest.fixture
+def signals():
+    """generate_signals of the known frame, 10 shares and 1000 of capital."""
+    frame = pd.DataFrame(
+        {"Close": CLOSE, "Buy Signal": BUY_SIGNAL},
+        index=pd.date_range("2020-01-01", periods=len(CLOSE), name="date"),
+    )
+    return generate_signals(frame, start_capital=1000, share_count=10)
+
+
+def test_generate_signals_known_values(signals):
+    """Positions, cash and totals follow the pandas diff/cumsum semantics."""
+    nan = np.nan
+    expected = {
+        "Entry/Exit": [nan, 1, 0, -1, nan, nan, -1, 1],
+        "Entry/Exit Position": [nan, 10, 0, -10, nan, nan, -10, 10],
+        "Portfolio Holdings": [nan, 110, 120, 0, nan, nan, -150, 0],
+        "Portfolio Cash": [nan, 890, 890, 1020, nan, nan, 1170, 1010],
+        "Portfolio Total": [nan, 1000, 1010, 1020, nan, nan, 1020, 1010],
+        # Missing totals are padded, so their returns are 0:
+        "Portfolio Daily Returns": [
+            nan,
+            nan,
+            0.01,
+            1020 / 1010 - 1,
+            0,
+            0,
+            0,
+            1010 / 1020 - 1,
+        ],
+        "Portfolio Cumulative Returns": [nan, nan, 0.01, 0.02, 0.02, 0.02, 0.02, 0.01],
+    }
+    for column, values in expected.items():
+        np.testing.assert_allclose(signals[column], values, err_msg=column)
+    batch = batch_signals(np.array([CLOSE]).T, np.array([BUY_SIGNAL]).T, 1000, 10)
+    for column in expected:
+        np.testing.assert_allclose(batch[column][:, 0], signals[column])
+
+
+def test_trade_evaluation_known_trades(signals):
+    """Each exit closes the latest entry; the open last entry is left out."""
+    trades = trade_evaluation(signals)
+    entry = signals.index[1]
+    assert trades["Entry Date"].tolist() == [entry, entry]
+    assert trades["Exit Date"].tolist() == list(signals.index[[3, 6]])
+    assert trades["Shares"].tolist() == [10, 10]
+    assert trades["Entry Share Price"].tolist() == [11, 11]
+    assert trades["Exit Share Price"].tolist() == [13, 15]
+    assert trades["Entry Portfolio Holding"].tolist() == [1000, 1000]
+    assert trades["Exit Portfolio Holding"].tolist() == [1020, 1020]
+    assert trades["Profit/Loss"].tolist() == [20, 20]
+
+
+def test_algo_evaluation_known_metrics(signals):
+    """The metrics are the pandas ones of the known daily returns."""
+    returns = pd.Series([0.01, 1020 / 1010 - 1, 0, 0, 0, 1010 / 1020 - 1])
+    downside = np.sqrt((returns[returns < 0] ** 2).sum() / len(signals))
+    metrics = algo_evaluation(signals)["Backtest"]
+    assert metrics["Annual Return"] == pytest.approx(returns.mean() * 252)
+    assert metrics["Cumulative Returns"] == pytest.approx(0.01)
+    assert metrics["Annual Volatility"] == pytest.approx(returns.std() * np.sqrt(252))
+    assert metrics["Sortino Ratio"] == pytest.approx(
+        returns.mean() * 252 / (downside * np.sqrt(252)),
+    )
@@ -0,0 +1,49 @@
+"""Tests of the Fama-MacBeth regressions of fico.fama_macbeth."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from fico.fama_macbeth import fama_macbeth
+
+# Per-date intercepts and slopes, alternating around their means:
+INTERCEPTS = [1.0, -1.0, 1.0, -1.0]
+SLOPES = [2.0, 3.0, 2.0, 3.0]
+
+
+@pytest.fixture
+def panels():
+    """Returns fitted exactly by the per-date intercepts and slopes."""
+    dates = pd.bdate_range("2020-01-01", periods=len(INTERCEPTS))
+    tickers = ["AAAA3", "BBBB4", "CCCC3", "DDDD11"]
+    characteristic = pd.DataFrame(
+        np.tile([0.5, 1.0, 1.5, 3.0], (len(dates), 1)),
+        index=dates,
+        columns=tickers,
+    )
+    returns = characteristic.mul(SLOPES, axis="index").add(INTERCEPTS, axis="index")
+    return returns, {"beta": characteristic}
+
+
+def test_per_date_coefficients_are_exact(panels):
+    """Each date recovers its intercept and slope."""
+    returns, characteristics = panels
+    result = fama_macbeth(returns, characteristics, newey_west_lags=0)
+    np.testing.assert_allclose(result["gamma"]["intercept"], INTERCEPTS)
+    np.testing.assert_allclose(result["gamma"]["beta"], SLOPES)
+    assert result["premia"].tolist() == pytest.approx([0.0, 2.5])
+
+
+@pytest.mark.parametrize(
+    ("lags", "stderr"),
+    [
+        # Deviations of +-1: variance 1, divided by 4 dates.
+        (0, [0.5, 0.25]),
+        # The lag-1 autocovariance is -3/4, weighted by 1/2: (1 - 3/4) / 4.
+        (1, [0.25, 0.125]),
+    ],
+)
+def test_newey_west_stderr_known_answer(panels, lags, stderr):
+    """Standard errors of alternating coefficients, computed by hand."""
+    returns, characteristics = panels
+    result = fama_macbeth(returns, characteristics, newey_west_lags=lags)
+    assert result["stderr"].tolist() == pytest.approx(stderr)
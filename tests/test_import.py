@@ -0,0 +1,64 @@
+"""Import-time budget of the fico package.
+
+Each check runs in a fresh interpreter, since the modules are cached after
+the first import.
+"""
+import re
+import subprocess
+import sys
+from pathlib import Path
+
+# Budget of fico.portfolio itself, pandas and numpy being already imported
+# (it takes about 25 ms; the margin absorbs slow machines):
+PORTFOLIO_IMPORT_BUDGET_SECONDS = 0.25
+
+PLOTTING_MODULES = ("seaborn", "matplotlib")
+
+REPOSITORY = Path(__file__).resolve().parents[1]
+
+# Lines of -X importtime: "import time: self [us] | cumulative | name":
+IMPORT_TIME_LINE = re.compile(r"import time:\s+\d+ \|\s+(\d+) \| \s*(\S+)$")
+
+
+def _run(code, *options):
+    """Run python code in a fresh interpreter and return its stdout and stderr."""
+    result = subprocess.run(
+        [sys.executable, *options, "-c", code],
+        cwd=REPOSITORY,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return result.stdout, result.stderr
+
+
+def _loaded(imports, prefixes):
+    """Top-level modules among prefixes loaded after running the imports."""
+    code = (
+        f"import sys\n{imports}\n"
+        "print(' '.join(sorted({name.split('.')[0] for name in sys.modules})))"
+    )
+    stdout, _ = _run(code)
+    return sorted(set(stdout.split()) & set(prefixes))
+
+
+def test_import_fico_loads_no_dependency():
+    """The package namespace is lazy: not even pandas is imported."""
+    assert _loaded("import fico", ("pandas", "numpy", *PLOTTING_MODULES)) == []
+
+
+def test_import_portfolio_skips_plotting_libraries():
+    """Seaborn and matplotlib are only imported by analyse_stock."""
+    assert _loaded("import fico.portfolio", PLOTTING_MODULES) == []
+
+
+def test_import_portfolio_within_budget():
+    """fico.portfolio imports within its budget on top of pandas and numpy."""
+    _, stderr = _run("import numpy, pandas\nimport fico.portfolio", "-X", "importtime")
+    cumulative = {
+        match[2]: int(match[1])
+        for match in map(IMPORT_TIME_LINE.match, stderr.splitlines())
+        if match
+    }
+    seconds = cumulative["fico.portfolio"] / 1e6
+    assert seconds < PORTFOLIO_IMPORT_BUDGET_SECONDS
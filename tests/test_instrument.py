@@ -0,0 +1,83 @@
+"""Tests of the opt-in instrumentation of fico.instrument."""
+import threading
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from fico import instrument
+from fico.portfolio import process_stock
+
+# Memory allocated by _allocate, in MiB:
+ALLOCATED_MIB = 32
+# Seconds to wait for the other thread before failing:
+TIMEOUT = 10
+
+_allocated = threading.Event()
+_started = threading.Event()
+
+
+@instrument.instrument
+def _allocate():
+    """Allocate and free ALLOCATED_MIB, then wait for _start to run."""
+    block = bytearray(ALLOCATED_MIB * 2**20)
+    del block
+    _allocated.set()
+    assert _started.wait(TIMEOUT)
+
+
+@instrument.instrument
+def _start():
+    """Let _allocate return."""
+    _started.set()
+
+
+def _start_after():
+    """Call _start once _allocate has freed its memory."""
+    assert _allocated.wait(TIMEOUT)
+    _start()
+
+
+def _stock():
+    """Small frame with the columns read by process_stock."""
+    return pd.DataFrame(
+        {"fech_ajustado": [10.0, 11.0, None], "variacao(pct)": [1.0, 10.0, 2.0]},
+    )
+
+
+def test_profiling_records_the_calls_and_switches_off():
+    """Calls are recorded inside the block only, with their rows in and out."""
+    with instrument.profiling(memory=True) as sink:
+        process_stock(_stock())
+    process_stock(_stock())
+    records = sink.to_frame()
+    assert records["function"].tolist() == ["fico.portfolio.process_stock"]
+    assert records[["rows_in", "rows_out"]].iloc[0].tolist() == [3, 2]
+    assert records["peak_mib"].iloc[0] >= 0
+    assert not tracemalloc.is_tracing()
+
+
+def test_enable_replaces_the_sinks():
+    """Enabling again sends the records to the new sinks only."""
+    first, second = instrument.MemorySink(), instrument.MemorySink()
+    try:
+        instrument.enable(first)
+        instrument.enable(second)
+        process_stock(_stock())
+    finally:
+        instrument.disable()
+    assert first.records == []
+    assert len(second.records) == 1
+
+
+def test_concurrent_calls_keep_their_peaks():
+    """A call starting on another thread does not wipe the peak of a running one."""
+    _allocated.clear()
+    _started.clear()
+    with instrument.profiling(memory=True) as sink, ThreadPoolExecutor(2) as pool:
+        futures = [pool.submit(_allocate), pool.submit(_start_after)]
+        for future in futures:
+            future.result()
+    peaks = sink.to_frame().set_index("function")["peak_mib"]
+    assert peaks[f"{__name__}._allocate"] >= ALLOCATED_MIB
+    assert peaks[f"{__name__}._start"] < ALLOCATED_MIB
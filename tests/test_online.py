@@ -0,0 +1,51 @@
+"""Tests of the streaming evaluator of fico.online."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from fico.evaluation import METRICS, evaluate_returns, generate_signals
+from fico.online import OnlineEvaluator
+
+N_DATES = 60
+BUY_RATE = 0.5
+
+
+@pytest.fixture
+def frame():
+    """Close prices and buy signals with entries, exits and NaN signals."""
+    rng = np.random.default_rng(0)
+    close = 20 * np.exp(np.cumsum(rng.normal(0, 0.02, N_DATES)))
+    buy_signal = (rng.random(N_DATES) < BUY_RATE).astype(float)
+    buy_signal[[5, 6, 20, 41]] = np.nan
+    return pd.DataFrame(
+        {"Close": close, "Buy Signal": buy_signal},
+        index=pd.bdate_range("2020-01-01", periods=N_DATES),
+    )
+
+
+def test_replay_matches_the_batch_results(frame):
+    """Bars added one by one or in batches give the generate_signals rows."""
+    evaluator = OnlineEvaluator(start_capital=10000, share_count=100)
+    first = pd.DataFrame(
+        [
+            evaluator.update(close, buy_signal)
+            for close, buy_signal in frame.iloc[:30].to_numpy()
+        ],
+        index=frame.index[:30],
+    )
+    rest = evaluator.update_many(frame.iloc[30:])
+    streamed = pd.concat([first, rest])
+
+    expected = generate_signals(frame, start_capital=10000, share_count=100)
+    pd.testing.assert_frame_equal(streamed, expected[streamed.columns])
+    assert np.isfinite(streamed["Portfolio Total"].iloc[-1])
+
+    metrics = evaluate_returns(
+        expected[["Portfolio Daily Returns"]],
+        expected[["Portfolio Cumulative Returns"]],
+    ).loc[METRICS]
+    np.testing.assert_allclose(
+        evaluator.metrics()["Backtest"],
+        metrics.iloc[:, 0],
+        rtol=1e-9,
+    )
@@ -0,0 +1,100 @@
+"""Tests of the memoized stock pipeline of fico.pipeline."""
+import pandas as pd
+import pytest
+
+from benchmarks import synthetic
+from fico.pipeline import stock_pipeline
+
+pytest.importorskip("openpyxl")
+
+YEARS = 1
+
+
+def signal_model(split):
+    """Buy when the market factor of the day is positive."""
+    _, x_test, _, y_test, close_test = split
+    frame = pd.DataFrame({"Close": close_test, "Returns": y_test})
+    frame["Buy Signal"] = (x_test["mkt-rf"] > 0).astype(float)
+    return frame
+
+
+def no_returns_model(split):
+    """Signal model that leaves out the Returns column."""
+    return signal_model(split).drop(columns="Returns")
+
+
+@pytest.fixture
+def dirs(tmp_path):
+    """Synthetic factor files and stock csv files, and a cache directory."""
+    synthetic.write_factor_files(tmp_path / "factors", YEARS)
+    tickers = synthetic.write_stock_files(tmp_path / "stocks", 2, YEARS)
+    return {
+        "tickers": tickers,
+        "factors_dir": tmp_path / "factors",
+        "stocks_dir": tmp_path / "stocks",
+        "cache_dir": tmp_path / "cache",
+    }
+
+
+def _run(dirs, model=signal_model, **params):
+    pipeline = stock_pipeline(
+        dirs["tickers"],
+        model,
+        cache_dir=dirs["cache_dir"],
+        factors_dir=dirs["factors_dir"],
+        stocks_dir=dirs["stocks_dir"],
+        max_workers=2,
+        **params,
+    )
+    return pipeline, pipeline.run()
+
+
+def _computed(pipeline):
+    return {name for name, status in pipeline.last_run.items() if status == "computed"}
+
+
+def test_second_run_hits_the_cache(dirs):
+    """A second run loads the targets and gives the same outputs."""
+    pipeline, first = _run(dirs)
+    assert "factors" in _computed(pipeline)
+    pipeline, second = _run(dirs)
+    assert _computed(pipeline) == set()
+    assert set(pipeline.last_run) == set(first)
+    for name, output in first.items():
+        pd.testing.assert_frame_equal(second[name], output)
+
+
+def test_changed_csv_recomputes_only_its_ticker(dirs):
+    """Rewriting one stock file recomputes the stages of that ticker only."""
+    _run(dirs)
+    changed, unchanged = dirs["tickers"]
+    synthetic.stock_frame(YEARS, seed=99).to_csv(
+        dirs["stocks_dir"] / f"{changed}.csv",
+        index=False,
+    )
+    pipeline, _ = _run(dirs)
+    stages = ["stock", "processed", "merged", "split", "predicted", "signals"]
+    targets = ["vs_underlying", "trades"]
+    assert _computed(pipeline) == {f"{stage}/{changed}" for stage in stages + targets}
+    assert all(
+        pipeline.last_run[f"{stage}/{unchanged}"] == "cached" for stage in targets
+    )
+
+
+def test_changed_param_invalidates_the_stages_below(dirs):
+    """A new split rate recomputes the split and the stages below it."""
+    _run(dirs)
+    pipeline, _ = _run(dirs, rate=0.7)
+    below = ["split", "predicted", "signals", "vs_underlying", "trades"]
+    assert _computed(pipeline) == {
+        f"{stage}/{ticker}" for stage in below for ticker in dirs["tickers"]
+    }
+    assert all(
+        pipeline.last_run[f"merged/{ticker}"] == "cached" for ticker in dirs["tickers"]
+    )
+
+
+def test_signal_model_without_returns_is_rejected(dirs):
+    """The signal model output is checked before algo_vs_underlying reads it."""
+    with pytest.raises(ValueError, match="Returns"):
+        _run(dirs, model=no_returns_model)
@@ -0,0 +1,87 @@
+"""Tests of the stock readers of fico.portfolio."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks import synthetic
+from fico import portfolio
+from fico.portfolio import (
+    Portifolio,
+    build_stock_store,
+    choose_stock,
+    load_stock_panel,
+)
+
+HEADER = (
+    "data,fech_ajustado,variacao(pct),fech_historico,abertura_ajustado,"
+    "min_ajustado,medio_ajustado,max_ajustado,vol_(mm_r$),negocios,fator,tipo,"
+    "quant_em_aluguel,vol_em_aluguel(mm_r$)\n"
+)
+ROWS = [
+    (
+        '03/01/2000,"10,5","1,0","11,0","10,0","9,5","10,2","10,8","1,5","100","1",'
+        'PN,"5","0,1"\n'
+    ),
+    # Empty numeric and type cells:
+    (
+        '04/01/2000,"10,6","0,9",,"10,1","9,6","10,3","10,9","1,6","110","1",,'
+        '"6","0,2"\n'
+    ),
+    (
+        '05/01/2000,nd,nd,"11,2","10,2","9,7","10,4","11,0","1,7","120","1",'
+        'PN,"7","0,3"\n'
+    ),
+]
+
+
+@pytest.fixture
+def stocks_dir(tmp_path):
+    """Directory with one stock csv file holding empty cells."""
+    (tmp_path / "ABCD3.csv").write_text(HEADER + "".join(ROWS))
+    return tmp_path
+
+
+@pytest.mark.parametrize("pyarrow", [True, False])
+def test_choose_stock_reads_empty_cells_as_nan(stocks_dir, monkeypatch, pyarrow):
+    """Empty cells are missing values, like the "nd" markers, on both engines."""
+    monkeypatch.setattr(portfolio, "parquet_available", lambda: pyarrow)
+    stock = choose_stock("ABCD3", stocks_dir=stocks_dir, use_store=False)
+    assert stock.index.tolist() == ["2000/01/03", "2000/01/04", "2000/01/05"]
+    assert stock["fech_historico"].dtype == np.float64
+    assert np.isnan(stock.loc["2000/01/04", "fech_historico"])
+    missing_type = stock["tipo"].tolist()[1]
+    assert isinstance(missing_type, float)
+    assert np.isnan(missing_type)
+    assert np.isnan(stock.loc["2000/01/05", "fech_ajustado"])
+    assert stock.loc["2000/01/04", "fech_ajustado"] == pytest.approx(10.6)
+
+
+def test_store_and_panel_read_empty_cells(stocks_dir):
+    """The store and the panel read the same values as the csv parser."""
+    expected = choose_stock("ABCD3", stocks_dir=stocks_dir, use_store=False)
+    build_stock_store(stocks_dir, use_processes=False)
+    stored = choose_stock("ABCD3", stocks_dir=stocks_dir)
+    pd.testing.assert_frame_equal(stored, expected, check_dtype=False)
+    panel, _ = load_stock_panel(
+        ["ABCD3"],
+        stocks_dir=stocks_dir,
+        max_workers=1,
+        use_processes=False,
+    )
+    # process_stock drops the row whose close price is missing:
+    assert panel["Close"]["ABCD3"].tolist() == pytest.approx([10.5, 10.6])
+
+
+def test_size_and_value_portfolios_on_preprocessed_frame():
+    """The size and value legs rank the columns made by pre_processing."""
+    frame = synthetic.fundamentals_frame(30, 2)
+    portifolio = Portifolio(frame)
+    portifolio.pre_processing()
+    small = portifolio.build_size_portfolio(k=3)
+    value = portifolio.build_value_portfolio(k=3)
+    n_dates = portifolio.frame["date"].nunique()
+    assert len(small) == len(value) == n_dates
+    smallest = portifolio.frame.groupby("date")["mkt_value"].nsmallest(3)
+    assert sorted(portifolio.size_small["mkt_value"]) == sorted(smallest)
+    highest = portifolio.frame.groupby("date")["B/M"].nlargest(3)
+    assert sorted(portifolio.value["B/M"]) == sorted(highest)
@@ -0,0 +1,99 @@
+"""Tests of the batched factor regressions of fico.regression."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from fico.regression import FACTOR_COLUMNS, factor_regression, rolling_factor_betas
+
+N_DATES = 120
+TICKERS = ["AAAA3", "BBBB4", "CCCC3"]
+
+
+@pytest.fixture
+def data():
+    """Factor returns and stock returns with missing days."""
+    rng = np.random.default_rng(0)
+    dates = pd.bdate_range("2020-01-01", periods=N_DATES, name="date")
+    factors = pd.DataFrame(
+        rng.normal(0, 0.01, (N_DATES, len(FACTOR_COLUMNS))),
+        index=dates,
+        columns=FACTOR_COLUMNS,
+    )
+    factors["Risk_free"] = 0.0001
+    betas = rng.normal(1, 0.3, (len(FACTOR_COLUMNS), len(TICKERS)))
+    returns = pd.DataFrame(
+        factors[FACTOR_COLUMNS].to_numpy() @ betas
+        + rng.normal(0, 0.01, (N_DATES, len(TICKERS))),
+        index=dates,
+        columns=TICKERS,
+    )
+    returns.iloc[10:25, 1] = np.nan
+    returns.iloc[[3, 50, 99], 2] = np.nan
+    return returns, factors
+
+
+def _lstsq(returns, factors, ticker):
+    """Design matrix, coefficients and residuals of one ticker."""
+    valid = returns[ticker].notna().to_numpy()
+    y = (returns[ticker] - factors["Risk_free"]).to_numpy()[valid]
+    x = np.column_stack([np.ones(valid.sum()), factors[FACTOR_COLUMNS][valid]])
+    coef = np.linalg.lstsq(x, y, rcond=None)[0]
+    return x, coef, y - x @ coef
+
+
+def test_factor_regression_matches_lstsq(data):
+    """Coefficients, residual variances and standard errors of plain OLS."""
+    returns, factors = data
+    result = factor_regression(returns, factors)
+    for ticker in TICKERS:
+        x, coef, residuals = _lstsq(returns, factors, ticker)
+        dof = len(x) - x.shape[1]
+        sigma2 = residuals @ residuals / dof
+        stderr = np.sqrt(np.diag(np.linalg.inv(x.T @ x)) * sigma2)
+        np.testing.assert_allclose(result["coef"].loc[ticker], coef)
+        assert result["resid_var"][ticker] == pytest.approx(sigma2)
+        np.testing.assert_allclose(result["stderr"].loc[ticker], stderr)
+        assert result["nobs"][ticker] == len(x)
+
+
+def _newey_west_stderr(x, residuals, lags):
+    """Newey-West standard errors summed term by term."""
+    scores = x * residuals[:, None]
+    meat = scores.T @ scores
+    for lag in range(1, lags + 1):
+        weight = 1 - lag / (lags + 1)
+        for t in range(lag, len(x)):
+            cross = np.outer(scores[t], scores[t - lag])
+            meat += weight * (cross + cross.T)
+    bread = np.linalg.inv(x.T @ x)
+    return np.sqrt(np.diag(bread @ meat @ bread))
+
+
+@pytest.mark.parametrize("lags", [0, 3])
+def test_newey_west_stderr_matches_definition(data, lags):
+    """Without lags the HAC errors are White's; with lags, the Bartlett sums."""
+    returns, factors = data
+    result = factor_regression(returns[["AAAA3"]], factors, newey_west_lags=lags)
+    x, _, residuals = _lstsq(returns, factors, "AAAA3")
+    expected = _newey_west_stderr(x, residuals, lags)
+    np.testing.assert_allclose(result["stderr"].loc["AAAA3"], expected)
+    if lags == 0:
+        bread = np.linalg.inv(x.T @ x)
+        white = bread @ (x.T * residuals**2) @ x @ bread
+        np.testing.assert_allclose(expected, np.sqrt(np.diag(white)))
+
+
+def test_rolling_factor_betas_match_lstsq_per_window(data):
+    """Every window is the OLS of its valid rows, NaN below min_periods."""
+    returns, factors = data
+    window, min_periods = 30, 20
+    betas = rolling_factor_betas(returns, factors, window, min_periods=min_periods)
+    for ticker in TICKERS:
+        for row in range(N_DATES):
+            rows = slice(max(0, row - window + 1), row + 1)
+            got = betas.xs(ticker, axis="columns", level="ticker").iloc[row]
+            if returns[ticker].iloc[rows].notna().sum() < min_periods:
+                assert got.isna().all()
+                continue
+            _, coef, _ = _lstsq(returns.iloc[rows], factors.iloc[rows], ticker)
+            np.testing.assert_allclose(got, coef, atol=1e-10)
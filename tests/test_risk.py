@@ -0,0 +1,83 @@
+"""Tests of the factor covariance model of fico.risk."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from fico.risk import FactorCovariance, minimum_variance, risk_parity
+
+N_STOCKS = 60
+N_FACTORS = 4
+
+
+@pytest.fixture
+def covariance():
+    """Factor covariance of a few stocks with a singular factor covariance."""
+    rng = np.random.default_rng(0)
+    tickers = [f"S{i:03d}" for i in range(N_STOCKS)]
+    loadings = pd.DataFrame(
+        rng.normal(1, 0.5, (N_STOCKS, N_FACTORS)),
+        index=tickers,
+        columns=list("abcd"),
+    )
+    root = rng.normal(0, 0.1, (N_FACTORS, N_FACTORS - 1))
+    specific = rng.uniform(0.01, 0.2, N_STOCKS)
+    return FactorCovariance(loadings, root @ root.T, specific)
+
+
+def _dense(covariance):
+    """The N x N matrix, only to check the factor form on small examples."""
+    loadings = covariance.loadings
+    return loadings @ covariance.factor_covariance @ loadings.T + np.diag(
+        covariance.specific_variance,
+    )
+
+
+def test_products_and_solves_match_the_dense_matrix(covariance):
+    """dot, solve, diagonal and variance agree with the dense matrix."""
+    dense = _dense(covariance)
+    values = np.random.default_rng(1).normal(size=(N_STOCKS, 3))
+    np.testing.assert_allclose(covariance.dot(values), dense @ values)
+    np.testing.assert_allclose(
+        covariance.solve(values),
+        np.linalg.solve(dense, values),
+        rtol=1e-8,
+    )
+    np.testing.assert_allclose(covariance.diagonal(), np.diag(dense))
+    weights = values[:, 0]
+    assert covariance.variance(weights) == pytest.approx(weights @ dense @ weights)
+
+
+def test_align_reindexes_series(covariance):
+    """Series are put in the order of the tickers."""
+    series = pd.Series(np.arange(N_STOCKS, dtype=float), index=covariance.tickers)
+    np.testing.assert_array_equal(covariance.align(series[::-1]), series.to_numpy())
+
+
+def test_minimum_variance(covariance):
+    """Unconstrained and long-only weights satisfy the optimality conditions."""
+    dense = _dense(covariance)
+    expected = np.linalg.solve(dense, np.ones(N_STOCKS))
+    weights = minimum_variance(covariance)
+    np.testing.assert_allclose(weights, expected / expected.sum(), atol=1e-12)
+
+    long_only = minimum_variance(covariance, long_only=True).to_numpy()
+    marginal = dense @ long_only
+    variance = long_only @ marginal
+    held = long_only > 0
+    assert long_only.min() >= 0
+    assert long_only.sum() == pytest.approx(1)
+    np.testing.assert_allclose(marginal[held], variance)
+    assert (marginal[~held] >= variance - 1e-12).all()
+
+
+def test_risk_parity_matches_the_budgets(covariance):
+    """Risk contributions equal the (normalized) budgets."""
+    budgets = np.random.default_rng(2).uniform(1, 3, N_STOCKS)
+    weights = risk_parity(covariance, budgets)
+    np.testing.assert_allclose(
+        covariance.risk_contributions(weights),
+        budgets / budgets.sum(),
+        atol=1e-10,
+    )
+    equal = covariance.risk_contributions(risk_parity(covariance))
+    np.testing.assert_allclose(equal, 1 / N_STOCKS, atol=1e-10)
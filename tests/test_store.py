@@ -0,0 +1,139 @@
+"""Tests of the incremental updates of the panel store."""
+import shutil
+
+import pandas as pd
+import pytest
+
+from benchmarks import synthetic
+from fico.cache import file_fingerprint
+from fico.portfolio import (
+    STORE_DIR_NAME,
+    build_stock_store,
+    choose_stock,
+    load_stock_panel,
+    update_stock_store,
+)
+from fico.store import open_store
+
+YEARS = 0.5
+BASE_ROWS = 100
+TICKERS = ["AAAA3", "BBBB4"]
+
+
+def _csv_lines(ticker, seed=None):
+    """Lines (header first) of the synthetic csv file of a ticker."""
+    seed = TICKERS.index(ticker) if seed is None else seed
+    text = synthetic.stock_frame(YEARS, seed=seed).to_csv(index=False)
+    return text.splitlines(keepends=True)
+
+
+def _rows(ticker, start, stop):
+    """Data rows start to stop (excluded) of the csv file of a ticker."""
+    return "".join(_csv_lines(ticker)[start + 1 : stop + 1])
+
+
+def _append(stocks_dir, ticker, text):
+    with (stocks_dir / f"{ticker}.csv").open("a") as file:
+        file.write(text)
+
+
+@pytest.fixture
+def stocks_dir(tmp_path):
+    """Stock csv files holding their first BASE_ROWS rows, ingested in a store."""
+    directory = tmp_path / "stocks"
+    directory.mkdir()
+    for ticker in TICKERS:
+        (directory / f"{ticker}.csv").write_text(
+            "".join(_csv_lines(ticker)[: BASE_ROWS + 1]),
+        )
+    build_stock_store(directory, use_processes=False)
+    return directory
+
+
+def _store(stocks_dir):
+    return open_store(stocks_dir / STORE_DIR_NAME)
+
+
+def _assert_store_matches_csv(stocks_dir, tmp_path):
+    """The store holds the panel parsed from (copies of) the csv files."""
+    csv_dir = tmp_path / "csv"
+    shutil.rmtree(csv_dir, ignore_errors=True)
+    shutil.copytree(stocks_dir, csv_dir, ignore=shutil.ignore_patterns(".*"))
+    expected, _ = load_stock_panel(
+        TICKERS,
+        as_datetime=True,
+        stocks_dir=csv_dir,
+        processed=False,
+        max_workers=1,
+        use_processes=False,
+    )
+    store = _store(stocks_dir)
+    stored = store.panel()
+    pd.testing.assert_frame_equal(
+        stored,
+        expected.reindex(columns=stored.columns),
+        check_freq=False,
+    )
+    for ticker in TICKERS:
+        assert store.is_fresh(ticker, file_fingerprint(stocks_dir / f"{ticker}.csv"))
+
+
+def test_append_goes_to_the_tail(stocks_dir, tmp_path):
+    """New rows are appended in a tail segment, the base is kept."""
+    for ticker in TICKERS:
+        _append(stocks_dir, ticker, _rows(ticker, BASE_ROWS, BASE_ROWS + 10))
+    result = update_stock_store(stocks_dir)
+    assert result == {"appended": TICKERS, "stale": [], "new": []}
+    store = _store(stocks_dir)
+    assert [stop - first for first, stop, _ in store.segments] == [BASE_ROWS, 10]
+    _assert_store_matches_csv(stocks_dir, tmp_path)
+
+
+def test_rewritten_csv_is_stale_until_rebuilt(stocks_dir, tmp_path):
+    """A rewritten file is read from its csv file until the store is rebuilt."""
+    changed, unchanged = TICKERS
+    lines = _csv_lines(changed, seed=99)[: BASE_ROWS + 11]
+    (stocks_dir / f"{changed}.csv").write_text("".join(lines))
+    _append(stocks_dir, unchanged, _rows(unchanged, BASE_ROWS, BASE_ROWS + 10))
+    result = update_stock_store(stocks_dir)
+    assert result == {"appended": [unchanged], "stale": [changed], "new": []}
+    pd.testing.assert_frame_equal(
+        choose_stock(changed, stocks_dir=stocks_dir),
+        choose_stock(changed, stocks_dir=stocks_dir, use_store=False),
+    )
+
+    build_stock_store(stocks_dir, use_processes=False)
+    _assert_store_matches_csv(stocks_dir, tmp_path)
+
+
+def test_partial_last_line_is_left_for_later(stocks_dir, tmp_path):
+    """A half written last line is only ingested once it is complete."""
+    ticker = TICKERS[0]
+    rows = _rows(ticker, BASE_ROWS, BASE_ROWS + 5)
+    cut = len(rows) - 10
+    _append(stocks_dir, ticker, rows[:cut])
+    assert update_stock_store(stocks_dir)["appended"] == [ticker]
+    store = _store(stocks_dir)
+    assert len(store.dates) == BASE_ROWS + 4
+    assert not store.is_fresh(ticker, file_fingerprint(stocks_dir / f"{ticker}.csv"))
+
+    _append(stocks_dir, ticker, rows[cut:])
+    assert update_stock_store(stocks_dir)["appended"] == [ticker]
+    assert len(_store(stocks_dir).dates) == BASE_ROWS + 5
+    _assert_store_matches_csv(stocks_dir, tmp_path)
+
+
+def test_long_tail_rebuilds_the_store(stocks_dir, tmp_path):
+    """Crossing max_tail_rows folds the tail back into a single segment."""
+    for ticker in TICKERS:
+        _append(stocks_dir, ticker, _rows(ticker, BASE_ROWS, BASE_ROWS + 10))
+    update_stock_store(stocks_dir, max_tail_rows=15)
+    store = _store(stocks_dir)
+    assert [stop - first for first, stop, _ in store.segments] == [BASE_ROWS, 10]
+
+    for ticker in TICKERS:
+        _append(stocks_dir, ticker, _rows(ticker, BASE_ROWS + 10, BASE_ROWS + 20))
+    update_stock_store(stocks_dir, max_tail_rows=15, max_workers=1)
+    store = _store(stocks_dir)
+    assert [stop - first for first, stop, _ in store.segments] == [BASE_ROWS + 20]
+    _assert_store_matches_csv(stocks_dir, tmp_path)
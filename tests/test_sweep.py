@@ -0,0 +1,67 @@
+"""Tests of the parameter sweep of fico.sweep."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from fico.evaluation import batch_signals, evaluate_returns
+from fico.sweep import parameter_grid, run_sweep
+
+THRESHOLD = 0.2
+
+
+@pytest.fixture
+def panels():
+    """Close prices and scores of a few tickers."""
+    rng = np.random.default_rng(0)
+    shape = (300, 4)
+    tickers = ["AAAA3", "BBBB4", "CCCC3", "DDDD11"]
+    close = pd.DataFrame(
+        30 * np.exp(np.cumsum(rng.normal(0, 0.02, shape), axis=0)),
+        columns=tickers,
+    )
+    score = pd.DataFrame(rng.normal(size=shape), columns=tickers)
+    return close, score
+
+
+def test_run_sweep_matches_batch_signals(panels):
+    """Each row holds the metrics of its combination."""
+    close, score = panels
+    grid = parameter_grid(
+        ["BBBB4", "DDDD11"],
+        share_count=(50,),
+        threshold=(THRESHOLD,),
+    )
+    results = run_sweep(close, score, grid, chunk_size=1)
+    buy_signal = (score[["BBBB4", "DDDD11"]] > THRESHOLD).astype(float)
+    signals = batch_signals(close[["BBBB4", "DDDD11"]], buy_signal, share_count=50)
+    expected = evaluate_returns(
+        signals["Portfolio Daily Returns"],
+        signals["Portfolio Cumulative Returns"],
+    )
+    metrics = results[expected.index].to_numpy()
+    np.testing.assert_allclose(metrics, expected.to_numpy().T)
+
+
+def test_run_sweep_pool_and_resume(panels, tmp_path):
+    """The process pool and a resumed checkpoint give the serial results."""
+    close, score = panels
+    grid = parameter_grid(list(close.columns), threshold=(-0.5, 0.0, 0.5))
+    serial = run_sweep(close, score, grid, chunk_size=5)
+    pooled = run_sweep(close, score, grid, chunk_size=5, max_workers=2)
+    pd.testing.assert_frame_equal(pooled, serial)
+
+    run_sweep(close, score, grid, chunk_size=5, checkpoint_dir=tmp_path)
+    chunks = sorted(tmp_path.glob("chunk_*.npy"))
+    for path in chunks[1:]:
+        path.unlink()
+    resumed = run_sweep(close, score, grid, chunk_size=5, checkpoint_dir=tmp_path)
+    pd.testing.assert_frame_equal(resumed, serial)
+    assert len(list(tmp_path.glob("chunk_*.npy"))) == len(chunks)
+
+
+def test_run_sweep_refuses_another_checkpoint(panels, tmp_path):
+    """A checkpoint directory belongs to a single sweep."""
+    close, score = panels
+    run_sweep(close, score, checkpoint_dir=tmp_path)
+    with pytest.raises(ValueError, match="another sweep"):
+        run_sweep(close, score, chunk_size=2, checkpoint_dir=tmp_path)